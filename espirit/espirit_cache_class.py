@@ -0,0 +1,145 @@
+import numpy as np
+import os
+import json
+import shutil
+import inspect
+import hashlib
+import tempfile
+import espirit.espirit_func as espf
+import pics.operators_class as op
+"""
+on disk cache of the espirit maps, so a re-recon of the same scan (e.g. a sweep of the regularization)
+skips the calibration, the key is the sha1 of the calibration k-space (its bytes, shape and dtype)
+and of the espirit parameters (x_shape, nsingularv, hkwin_shape, padding, method, svd_method),
+threads only changes the speed and is not in the key, the key is salted with cache_version,
+increase it when a change of espirit_func changes the maps, so the old entries are not used
+
+the maps are returned read only and memory mapped, the same on a hit and on a miss, copy them to change them
+
+each entry is a directory <path>/<key> with Vim.npy and sim.npy, loaded with np.load(mmap_mode = 'r'),
+so the maps are memory mapped and not read until used, an entry is written in a temporary directory
+and renamed, so a killed process or two processes on the same key never leave a partial entry
+
+the cache is evicted least recently used (the mtime of the entry, updated on each hit)
+when the total size is over max_bytes, the default path is $MRIPY_ESPIRIT_CACHE or ~/.cache/mripy/espirit
+
+usage:
+cache = espirit_cache()
+Vim, sim = cache.espirit_2d(xcrop, x.shape, nsingularv = 150, hkwin_shape = (16,16), pad_fact = 2)
+esp = opts.espirit(Vim)
+esp = cache.espirit_maps(xcrop, x.shape, nmaps = 2, crop = 0.8)  #only the coarse maps are stored
+"""
+cache_version = 'espirit-1'
+
+class espirit_cache:
+    "this is an on disk lru cache of the espirit maps"
+    def __init__( self, path = None, max_bytes = 4 * 2 ** 30 ):
+        if path is None:
+            path = os.environ.get('MRIPY_ESPIRIT_CACHE',\
+                   os.path.join(os.path.expanduser('~'), '.cache', 'mripy', 'espirit'))
+        self.path      = path
+        self.max_bytes = max_bytes
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    # sha1 of the calibration data and of the parameters that change the maps
+    def key( self, xcrop, **params ):
+        xcrop = np.ascontiguousarray(xcrop)
+        h = hashlib.sha1(cache_version.encode())
+        h.update(json.dumps([str(xcrop.dtype), list(xcrop.shape)]).encode())
+        h.update(xcrop.view(np.uint8).reshape(-1))
+        h.update(json.dumps(params, sort_keys = True, default = str).encode())
+        return h.hexdigest()
+
+    # memory mapped Vim, sim of key, None if not cached
+    def get( self, key ):
+        entry = os.path.join(self.path, key)
+        try:
+            Vim = np.load(os.path.join(entry, 'Vim.npy'), mmap_mode = 'r')
+            sim = np.load(os.path.join(entry, 'sim.npy'), mmap_mode = 'r')
+        except (IOError, OSError, ValueError):
+            return None
+        os.utime(entry, None)#most recently used
+        return Vim, sim
+
+    def put( self, key, Vim, sim ):
+        tmp = tempfile.mkdtemp(prefix = '.tmp_', dir = self.path)
+        try:
+            np.save(os.path.join(tmp, 'Vim.npy'), Vim)
+            np.save(os.path.join(tmp, 'sim.npy'), sim)
+            os.rename(tmp, os.path.join(self.path, key))
+        except OSError:
+            #the same key was written by another process
+            shutil.rmtree(tmp, ignore_errors = True)
+        self.evict()
+        return self
+
+    # (mtime, size, path) of the entries, oldest first
+    def entries( self ):
+        res = []
+        for name in os.listdir(self.path):
+            entry = os.path.join(self.path, name)
+            if name.startswith('.tmp_') or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            res.append((os.path.getmtime(entry), size, entry))
+        return sorted(res)
+
+    def size( self ):
+        return sum(e[1] for e in self.entries())
+
+    # remove the least recently used entries until the total size is below max_bytes
+    def evict( self, max_bytes = None ):
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = self.entries()
+        total   = sum(e[1] for e in entries)
+        for mtime, size, entry in entries:
+            if total <= max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors = True)
+            total -= size
+        return self
+
+    def clear( self ):
+        return self.evict(0)
+
+    # cached func(xcrop, x_shape, **kwargs), name tells the espirit function in the key,
+    # the arguments are bound to the signature of func with its current defaults (also for functools.partial,
+    # decorated functions with __wrapped__ and keyword only arguments), so a default given or not is the
+    # same entry, and a changed default is a new key
+    def maps( self, func, name, xcrop, x_shape, **kwargs ):
+        sig   = inspect.signature(func)
+        bound = sig.bind(xcrop, x_shape, **kwargs)
+        bound.apply_defaults()
+        params = {}
+        for arg, value in list(bound.arguments.items())[2:]:#after xcrop and x_shape
+            if sig.parameters[arg].kind == inspect.Parameter.VAR_KEYWORD:
+                params.update(value)
+            else:
+                params[arg] = value
+        params.pop('threads', None)
+        key = self.key(xcrop, func = name, x_shape = list(x_shape), **params)
+        res = self.get(key)
+        if res is None:
+            Vim, sim = func(xcrop, x_shape, **kwargs)
+            res = self.put(key, Vim, sim).get(key)
+            if res is None:
+                #not written or evicted at once (larger than max_bytes), read only as a hit
+                Vim, sim = np.asarray(Vim), np.asarray(sim)
+                Vim.flags.writeable = False
+                sim.flags.writeable = False
+                res = Vim, sim
+        return res
+
+    # espirit_func.espirit_2d and espirit_3d with the same arguments
+    def espirit_2d( self, xcrop, x_shape, **kwargs ):
+        return self.maps(espf.espirit_2d, 'espirit_2d', xcrop, x_shape, **kwargs)
+
+    def espirit_3d( self, xcrop, x_shape, **kwargs ):
+        return self.maps(espf.espirit_3d, 'espirit_3d', xcrop, x_shape, **kwargs)
+
+    # espirit_func.espirit_maps, the coarse maps are cached, crop is applied on the upsampling
+    def espirit_maps( self, xcrop, x_shape, nmaps = 2, crop = 0.0, **kwargs ):
+        Vim, sim = self.maps(espf.espirit_coarse, 'espirit_coarse', xcrop, x_shape, nmaps = nmaps, **kwargs)
+        return op.espirit_maps(Vim, sim, x_shape[:xcrop.ndim - 1], crop)
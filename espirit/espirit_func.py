@@ -5,43 +5,123 @@ import pics.CS_MRI_solvers_func as solvers
 #import tvop as tv
 import utilities.utilities_func as ut
 import pics.operators_class as op
-import pics.hankel_func as hk
+import pics.hankel_class as hkc
 import utilities.utilities_class as utc
+import low_rank.svd_func as lr
 import scipy
 import numpy as np
 import scipy.signal as ss
 from signal_processing.filter_func import hamming2d, hamming3d
+from multiprocessing.pool import ThreadPool
+import multiprocessing
+
+"""
+pixelwise step of espirit, leading eigenvalue and eigenvector of v*v^H at each pixel,
+v is the (ncoil x nsingularv) image space singular vectors of the pixel, imvn[..., :, :].T
+the pixels are done in chunks of stacked arrays, chunk pixels at a time to bound the memory,
+vvH = v*v^H of a chunk is one batched matmul (ncoil x ncoil per pixel), then
+method 'eigh', batched np.linalg.eigh over the chunk, exact
+method 'power', batched power iteration on vvH for Nite iterations, starting from the column of vvH
+with the largest diagonal, cheaper for many coils, each iteration is ncoil^2 per pixel
+the chunks run in a thread pool of threads threads (numpy releases the GIL), None for cpu_count()
+the phase of the eigenvector is set so that the first coil is real and negative,
+as the per pixel svd gave, so the maps are smooth for the zero padding interpolation after espirit
+returns sim (...) the eigenvalue and Vim (..., ncoil) the eigenvector, in the dtype of imvn,
+nmaps > 1 keeps the leading nmaps eigenvectors (eigh only), sim (..., nmaps) and Vim (..., ncoil, nmaps)
+"""
+def espirit_eig( imvn, method = 'eigh', Nite = 20, chunk = 4096, threads = None, nmaps = 1 ):
+    shape  = imvn.shape[:-2]
+    nc     = imvn.shape[-1]
+    if nmaps < 1 or nmaps > nc:
+        raise ValueError("nmaps = {0}, it has to be between 1 and the number of coils {1}".format(nmaps, nc))
+    if nmaps > 1 and method != 'eigh':
+        raise ValueError("the power iteration only gives the leading map, use method = 'eigh' for nmaps > 1")
+    A      = imvn.reshape((-1,) + imvn.shape[-2:])
+    npix   = A.shape[0]
+    sim    = np.zeros((npix, nmaps), dtype = imvn.dtype)
+    Vim    = np.zeros((npix, nc, nmaps), dtype = imvn.dtype)
+
+    def run( start ):
+        a   = A[start:start + chunk]
+        vvH = np.matmul(a.transpose((0, 2, 1)), a.conj())
+        if method == 'eigh':
+            w, u = np.linalg.eigh(vvH)#ascending
+            s, u = w[:, :-nmaps-1:-1], u[:, :, :-nmaps-1:-1]
+        else:
+            idx = np.argmax(np.real(np.diagonal(vvH, axis1 = 1, axis2 = 2)), axis = 1)
+            u   = vvH[np.arange(a.shape[0]), :, idx]
+            for _ in range(Nite):
+                u = np.matmul(vvH, u[:, :, np.newaxis])[:, :, 0]
+                u = u / (np.linalg.norm(u, axis = 1, keepdims = True) + 1e-30)
+            s = np.real(np.sum(np.conj(u) * np.matmul(vvH, u[:, :, np.newaxis])[:, :, 0], axis = 1))
+            s, u = s[:, np.newaxis], u[:, :, np.newaxis]
+        #first coil real and negative
+        ph  = np.abs(u[:, :1, :])
+        u   = u * np.where(ph > 0, -np.conj(u[:, :1, :]) / np.maximum(ph, 1e-30), 1.0)
+        sim[start:start + chunk] = s
+        Vim[start:start + chunk] = u
+
+    starts = range(0, npix, chunk)
+    if threads is None:
+        threads = multiprocessing.cpu_count()
+    if threads > 1 and len(starts) > 1:
+        pool = ThreadPool(min(threads, len(starts)))
+        try:
+            pool.map(run, starts)
+        finally:
+            pool.close()
+    else:
+        for start in starts:
+            run(start)
+    if nmaps == 1:
+        return sim.reshape(shape), Vim.reshape(shape + (nc,))
+    return sim.reshape(shape + (nmaps,)), Vim.reshape(shape + (nc, nmaps))
+
+"""
+Hankel matrix of the calibration for low_rank_svd, the dense matrix for 'full'/'gram' or if it has less than
+max_dense_bytes ('auto', the dense svd is faster for a small window), else the fft LinearOperator of hop,
+Lanczos (arpack) on it keeps the memory to a few copies of the calibration data
+"""
+max_dense_bytes = 2 ** 30
+
+def _hankel_matrix( hop, svd_method ):
+    nbytes = hop.shape[0] * hop.shape[1] * np.dtype(hop.dtype).itemsize
+    if svd_method in ('full', 'gram') or (svd_method == 'auto' and nbytes <= max_dense_bytes):
+        return hop.todense()
+    return hop.aslinearoperator()
 
 """
 2d espirit
 inputs
 xcrop is 3d matrix with first two dimentions as nx,ny and third one as coil
 nsingularv = 150, number of truncated singular vectors
+svd_method, the truncated svd of the Hankel matrix in low_rank/svd_func.py, 'full'/'gram' form the matrix,
+'randomized'/'arpack' apply it with ffts (pics/hankel_class.py), 'auto' forms the matrix below max_dense_bytes (gram or full, see low_rank_svd), else arpack
 outputs
 Vim the sensitivity map
 sim the singular value map
 
 """
-def espirit_2d( xcrop, x_shape, nsingularv = 150, hkwin_shape = (16,16), pad_before_espirit = 0, pad_fact = 1 ):
+def espirit_2d( xcrop, x_shape, nsingularv = 150, hkwin_shape = (16,16), pad_before_espirit = 0, pad_fact = 1,\
+    method = 'eigh', threads = None, svd_method = 'auto' ):
     ft = op.FFT2d()#2d fft operator
     #timing = utc.timing()
     #multidimention tensor as the block hankel matrix
     #first 2 are x, y dims with rolling window size of hkwin_shape
     #last 1 is coil dimension, with stride of 1
     #timing.start()
-    h = hk.hankelnd_r(xcrop, (hkwin_shape[0], hkwin_shape[1], 1))
+    #the Hankel matrix is only formed if it is small, else applied with ffts on xcrop (memory of xcrop)
+    hop  = hkc.Hankelnd_r(xcrop, (hkwin_shape[0], hkwin_shape[1], 1))
     #timing.stop().display('Create Hankel ').start()
-    dimh = h.shape
+    dimh = hop.win_shape + hop.move_shape
     #flatten the tensor to create a matrix= [flatten(fist3 dims), flatten(last3 dims)]
     #the second dim of hmtx contain coil information, i.e. dimh[2]=1, dimh[5]=N_coils    
-    hmtx = h.reshape(( dimh[0]* dimh[1]* dimh[2], dimh[3], dimh[4], dimh[5])).\
-             reshape(( dimh[0]* dimh[1]* dimh[2], dimh[3]* dimh[4]* dimh[5]))
+    hmtx = _hankel_matrix(hop, svd_method)
     #timing.stop().display('Reshape Hankel ').start()
     #svd, could try other approaches
     # V has the coil information since the second dim of hmtx has coil data    
     #U, s, V = np.linalg.svd(hmtx, full_matrices=False)
-    U, s, V = scipy.sparse.linalg.svds(hmtx, nsingularv )   
-    #U, s, V = scipy.sparse.linalg.svds(hmtx, nsingularv )
+    U, s, V = lr.low_rank_svd(hmtx, nsingularv, method = svd_method, compute_u = False)
     #timing.stop().display('SVD ')
     #S = np.diag(s)
     #ut.plotim1(np.absolute(V[:,0:150]).T)#plot V singular vectors
@@ -74,19 +154,8 @@ def espirit_2d( xcrop, x_shape, nsingularv = 150, hkwin_shape = (16,16), pad_bef
     #plot first singular vecctor Vn[0]
     imvn = ft.backward(vn)
     #ut.plotim3(np.absolute(imvn[:,:,0,:].squeeze()))#spatial feature of V[:,1] singular vector
-    sim  = np.zeros((nx,ny), dtype = np.complex128)
-    Vim  = np.zeros((nx,ny,nc), dtype = np.complex128)
-    for ix in range(nx):
-        for iy in range(ny):
-            vpix         = imvn[ix,iy,:,:].squeeze()
-            vpix         = np.matrix(vpix).transpose()
-            vvH          = vpix.dot(vpix.getH())
-            U, s, V      = np.linalg.svd(vvH, full_matrices=False)
-            sim[ix,iy]   = s[0]
-            Vim[ix,iy,:] = V[0,:].squeeze()
-            Vim[ix,iy,:] = Vim[ix,iy,:]
-
-    Vim = np.conj(Vim)
+    #espirit, Vim eigen vector, sim eigen value, this is a pixel wise PCA on vn
+    sim, Vim = espirit_eig(imvn.astype(np.complex128, copy = False), method = method, threads = threads)
     if pad_before_espirit is 0:
         Vim = ft.backward(ut.pad2d(ft.forward(Vim),x_shape[0],x_shape[1]))
         sim = ft.backward(ut.pad2d(ft.forward(sim),x_shape[0],x_shape[1]))   
@@ -104,13 +173,15 @@ def espirit_2d( xcrop, x_shape, nsingularv = 150, hkwin_shape = (16,16), pad_bef
 inputs
 xcrop is 3d matrix with first two dimentions as nx,ny and third one as coil
 nsingularv = 150, number of truncated singular vectors
+svd_method, the truncated svd of the Hankel matrix in low_rank/svd_func.py, 'full'/'gram' form the matrix,
+'randomized'/'arpack' apply it with ffts (pics/hankel_class.py), 'auto' forms the matrix below max_dense_bytes (gram or full, see low_rank_svd), else arpack
 outputs
 Vim the sensitivity map
 sim the singular value map
 
 """
 def espirit_3d( xcrop, x_shape, nsingularv = 150, hkwin_shape = (16,16,16),\
-    pad_before_espirit = 0, pad_fact = 1 ):
+    pad_before_espirit = 0, pad_fact = 1, method = 'eigh', threads = None, svd_method = 'auto' ):
     ft = op.FFTnd((0,1,2))#3d fft operator
     timing = utc.timing()
     #multidimention tensor as the block hankel matrix
@@ -118,19 +189,17 @@ def espirit_3d( xcrop, x_shape, nsingularv = 150, hkwin_shape = (16,16,16),\
     #last 1 is coil dimension, with stride of 1    
     # output dims are : (3_hankel_dims + 1_coil_dim)_win_size + (3_hankel_dims + 1_coil_dim)_rolling_times
     timing.start()
-    h = hk.hankelnd_r(xcrop, (hkwin_shape[0], hkwin_shape[1], hkwin_shape[2], 1))
+    #the Hankel matrix is only formed if it is small, else applied with ffts on xcrop (memory of xcrop)
+    hop  = hkc.Hankelnd_r(xcrop, (hkwin_shape[0], hkwin_shape[1], hkwin_shape[2], 1))
     timing.stop().display('Create Hankel ').start()
-    dimh = h.shape
+    dimh = hop.win_shape + hop.move_shape
     #flatten the tensor to create a matrix= [flatten(fist4 dims), flatten(last4 dims)]
     #the second dim of hmtx contain coil information, i.e. dimh[3]=1, dimh[7]=N_coils
-    hmtx = h.reshape(( dimh[0]* dimh[1]* dimh[2]* dimh[3], dimh[4], dimh[5], dimh[6], dimh[7])).\
-              reshape((dimh[0]* dimh[1]* dimh[2]* dimh[3], dimh[4]* dimh[5]* dimh[6]* dimh[7]))
+    hmtx = _hankel_matrix(hop, svd_method)
     timing.stop().display('Reshape Hankel ').start()
     #svd, could try other approaches
     # V has the coil information since the second dim of hmtx has coil data
-    U, s, V = np.linalg.svd(hmtx, full_matrices=False)
-    #U, s, V = randomized_svd(hmtx, n_components=nsingularv,n_iter=5,random_state=None)
-    #U, s, V = scipy.sparse.linalg.svds(hmtx, nsingularv )
+    U, s, V = lr.low_rank_svd(hmtx, nsingularv, method = svd_method, compute_u = False)
     timing.stop().display('SVD ').start()
     #S = np.diag(s)
     #ut.plotim1(np.absolute(V[:,0:150]).T)#plot V singular vectors
@@ -165,22 +234,8 @@ def espirit_3d( xcrop, x_shape, nsingularv = 150, hkwin_shape = (16,16,16),\
     #plot first singular vecctor Vn[0]
     imvn = ft.backward(vn)
     #ut.plotim3(np.absolute(imvn[:,:,0,:].squeeze()))#spatial feature of V[:,1] singular vector
-    sim  = np.zeros((nx,ny,nz),dtype=vn.dtype)
-    Vim  = np.zeros((nx,ny,nz,nc),dtype=vn.dtype)
-    #espirit loop, Vim eigen vector, Sim eigen value, this is a pixel wise PCA on vn 
-    for ix in range(nx):
-        for iy in range(ny):
-            for iz in range (nz):
-                vpix    = imvn[ix,iy,iz,:,:].squeeze()
-                vpix    = np.matrix(vpix).transpose()
-                vvH     = vpix.dot(vpix.getH())
-                U, s, V = np.linalg.svd(vvH, full_matrices=False)
-                #s, V = numpy.linalg.eig(vvH)
-                #U, s, V = randomized_svd(vvH, n_components=2,n_iter=5,random_state=None)
-                sim[ix,iy,iz]   = s[0]
-                Vim[ix,iy,iz,:] = V[0,:].squeeze()
-
-    Vim = np.conj(Vim)    
+    #espirit, Vim eigen vector, sim eigen value, this is a pixel wise PCA on vn
+    sim, Vim = espirit_eig(imvn.astype(vn.dtype, copy = False), method = method, threads = threads)
     timing.stop().display('ESPIRIT ')
     #pad the image after espirit
     if pad_before_espirit is 0:
@@ -195,3 +250,45 @@ def espirit_3d( xcrop, x_shape, nsingularv = 150, hkwin_shape = (16,16,16),\
     Vim = np.divide(Vim, 1e-6 + Vimnorm[:,:,:,np.newaxis])
     return Vim, np.absolute(sim) #, Vim_dims_name, sim_dims_name
 
+
+"""
+multi map espirit on the coarse grid, for 2d (xcrop is nx, ny, ncoil) and 3d (nx, ny, nz, ncoil) data
+the pixelwise eigen decomposition is done at the calibration resolution, grid = min(pad_fact*xcrop.shape, x_shape),
+and keeps the leading nmaps eigenvectors and eigenvalues, the maps are not zero padded to x_shape here,
+espirit_maps gives the operator that upsamples them when it is first applied (or a slice at a time),
+so the full resolution maps are never computed pixel by pixel, and only kept in memory if used as a whole
+the other inputs are as espirit_2d/espirit_3d
+outputs
+Vim (grid, ncoil, nmaps) the eigenvectors, sim (grid, nmaps) the eigenvalues
+"""
+def espirit_coarse( xcrop, x_shape, nmaps = 2, nsingularv = 150, hkwin_shape = (16,16,16), pad_fact = 1,\
+    method = 'eigh', threads = None, svd_method = 'auto' ):
+    nd   = xcrop.ndim - 1
+    ft   = op.FFTnd(tuple(range(nd)))
+    hop  = hkc.Hankelnd_r(xcrop, tuple(hkwin_shape[:nd]) + (1,))
+    U, s, V = lr.low_rank_svd(_hankel_matrix(hop, svd_method), nsingularv, method = svd_method, compute_u = False)
+    #k-space singular vectors, moves + (nsingularv, ncoil)
+    vn   = np.moveaxis(V.reshape((V.shape[0],) + hop.move_shape), 0, -2)
+    grid = [min(pad_fact * xcrop.shape[i], x_shape[i]) for i in range(nd)]
+    if nd == 2:
+        hwin = hamming2d(*vn.shape[:2])
+    else:
+        hwin = hamming3d(*vn.shape[:3])
+    vn   = ut.padnd(np.multiply(vn, hwin[..., np.newaxis, np.newaxis]), grid)
+    imvn = ft.backward(vn)
+    sim, Vim = espirit_eig(imvn, method = method, threads = threads, nmaps = nmaps)
+    if nmaps == 1:
+        sim, Vim = sim[..., np.newaxis], Vim[..., np.newaxis]
+    return Vim, np.absolute(sim)
+
+"""
+multi map espirit operator (pics/operators_class.py espirit_maps) from espirit_coarse,
+crop zeros each map where its eigenvalue is below crop*max(sim), e.g. 0.8, the second map takes the
+signal aliased by a small fov, the image has a last axis of nmaps
+usage:
+esp  = espirit_maps(xcrop, x.shape, nmaps = 2, crop = 0.8, hkwin_shape = (6,6,6), pad_fact = 2)
+Aopt = opts.joint2operators(esp, FTm)
+"""
+def espirit_maps( xcrop, x_shape, nmaps = 2, crop = 0.0, **kwargs ):
+    Vim, sim = espirit_coarse(xcrop, x_shape, nmaps = nmaps, **kwargs)
+    return op.espirit_maps(Vim, sim, x_shape[:xcrop.ndim - 1], crop)
@@ -0,0 +1,181 @@
+from __future__ import print_function, division
+import numpy as np
+import json
+import platform
+import tracemalloc
+import multiprocessing
+from   time import time, strftime
+
+"""
+benchmark harness for the CPU fft/nufft paths
+each case is timed Reptime times after warmup calls (numba compile, fftw planning),
+and the record has the median and min wall time, throughput in samples/s
+(k-space samples for nufft, array elements for fft) and the peak memory
+allocated by numpy during one call, from tracemalloc
+the records are saved to JSON with the machine information, and a later run can be
+compared with a saved baseline to detect performance regressions when the kernels change
+
+usage:
+res = run_all(size = 'small')
+save_json(res, 'bench_new.json')
+compare_json('bench_new.json', 'bench_baseline.json', tol = 0.1)
+or from the shell
+python -m fft.benchmark_func --size small --out bench_new.json --baseline bench_baseline.json
+"""
+
+#representative MRI sizes, (image size, number of k-space samples)
+_sizes = {
+    'small': {'1d': (256, 20000),  '2d': (128, 128, 50000),   '3d': (32, 32, 32, 100000),
+              'fft2d': (256, 256, 8), 'fft3d': (64, 64, 64, 8)},
+    'full':  {'1d': (512, 200000), '2d': (256, 256, 256*402), '3d': (128, 128, 128, 2000000),
+              'fft2d': (256, 256, 32), 'fft3d': (128, 128, 128, 16)},
+}
+
+# time func() and measure its peak memory, nitems is the number of samples processed per call
+def bench( name, func, nitems, Reptime=5, warmup=1, **info ):
+    for i in range(warmup):
+        func()
+    times = []
+    for i in range(Reptime):
+        t0 = time()
+        func()
+        times.append(time() - t0)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rec = {'name': name, 'median_s': float(np.median(times)), 'min_s': float(np.min(times)),\
+           'samples_per_s': float(nitems / np.median(times)), 'peak_mem_MB': peak / 2.0 ** 20,\
+           'nitems': int(nitems), 'Reptime': Reptime}
+    rec.update(info)
+    print("{0:<40s} {1:10.4g} s {2:12.4g} samples/s {3:10.4g} MB".format(\
+          name, rec['median_s'], rec['samples_per_s'], rec['peak_mem_MB']))
+    return rec
+
+"""
+nufft 1d/2d/3d type 1, type 2 and type 2&1 (AHA) from nufft_func, and the 2d/3d nufft plan
+"""
+def run_nufft_benchmarks( size='small', eps=1E-6, Reptime=5 ):
+    import nufft_func as nft
+    import nufft_class
+    rng = np.random.RandomState(0)
+    res = []
+    #1d
+    ms, mc = _sizes[size]['1d']
+    x  = np.pi * (2 * rng.rand(mc) - 1)
+    c  = rng.randn(mc) + 1j * rng.randn(mc)
+    Fk = rng.randn(ms) + 1j * rng.randn(ms)
+    res.append(bench('nufft1d1_gaussker', lambda: nft.nufft1d1_gaussker(x, c, ms, eps = eps), mc, Reptime, ms = ms))
+    res.append(bench('nufft1d2_gaussker', lambda: nft.nufft1d2_gaussker(x, Fk, ms, eps = eps), mc, Reptime, ms = ms))
+    res.append(bench('nufft1d21_gaussker', lambda: nft.nufft1d21_gaussker(x, Fk, ms, eps = eps), mc, Reptime, ms = ms))
+    #2d
+    ms, mt, mc = _sizes[size]['2d']
+    x  = np.pi * (2 * rng.rand(mc) - 1)
+    y  = np.pi * (2 * rng.rand(mc) - 1)
+    c  = rng.randn(mc) + 1j * rng.randn(mc)
+    Fk = rng.randn(ms, mt) + 1j * rng.randn(ms, mt)
+    info = {'ms': ms, 'mt': mt}
+    res.append(bench('nufft2d1_gaussker', lambda: nft.nufft2d1_gaussker(x, y, c, ms, mt, eps = eps), mc, Reptime, **info))
+    res.append(bench('nufft2d2_gaussker', lambda: nft.nufft2d2_gaussker(x, y, Fk, ms, mt, eps = eps), mc, Reptime, **info))
+    res.append(bench('nufft2d21_gaussker', lambda: nft.nufft2d21_gaussker(x, y, Fk, ms, mt, eps = eps), mc, Reptime, **info))
+    for kernel, upsampfac in (('gauss', 2.0), ('kb', 1.25), ('kb', 2.0)):
+        nft_opt = nufft_class.NUFFT2d(x, y, ms, mt, eps = eps, kernel = kernel, upsampfac = upsampfac)
+        tag = 'NUFFT2d_{0}{1}'.format(kernel, upsampfac)
+        res.append(bench(tag + '.backward', lambda: nft_opt.backward(c), mc, Reptime, **info))
+        res.append(bench(tag + '.forward', lambda: nft_opt.forward(Fk), mc, Reptime, **info))
+        res.append(bench(tag + '.normal', lambda: nft_opt.normal(Fk), mc, Reptime, **info))
+    #3d
+    ms, mt, mu, mc = _sizes[size]['3d']
+    x  = np.pi * (2 * rng.rand(mc) - 1)
+    y  = np.pi * (2 * rng.rand(mc) - 1)
+    z  = np.pi * (2 * rng.rand(mc) - 1)
+    c  = rng.randn(mc) + 1j * rng.randn(mc)
+    Fk = rng.randn(ms, mt, mu) + 1j * rng.randn(ms, mt, mu)
+    info = {'ms': ms, 'mt': mt, 'mu': mu}
+    res.append(bench('nufft3d1_gaussker', lambda: nft.nufft3d1_gaussker(x, y, z, c, ms, mt, mu, eps = eps), mc, Reptime, **info))
+    res.append(bench('nufft3d2_gaussker', lambda: nft.nufft3d2_gaussker(x, y, z, Fk, ms, mt, mu, eps = eps), mc, Reptime, **info))
+    res.append(bench('nufft3d21_gaussker', lambda: nft.nufft3d21_gaussker(x, y, z, Fk, ms, mt, mu, eps = eps), mc, Reptime, **info))
+    for kernel, upsampfac in (('gauss', 2.0), ('kb', 1.25)):
+        nft_opt = nufft_class.NUFFT3d(x, y, z, ms, mt, mu, eps = eps, kernel = kernel, upsampfac = upsampfac)
+        tag = 'NUFFT3d_{0}{1}'.format(kernel, upsampfac)
+        res.append(bench(tag + '.backward', lambda: nft_opt.backward(c), mc, Reptime, **info))
+        res.append(bench(tag + '.forward', lambda: nft_opt.forward(Fk), mc, Reptime, **info))
+    return res
+
+"""
+centered fft operators, numpy fft vs fftw with different number of threads
+"""
+def run_fft_benchmarks( size='small', threads_list=None, Reptime=5 ):
+    import fft.fftw_func as fftw
+    from pics.operators_class import FFT2d_kmask, FFTW2d_kmask, FFTnd_kmask, FFTWnd_kmask
+    if threads_list is None:
+        threads_list = sorted(set([1, 2, 4, multiprocessing.cpu_count()]))
+    rng = np.random.RandomState(0)
+    res = []
+    for key, numpy_opt, fftw_opt in (('fft2d', FFT2d_kmask, FFTW2d_kmask), ('fft3d', FFTnd_kmask, FFTWnd_kmask)):
+        shape = _sizes[size][key]
+        im    = rng.randn(*shape) + 1j * rng.randn(*shape)
+        mask  = rng.rand(*shape[:-1]) > 0.5
+        n     = im.size
+        Aopt  = numpy_opt(mask)
+        res.append(bench('numpy_{0}.forward'.format(key), lambda: Aopt.forward(im), n, Reptime, shape = shape))
+        res.append(bench('numpy_{0}.backward'.format(key), lambda: Aopt.backward(im), n, Reptime, shape = shape))
+        for threads in threads_list:
+            Aopt = fftw_opt(mask, threads = threads)
+            res.append(bench('fftw_{0}_t{1}.forward'.format(key, threads), lambda: Aopt.forward(im), n, Reptime,\
+                             shape = shape, threads = threads))
+            res.append(bench('fftw_{0}_t{1}.backward'.format(key, threads), lambda: Aopt.backward(im), n, Reptime,\
+                             shape = shape, threads = threads))
+    return res
+
+def run_all( size='small', Reptime=5 ):
+    return run_fft_benchmarks(size, Reptime = Reptime) + run_nufft_benchmarks(size, Reptime = Reptime)
+
+#save the records with the machine information
+def save_json( results, filename ):
+    data = {'date': strftime('%Y-%m-%d %H:%M:%S'), 'machine': platform.machine(),\
+            'processor': platform.processor(), 'python': platform.python_version(),\
+            'numpy': np.__version__, 'cpu_count': multiprocessing.cpu_count(), 'results': results}
+    with open(filename, 'w') as f:
+        json.dump(data, f, indent = 1)
+    return data
+
+def load_json( filename ):
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+"""
+compare two benchmark files, a case is a regression if its median time increased by more than tol,
+e.g. tol = 0.1 is 10% slower than the baseline, the regressions are printed and returned
+"""
+def compare_json( new_file, baseline_file, tol=0.1 ):
+    new  = dict((r['name'], r) for r in load_json(new_file)['results'])
+    base = dict((r['name'], r) for r in load_json(baseline_file)['results'])
+    regressions = []
+    for name in sorted(new):
+        if name not in base:
+            continue
+        ratio = new[name]['median_s'] / base[name]['median_s']
+        flag  = ''
+        if ratio > 1.0 + tol:
+            flag = 'REGRESSION'
+            regressions.append((name, ratio))
+        print("{0:<40s} {1:8.3f}x {2}".format(name, ratio, flag))
+    return regressions
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description = 'benchmark the CPU fft/nufft paths')
+    parser.add_argument('--size', default = 'small', choices = sorted(_sizes))
+    parser.add_argument('--Reptime', type = int, default = 5)
+    parser.add_argument('--out', default = 'bench.json')
+    parser.add_argument('--baseline', default = None)
+    parser.add_argument('--tol', type = float, default = 0.1)
+    args = parser.parse_args()
+    save_json(run_all(args.size, args.Reptime), args.out)
+    if args.baseline is not None:
+        if len(compare_json(args.out, args.baseline, args.tol)) > 0:
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,64 +1,173 @@
 import numpy as np
 import pyfftw
+import collections
+import pickle
+import threading
+from utilities.utilities_func import complex_dtype
 #import affinity
 import multiprocessing
  
 #affinity.set_process_affinity_mask(0,2**multiprocessing.cpu_count()-1)
 
 pyfftw.interfaces.cache.enable()
+"""
+the buffers follow the precision of data, complex64 for float32/complex64 data (single precision fftw),
+complex128 otherwise, so that a complex64 recon stays in complex64
+
+plan cache
+the pyfftw.FFTW objects and their aligned input/output buffers are kept in a cache keyed on
+(shape, dtype, axes, direction, threads, planner effort), so the iterations of a recon, e.g. FFTW2d_kmask in
+every ADMM step, only copy the data in and out instead of allocating and planning each time
+the cache keeps the last _plan_cache_size plans, least recently used ones are dropped
+
+the functions are thread safe, the key also has the id of the calling thread, so threads (e.g. the thread pools
+of alg_class.recon or espirit_func) each get their own plan and buffers and transform in parallel,
+the cache lookup, eviction and the planning (the fftw planner is not thread safe) are done under _plan_lock
+
+planner effort is FFTW_ESTIMATE by default, set_planner_effort('FFTW_MEASURE') or 'FFTW_PATIENT'
+gives faster transforms for a one time planning cost, which can be kept across restarts with
+save_wisdom()/load_wisdom()
+usage:
+load_wisdom('fftw_wisdom.pkl')  #if it exists
+set_planner_effort('FFTW_MEASURE')
+ksp = fftw2d(im, threads = 8)
+save_wisdom('fftw_wisdom.pkl')
+"""
+_plan_cache      = collections.OrderedDict()
+_plan_cache_size = 32
+_planner_effort  = 'FFTW_ESTIMATE'
+_plan_lock       = threading.Lock()
+
+def set_planner_effort( effort ):
+    global _planner_effort
+    if effort not in ('FFTW_ESTIMATE', 'FFTW_MEASURE', 'FFTW_PATIENT', 'FFTW_EXHAUSTIVE'):
+        raise ValueError("unknown fftw planner effort {0}".format(effort))
+    _planner_effort = effort
+
+def get_planner_effort():
+    return _planner_effort
+
+#cached fftw plan of the calling thread, the input data is copied to plan.input_array, the result is plan.output_array
+def get_plan( shape, dtype, axes, direction = 'FFTW_FORWARD', threads = 1 ):
+    key = (tuple(shape), np.dtype(dtype).str, tuple(axes), direction, threads, _planner_effort,\
+           threading.current_thread().ident)
+    with _plan_lock:
+        if key in _plan_cache:
+            plan = _plan_cache.pop(key) #move to the most recently used end
+            _plan_cache[key] = plan
+            return plan
+        a = pyfftw.empty_aligned(shape, dtype = dtype)
+        b = pyfftw.empty_aligned(shape, dtype = dtype)
+        plan = pyfftw.FFTW(a, b, axes = axes, direction = direction, flags = (_planner_effort,), threads = threads)
+        _plan_cache[key] = plan
+        while len(_plan_cache) > _plan_cache_size:
+            _plan_cache.popitem(last = False)
+    return plan
+
+def clear_plan_cache():
+    with _plan_lock:
+        _plan_cache.clear()
+
+#save/load the fftw wisdom, planning results of all precisions, to/from file
+def save_wisdom( filename ):
+    with _plan_lock:
+        wisdom = pyfftw.export_wisdom()
+    with open(filename, 'wb') as f:
+        pickle.dump(wisdom, f)
+
+def load_wisdom( filename ):
+    with open(filename, 'rb') as f:
+        wisdom = pickle.load(f)
+    with _plan_lock:
+        return pyfftw.import_wisdom(wisdom)
+
+#run the cached plan on data, the output is copied out since the buffer is reused by the next call
+def _execute( data, axes, direction, threads ):
+    plan = get_plan(data.shape, complex_dtype(data.dtype), axes, direction, threads)
+    plan.input_array[...] = data
+    return plan().copy()
+
 # fft21e
 def fftw1d( data, axes = (0,), threads = 1 ):
-    nx = data.shape[0]
-    a = pyfftw.empty_aligned(nx, dtype='complex128')
-    b = pyfftw.empty_aligned(nx, dtype='complex128')
-
-    fft_object = pyfftw.FFTW(a, b, axes = axes, threads=num_core)
-    a[:] = data
-    iftdata = fft_object()
-    return iftdata
+    return _execute(data, axes, 'FFTW_FORWARD', threads)
 
 def ifftw1d( data, axes = (0,), threads = 1 ):
-    nx = data.shape[0]
-    b = pyfftw.empty_aligned(nx, dtype='complex128')
-    c = pyfftw.empty_aligned(nx, dtype='complex128')
-
-    ifft_object = pyfftw.FFTW(b, c, axes=axes, direction='FFTW_BACKWARD', threads=threads)
-    b[:] = data
-    return ifft_object()
+    return _execute(data, axes, 'FFTW_BACKWARD', threads)
 
 def fftw2d( data, axes = (0,1), threads = 1):
-    a = pyfftw.empty_aligned(data.shape, dtype='complex128')
-    b = pyfftw.empty_aligned(data.shape, dtype='complex128')
-
-    fft_object = pyfftw.FFTW(a, b, axes=axes, threads=threads)
-    a[:] = data
-    iftdata = fft_object()
-    return iftdata
+    return _execute(data, axes, 'FFTW_FORWARD', threads)
 
 def ifftw2d( data, axes = (0,1), threads = 1 ):
-    b = pyfftw.empty_aligned(data.shape, dtype='complex128')
-    c = pyfftw.empty_aligned(data.shape, dtype='complex128')
-
-    ifft_object = pyfftw.FFTW(b, c, axes=axes, direction='FFTW_BACKWARD', threads=threads)
-    b[:] = data
-    return ifft_object()
+    return _execute(data, axes, 'FFTW_BACKWARD', threads)
 
 def fftwnd( data, axes = (0,1,2), threads = 1 ):
-    a = pyfftw.empty_aligned(data.shape, dtype='complex128')
-    b = pyfftw.empty_aligned(data.shape, dtype='complex128')
-
-    fft_object = pyfftw.FFTW(a, b, axes=axes, threads=threads)
-    a[:] = data
-    iftdata = fft_object()
-    return iftdata
+    return _execute(data, axes, 'FFTW_FORWARD', threads)
 
 def ifftwnd( data, axes = (0,1,2), threads = 1):
-    b = pyfftw.empty_aligned(data.shape, dtype='complex128')
-    c = pyfftw.empty_aligned(data.shape, dtype='complex128')
-
-    ifft_object = pyfftw.FFTW(b, c, axes=axes, direction='FFTW_BACKWARD', threads=threads)
-    b[:] = data
-    return ifft_object()
+    return _execute(data, axes, 'FFTW_BACKWARD', threads)
+
+"""
+centered fft without fftshift/ifftshift
+ifftshift(fft(fftshift(x))) along an axis of size n, with s = n//2, is
+Y[k] = exp(-2*pi*i*(k+s)*s/n) * FFT(x[j] * exp(-2*pi*i*s*j/n))[k]
+i.e. a phase modulation before and after a plain fft, for even n both are +/-1 checkerboards,
+the inverse, ifftshift(ifft(fftshift(X))), uses the conjugate phases
+centered_phase() returns (pre, post), the product over the axes, broadcastable to shape,
+computed once for each (shape, axes, dtype, inverse) and cached, real valued if all the sizes are even
+"""
+_phase_cache = {}
+
+def centered_phase( shape, axes, dtype = np.complex128, inverse = False ):
+    key = (tuple(shape), tuple(axes), np.dtype(dtype).str, inverse)
+    if key in _phase_cache:
+        return _phase_cache[key]
+    sign = 1.0 if inverse else -1.0
+    pre  = np.ones((1,) * len(shape), dtype = np.complex128)
+    post = np.ones((1,) * len(shape), dtype = np.complex128)
+    for ax in axes:
+        n = shape[ax]
+        s = n // 2
+        j = np.arange(n)
+        vshape = [1] * len(shape)
+        vshape[ax] = n
+        if n % 2 == 0:
+            #checkerboard, exp(-i*pi*j) and exp(-i*pi*(j+s)), exact +/-1
+            vpre  = 1.0 - 2.0 * (j % 2)
+            vpost = 1.0 - 2.0 * ((j + s) % 2)
+        else:
+            vpre  = np.exp(sign * 2j * np.pi * ((s * j) % n) / n)
+            vpost = np.exp(sign * 2j * np.pi * (((j + s) * s) % n) / n)
+        pre  = pre * vpre.reshape(vshape)
+        post = post * vpost.reshape(vshape)
+    if all(shape[ax] % 2 == 0 for ax in axes):
+        #real +/-1, a cheaper complex x real multiply
+        dtype = np.zeros((), dtype = dtype).real.dtype
+        pre, post = pre.real, post.real
+    _phase_cache[key] = (pre.astype(dtype), post.astype(dtype))
+    return _phase_cache[key]
+
+#centered fft with the cached plan, one pass in (x*pre), the fft, one pass out (*post), no temporaries
+#post can also include the k-space mask, out is the optional output array
+def fftw_centered( data, pre, post, axes, direction = 'FFTW_FORWARD', threads = 1, out = None ):
+    plan = get_plan(data.shape, complex_dtype(data.dtype), axes, direction, threads)
+    np.multiply(data, pre, out = plan.input_array)
+    plan()
+    if out is None:
+        out = np.empty(data.shape, dtype = plan.output_array.dtype)
+    return np.multiply(plan.output_array, post, out = out)
+
+#normal operator ifft(mid*fft(data*pre))*post, the forward fft writes directly into the input of the backward plan
+#mid has the phase after the fft, the phase before the ifft, and the mask and scaling between them
+def fftw_centered_normal( data, pre, mid, post, axes, threads = 1, out = None ):
+    fplan = get_plan(data.shape, complex_dtype(data.dtype), axes, 'FFTW_FORWARD', threads)
+    bplan = get_plan(data.shape, complex_dtype(data.dtype), axes, 'FFTW_BACKWARD', threads)
+    np.multiply(data, pre, out = fplan.input_array)
+    fplan()
+    np.multiply(fplan.output_array, mid, out = bplan.input_array)
+    bplan()
+    if out is None:
+        out = np.empty(data.shape, dtype = bplan.output_array.dtype)
+    return np.multiply(bplan.output_array, post, out = out)
 
 def test1():
     #print('fftw1d')
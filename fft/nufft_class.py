@@ -0,0 +1,254 @@
+from __future__ import print_function, division
+import numpy as np
+import numba
+import pyfftw
+import nufft_func as nft
+
+"""
+nufft plan for iterative MRI recon
+
+the trajectory never changes across the iterations of a CS recon, so that the
+grid parameters, neighbor indices and gaussian weights of each k-space sample,
+the deconvolution arrays and the oversampled grid are computed once here,
+each call then costs spread + FFT + interpolation only
+
+the order is the same as the FFT operators in pics/operators_class.py
+image -> k-space samples is forward, nufft type 2
+k-space samples -> image is backward, nufft type 1, with 1/nsamples scaling as nufft2d1_gaussker()
+so that backward(forward(x)) is the normal operator A^H A up to the 1/nsamples scaling
+
+all coils/echoes are processed together, c is nsamples X (coils, echoes...) and im is im_shape X (coils, echoes...),
+each gridding weight is applied to all channels in the inner loop and the fft is one batched pyfftw plan
+over the first ndim axes, the plans and grid buffers are made once for each number of channels
+
+backend = 'numba' spreads/interpolates with the parallel numba kernels in nufft_func.py,
+the samples are sorted once by spatial tiles so that each thread spreads into its own subgrid,
+ntiles is the target number of tiles, default 4 X numba threads
+backend = 'sparse' assembles the gridding once as a csr interpolation matrix G (see build_interp_matrix()),
+type 1 is then G^T * c and type 2 is G * ftau, with all coils/echoes stacked as columns,
+this trades memory, (2*nspread)^ndim nonzeros per sample, for scipy's sparse matrix-matrix product
+
+toeplitz = True, A^H A is a convolution with the point spread function h(d) = 1/nsamples * sum_j w_j exp(i*d*x_j),
+h is computed once on a 2x grid (one type 1 nufft of the density weights w), embedded in a circulant
+and its fft is stored, normal() is then zero pad + fftn + pointwise multiply + ifftn + crop,
+no gridding inside the iterations, e.g. the x-update in prox_l2_Afxnb_CGD()
+weights are optional density compensation weights, normal() is backward(weights * forward(x)) in both modes
+
+kernel = 'gauss' is the Dutt & Rokhlin gaussian with oversampling ratio 2 or 3 as nufft2d1_gaussker()
+kernel = 'kb' is the kaiser-bessel kernel with oversampling ratio upsampfac (1.25, 1.5 or 2.0),
+the kernel width is chosen from eps by nufft_func._kbker_width_table, for 1e-3 to 1e-6
+the grid and the number of neighbors are several-fold smaller than the gaussian
+
+dtype = np.complex64 runs the weights, grid, pyfftw plans and outputs in single precision,
+half the memory and bandwidth of complex128, the accuracy envelope (relative l2 error of 2d type 1
+against nudft2d1, 20000 samples) is the same as complex128 down to eps = 1e-6 for the gaussian
+and kb with upsampfac = 2.0, which flatten at ~1e-6 in complex64,
+kb with upsampfac = 1.25 has a larger deconvolution range and flattens at ~1e-4,
+so eps below 1e-6 (or 1e-4 for upsampfac = 1.25) only costs time in complex64
+
+usage:
+nft_opt = NUFFT2d(x, y, ms, mt, eps = 1E-6)
+nft_opt = NUFFT2d(x, y, ms, mt, eps = 1E-6, backend = 'sparse')
+nft_opt = NUFFT2d(x, y, ms, mt, eps = 1E-6, toeplitz = True)
+nft_opt = NUFFT2d(x, y, ms, mt, eps = 1E-4, kernel = 'kb', upsampfac = 1.25)
+c  = nft_opt.forward(im)
+im = nft_opt.backward(c)
+"""
+class NUFFTnd:
+    "this is ndim NUFFT plan, 2d or 3d, with precomputed gridding for CS MRI recon"
+    def __init__( self, traj, im_shape, df=1.0, eps=1E-15, iflag=1, backend='numba',\
+                  toeplitz=False, weights=None, kernel='gauss', upsampfac=2.0, ntiles=None, threads=None,\
+                  dtype=np.complex128 ):
+        if backend not in ('numba', 'sparse'):
+            raise ValueError("backend should be 'numba' or 'sparse', got {0}".format(backend))
+        if kernel not in ('gauss', 'kb'):
+            raise ValueError("kernel should be 'gauss' or 'kb', got {0}".format(kernel))
+        self.backend   = backend
+        self.dtype     = np.dtype(dtype)
+        self.rdtype    = np.zeros((), dtype = self.dtype).real.dtype
+        self.kernel    = kernel
+        self.upsampfac = upsampfac
+        self.ndim      = len(im_shape)
+        self.im_shape  = tuple(im_shape)
+        self.iflag     = iflag
+        self.nsamples  = traj[0].shape[0]
+        if self.ndim not in (2, 3):
+            raise ValueError("NUFFTnd supports 2d or 3d, got ndim = {0}".format(self.ndim))
+        #neighbor indices and kernel weights along each axis, dim is nsamples X 2*nspread
+        self.idx = []
+        self.w   = []
+        #deconvolution G(k)^-1, with the fft and 1/nsamples scalings absorbed below
+        deconv = np.ones(())
+        if kernel == 'gauss':
+            if self.ndim == 2:
+                nspread, nf1, nf2, tau = nft._compute_2d_grid_params(im_shape[0], im_shape[1], eps)
+                self.grid_shape = (nf1, nf2)
+            else:
+                nspread, nf1, nf2, nf3, tau = nft._compute_3d_grid_params(im_shape[0], im_shape[1], im_shape[2], eps)
+                self.grid_shape = (nf1, nf2, nf3)
+            self.tau = tau
+            for d in range(self.ndim):
+                idx, w = nft._compute_1d_gaussker_weights(traj[d] * df, self.grid_shape[d], tau, nspread)
+                self.idx.append(idx)
+                self.w.append(w)
+                deconv = np.multiply.outer(deconv, nft._compute_1d_gaussker_deconv(self.im_shape[d], tau))
+        else:
+            grid_shape = []
+            for d in range(self.ndim):
+                nspread, nf, width, beta = nft._compute_1d_kbker_params(self.im_shape[d], eps, upsampfac)
+                idx, w = nft._compute_1d_kbker_weights(traj[d] * df, nf, width, beta, nspread)
+                self.idx.append(idx)
+                self.w.append(w)
+                deconv = np.multiply.outer(deconv, nft._compute_1d_kbker_deconv(self.im_shape[d], nf, width, beta))
+                grid_shape.append(nf)
+            self.grid_shape = tuple(grid_shape)
+            self.width      = width
+            self.beta       = beta
+        self.nspread = nspread
+        #weights in the working precision
+        self.w       = [w.astype(self.rdtype) for w in self.w]
+        #indices to truncate the oversampled grid to the image, or to zero pad the image
+        self.kidx = np.ix_(*[np.arange(-(m // 2), m - (m // 2)) % nf \
+                            for m, nf in zip(self.im_shape, self.grid_shape)])
+        ngrid = np.prod(self.grid_shape)
+        if iflag < 0:
+            self.deconv1 = deconv / (self.nsamples * ngrid) #type 1, fftn
+            self.deconv2 = deconv                           #type 2, ifftn
+        else:
+            self.deconv1 = deconv / self.nsamples           #type 1, ifftn
+            self.deconv2 = deconv / ngrid                   #type 2, fftn
+        self.deconv1 = self.deconv1.astype(self.rdtype)
+        self.deconv2 = self.deconv2.astype(self.rdtype)
+        #threads for the batched pyfftw plans, work buffers and plans are made per batch size
+        if threads is None:
+            threads = numba.config.NUMBA_NUM_THREADS
+        self.threads  = threads
+        self.buffers  = {}
+        #tiles for the parallel spreading, idx and w are sorted by tiles once here
+        if backend == 'numba':
+            if ntiles is None:
+                ntiles = 4 * numba.config.NUMBA_NUM_THREADS
+            self.order, self.tile_ptr, self.start1, self.start2, self.sub_shape = \
+                nft._compute_tiles(self.idx, self.grid_shape, nspread, ntiles)
+            self.idx = [idx[self.order] for idx in self.idx]
+            self.w   = [w[self.order] for w in self.w]
+        #csr interpolation matrix, and its transpose (csc, no copy) for spreading
+        if backend == 'sparse':
+            self.G  = nft.build_interp_matrix(self.idx, self.w, self.grid_shape)
+            self.GT = self.G.T
+        #density weights and the toeplitz kernel for normal()
+        self.weights  = weights
+        self.toeplitz = toeplitz
+        if toeplitz:
+            self.psf_shape  = tuple(2 * m for m in self.im_shape)
+            self.psf_kernel = self._toeplitz_kernel(traj, df, eps)
+
+    #fft of the circulant embedded point spread function, dim is 2*im_shape
+    def _toeplitz_kernel( self, traj, df, eps ):
+        if self.weights is None:
+            w = np.ones(self.nsamples, dtype = np.complex128)
+        else:
+            w = self.weights.astype(np.complex128)
+        #h(d) for d = -m, ..., m-1 on each axis, from a type 1 nufft on the 2x grid
+        psf_opt = NUFFTnd(traj, self.psf_shape, df, eps, self.iflag, self.backend,\
+                          kernel = self.kernel, upsampfac = self.upsampfac, threads = self.threads)
+        h = psf_opt.backward(w)
+        #move d = 0 to index 0, then h(d) is at index d mod 2m as in a circulant matrix
+        return np.fft.fftn(np.fft.ifftshift(h)).astype(self.dtype)
+
+    #oversampled grid, dim is grid_shape X nb, subgrids of the tiles, and in-place pyfftw plans
+    #over the first ndim axes, one batched fft for all the channels
+    def _get_buffers( self, nb ):
+        if nb not in self.buffers:
+            ftau = pyfftw.empty_aligned(self.grid_shape + (nb,), dtype = self.dtype)
+            axes = tuple(range(self.ndim))
+            dir1 = 'FFTW_FORWARD' if self.iflag < 0 else 'FFTW_BACKWARD'
+            dir2 = 'FFTW_BACKWARD' if self.iflag < 0 else 'FFTW_FORWARD'
+            fft1 = pyfftw.FFTW(ftau, ftau, axes = axes, direction = dir1, threads = self.threads)
+            fft2 = pyfftw.FFTW(ftau, ftau, axes = axes, direction = dir2, threads = self.threads)
+            sub  = None
+            if self.backend == 'numba':
+                sub = np.zeros(self.sub_shape + (nb,), dtype = self.dtype)
+            self.buffers[nb] = (ftau, sub, fft1, fft2)
+        return self.buffers[nb]
+
+    def _spread( self, c, sub, ftau ):
+        if self.ndim == 2:
+            return nft.build_grid_2d1_tiled(c, self.order, self.tile_ptr, self.start1, self.start2,\
+                                            self.idx[0], self.w[0], self.idx[1], self.w[1], sub, ftau)
+        return nft.build_grid_3d1_tiled(c, self.order, self.tile_ptr, self.start1, self.start2,\
+                                        self.idx[0], self.w[0], self.idx[1], self.w[1],\
+                                        self.idx[2], self.w[2], sub, ftau)
+
+    def _interp( self, fntau, c ):
+        if self.ndim == 2:
+            return nft.build_grid_2d2_par(fntau, self.order, self.idx[0], self.w[0], self.idx[1], self.w[1], c)
+        return nft.build_grid_3d2_par(fntau, self.order, self.idx[0], self.w[0], self.idx[1], self.w[1],\
+                                      self.idx[2], self.w[2], c)
+
+    #type 1 for stacked c, dim is nsamples X nb, output dim is im_shape X nb
+    def _type1( self, c ):
+        ftau, sub, fft1, fft2 = self._get_buffers(c.shape[1])
+        if self.backend == 'sparse':
+            ftau[...] = self.GT.dot(c).reshape(ftau.shape)
+        else:
+            ftau.fill(0)
+            self._spread(c, sub, ftau)
+        fft1()
+        return np.multiply(ftau[self.kidx], self.deconv1[..., np.newaxis])
+
+    #type 2 for stacked Fk, dim is im_shape X nb, output dim is nsamples X nb
+    def _type2( self, Fk ):
+        ftau, sub, fft1, fft2 = self._get_buffers(Fk.shape[-1])
+        ftau.fill(0)
+        ftau[self.kidx] = np.multiply(Fk, self.deconv2[..., np.newaxis])
+        fft2()
+        if self.backend == 'sparse':
+            return self.G.dot(ftau.reshape((-1, Fk.shape[-1])))
+        return self._interp(ftau, np.zeros((self.nsamples, Fk.shape[-1]), dtype = self.dtype))
+
+    # let's call k-space <- image as forward, im dim is im_shape + extra dims, e.g. coils, echoes
+    def forward( self, im ):
+        bshape = im.shape[self.ndim:]
+        im     = im.reshape(self.im_shape + (-1,))
+        return self._type2(im).reshape((self.nsamples,) + bshape)
+
+    # let's call image <- k-space as backward, c dim is nsamples + extra dims
+    def backward( self, c ):
+        bshape = c.shape[1:]
+        c      = np.ascontiguousarray(c.reshape((self.nsamples, -1)), dtype = self.dtype)
+        return self._type1(c).reshape(self.im_shape + bshape)
+
+    # normal operator, image -> k-space -> image
+    def normal( self, im ):
+        if self.toeplitz:
+            return self._normal_toeplitz(im)
+        c = self.forward(im)
+        if self.weights is not None:
+            c = np.multiply(self.weights.reshape((-1,) + (1,) * (c.ndim - 1)), c)
+        return self.backward(c)
+
+    # A^H A x as the linear convolution of x with h, by circulant embedding on the 2x grid
+    def _normal_toeplitz( self, im ):
+        bshape = im.shape[self.ndim:]
+        im     = im.reshape(self.im_shape + (-1,))
+        axes   = tuple(range(self.ndim))
+        crop   = tuple(slice(0, m) for m in self.im_shape)
+        xpad   = np.zeros(self.psf_shape + (im.shape[-1],), dtype = self.dtype)
+        xpad[crop] = im
+        xpad   = np.fft.fftn(xpad, axes = axes)
+        xpad  *= self.psf_kernel[..., np.newaxis]
+        xpad   = np.fft.ifftn(xpad, axes = axes)
+        return xpad[crop].astype(self.dtype, copy = False).reshape(self.im_shape + bshape)
+
+#2d nufft plan, x, y are the k-space trajectory, (ms, mt) is the image size
+class NUFFT2d(NUFFTnd):
+    "this is 2d NUFFT plan for CS MRI recon"
+    def __init__( self, x, y, ms, mt, df=1.0, eps=1E-15, iflag=1, **kwargs ):
+        NUFFTnd.__init__(self, (x, y), (ms, mt), df, eps, iflag, **kwargs)
+
+#3d nufft plan, x, y, z are the k-space trajectory, (ms, mt, mu) is the image size
+class NUFFT3d(NUFFTnd):
+    "this is 3d NUFFT plan for CS MRI recon"
+    def __init__( self, x, y, z, ms, mt, mu, df=1.0, eps=1E-15, iflag=1, **kwargs ):
+        NUFFTnd.__init__(self, (x, y, z), (ms, mt, mu), df, eps, iflag, **kwargs)
@@ -1,6 +1,7 @@
 from __future__ import print_function, division
 import numpy as np
 import numba
+import scipy.sparse
 import utilities.utilities_func as ut
 import matplotlib.pyplot as plt
 import nufft_test_func
@@ -1012,7 +1013,7 @@ def build_grid_3d21( x, y, z, fntau, tau, nspread ):
                     c += fntau[(m1 + mm1) % nf1, (m2 + mm2) % nf2, (m3 + mm3) % nf3]\
                          * Em[mm1 + nspread, mm2 + nspread, mm3 + nspread]
         #grid again
-        c = c/(nf1*nf2*nf3)
+        c *= 1.0/(nf1*nf2*nf3)
         for mm1 in range(-nspread, nspread): #mm index for all the spreading points
             for mm2 in range(-nspread,nspread):
                 for mm3 in range(-nspread,nspread):
@@ -1049,10 +1050,12 @@ def build_grid_3d21_sensker( x, y, z, fntau, tau, nspread, sens_ker = None ):
     fntau         = fntau.reshape(outftaushape)# [nf1, nf2, nf3, 1, a, b, c] or [nf1, nf2, nf3, 1] if 3d data
     ftau          = ftau.reshape(outftaushape) # [nf1, nf2, nf3, 1, a, b, c] or [nf1, nf2, nf3, 1] if 3d data
     sens_ker      = sens_ker.reshape(outsenskshape) #[nk, nk, nk, nc, 1, 1, 1] or [nk, nk, nk, nc] nk = 2*nspread + 1
+    #coefficient of each ksp data point, allocated once and reset for each point
+    c             = np.multiply(np.zeros(fntau[0,0,0].shape, dtype = fntau.dtype), \
+                    np.zeros(sens_ker[0,0,0].shape, dtype = fntau.dtype))
     #do gridding for each ksp data point
     for i in range(x.shape[0]):
-        c  = np.multiply(np.zeros(fntau[0,0,0].shape, dtype = fntau.dtype), \
-             np.zeros(sens_ker[0,0,0].shape, dtype = fntau.dtype)) #coefficient, saved temporarily
+        c.fill(0)
         xi = x[i] % (2 * np.pi) #x, shift the source point xj so that it lies in [0,2*pi]
         yi = y[i] % (2 * np.pi) #y, shift the source point yj so that it lies in [0,2*pi]
         zi = z[i] % (2 * np.pi) #z, shift the source point zj so that it lies in [0,2*pi]
@@ -1250,6 +1253,291 @@ def nufft3d21_gaussker( x, y, z, Fk, ms, mt, mu, df=1.0, eps=1E-15, iflag=1, gri
     return (1 / len(x)) * np.sqrt(np.pi / tau)**3 * \
     np.multiply(np.exp(tau * (k1 ** 2 + k2 ** 2 + k3 ** 2)).reshape(outkshape), Ftau.reshape(outFkshape))
 
+#####################################################################################################
+#precomputed gridding for nufft plan, 2d/3d, type1, type2
+#####################################################################################################
+
+"""
+the gaussian kernel is separable, g(x,y,z) = g(x)*g(y)*g(z), so that the gridding
+weights of each k-space sample can be precomputed along each axis once per trajectory
+and reused in all iterations of a recon, see fft/nufft_class.py
+
+for each sample xj, the neighbor grid points are (m + mm) % nf for mm in [-nspread, nspread)
+and m = 1 + int(xj // hx), which is the same as in build_grid_1d1()
+inputs:
+x is xj, already scaled by df
+nf is the size of oversampled grid along this axis
+outputs:
+idx, neighbor grid indices, dim is len(x) X 2*nspread
+w,   gaussian weights g(xj - hx*(m + mm)), dim is len(x) X 2*nspread
+"""
+def _compute_1d_gaussker_weights( x, nf, tau, nspread ):
+    hx  = 2 * np.pi / nf
+    xi  = x % (2 * np.pi) #shift the source point xj so that it lies in [0,2*pi]
+    m   = 1 + (xi // hx).astype(np.int64) #index for the closest grid point
+    idx = m[:, np.newaxis] + np.arange(-nspread, nspread)
+    w   = np.exp(-0.25 * (xi[:, np.newaxis] - hx * idx) ** 2 / tau)
+    return idx % nf, w
+
+"""
+deconvolution along one axis, i.e. G(k1)^-1 * sqrt(pi/tau), used in both type 1 and type 2
+"""
+def _compute_1d_gaussker_deconv( ms, tau ):
+    k1 = nufftfreqs1d(ms)
+    return np.sqrt(np.pi / tau) * np.exp(tau * k1 ** 2)
+
+"""
+Kaiser-Bessel gridding kernel, an alternative to the gaussian kernel above
+the kernel in grid units u (distance to the grid point divided by hx) is
+phi(u) = I0(beta * sqrt(1 - (2u/W)^2)) / I0(beta), for |u| <= W/2, and 0 otherwise
+with the shape parameter from Beatty et al. IEEE TMI 2005
+beta = pi * sqrt(W^2/upsampfac^2 * (upsampfac - 0.5)^2 - 0.8)
+so that the oversampling ratio upsampfac can be much smaller than the 2 or 3 of Dutt & Rokhlin,
+e.g. 1.25 to 2.0, and the width W for a given precision is much smaller than 2*nspread of the gaussian
+
+the width W for a requested eps is looked up in _kbker_width_table, which was measured
+as the relative l2 error of the 2d type 1 against nudft2d1(), see nufft_test_func.benchmark_nufft2d1_kernels()
+"""
+_kbker_width_table = {
+    #upsampfac: ((eps, W), ...), the smallest W that reaches eps
+    1.25: ((1E-2, 4), (1E-3, 6), (1E-4, 7), (1E-5, 9), (1E-6, 10), (1E-7, 12), (1E-8, 14), (1E-9, 15), (1E-10, 17)),
+    1.5:  ((1E-2, 4), (1E-3, 5), (1E-4, 6), (1E-5, 7), (1E-6, 9), (1E-7, 10), (1E-8, 11), (1E-9, 12), (1E-10, 14),\
+           (1E-11, 15), (1E-12, 16)),
+    2.0:  ((1E-2, 3), (1E-3, 4), (1E-4, 5), (1E-5, 6), (1E-6, 7), (1E-7, 8), (1E-8, 9), (1E-9, 10), (1E-10, 11),\
+           (1E-11, 12), (1E-12, 13), (1E-13, 14)),
+}
+
+#smallest even integer >= n with prime factors 2, 3 and 5 only, fft friendly
+def _next_smooth_even( n ):
+    n = int(np.ceil(n))
+    n = n + (n % 2)
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m = m // p
+        if m == 1:
+            return n
+        n = n + 2
+
+"""
+kaiser-bessel grid parameters along one axis
+inputs:
+ms is the image size, eps is the requested precision
+upsampfac is the oversampling ratio, one of the keys of _kbker_width_table
+outputs:
+nspread, neighbors are mm in [-nspread, nspread) as for the gaussian kernel, nspread = ceil(W/2)
+nf, the oversampled grid size, width W and shape parameter beta
+"""
+def _compute_1d_kbker_params( ms, eps, upsampfac=2.0 ):
+    if upsampfac not in _kbker_width_table:
+        raise ValueError("upsampfac = {0}; must be one of {1}".format(upsampfac, sorted(_kbker_width_table)))
+    table = _kbker_width_table[upsampfac]
+    if eps < table[-1][0] or eps >= 1E-1:
+        raise ValueError("eps = {0:.0e}; must satisfy "
+                         "{1:.0e} <= eps < 1e-1 for kaiser-bessel kernel.".format(eps, table[-1][0]))
+    width = [W for e, W in table if e <= eps][0]
+    nspread = (width + 1) // 2
+    nf = max(_next_smooth_even(upsampfac * ms), 2 * nspread)
+    beta = np.pi * np.sqrt(width ** 2 / upsampfac ** 2 * (upsampfac - 0.5) ** 2 - 0.8)
+    return nspread, nf, width, beta
+
+"""
+kaiser-bessel weights of each sample, the same layout as _compute_1d_gaussker_weights()
+w is zero for the neighbors outside the kernel support |u| > W/2
+"""
+def _compute_1d_kbker_weights( x, nf, width, beta, nspread ):
+    hx  = 2 * np.pi / nf
+    xi  = x % (2 * np.pi)
+    m   = 1 + (xi // hx).astype(np.int64)
+    idx = m[:, np.newaxis] + np.arange(-nspread, nspread)
+    u   = 2.0 * (xi[:, np.newaxis] / hx - idx) / width
+    w   = np.i0(beta * np.sqrt(np.maximum(1.0 - u ** 2, 0.0))) / np.i0(beta)
+    w[np.abs(u) > 1.0] = 0.0
+    return idx % nf, w
+
+"""
+deconvolution of kaiser-bessel kernel, nf/Phi(k/nf), Phi is the fourier transform of phi(u)
+Phi(f) = W * sinh(sqrt(beta^2 - (pi*W*f)^2)) / sqrt(beta^2 - (pi*W*f)^2) / I0(beta)
+the complex sqrt gives W * sin(.)/(.) when (pi*W*f) > beta
+this is the same role as _compute_1d_gaussker_deconv(), the fft scalings are applied by the caller
+"""
+def _compute_1d_kbker_deconv( ms, nf, width, beta ):
+    k1 = nufftfreqs1d(ms)
+    z  = np.sqrt(beta ** 2 - (np.pi * width * k1 / nf) ** 2 + 0j)
+    Phi = np.real(width * np.sinh(z) / z) / np.i0(beta)
+    return nf / Phi
+
+"""
+sparse interpolation matrix for the precomputed gridding
+G[j, n] is the weight of grid point n (flattened index of the oversampled grid) for sample j,
+so that for stacked coefficients c (nsamples X nbatch) and grid ftau (nf1*nf2*... X nbatch)
+type 1 spreading is ftau = G^T * c and type 2 interpolation is c = G * ftau,
+all coils/echoes are then processed in one sparse matrix-matrix multiply
+inputs:
+idx, w are lists of neighbor indices and weights for each axis, from _compute_1d_gaussker_weights()
+grid_shape is the shape of oversampled grid, (nf1, nf2) or (nf1, nf2, nf3)
+output:
+G, csr matrix, dim is nsamples X prod(grid_shape), with (2*nspread)^ndim nonzeros per row
+"""
+def build_interp_matrix( idx, w, grid_shape ):
+    nsamples = idx[0].shape[0]
+    col      = np.zeros((nsamples, 1), dtype = np.int64)
+    val      = np.ones((nsamples, 1), dtype = w[0].dtype)
+    #outer product of the weights along each axis, row-major flattened grid index
+    for d in range(len(grid_shape)):
+        col = (col[:, :, np.newaxis] * grid_shape[d] + idx[d][:, np.newaxis, :]).reshape((nsamples, -1))
+        val = (val[:, :, np.newaxis] * w[d][:, np.newaxis, :]).reshape((nsamples, -1))
+    indptr = np.arange(nsamples + 1, dtype = np.int64) * col.shape[1]
+    G = scipy.sparse.csr_matrix((val.ravel(), col.ravel(), indptr),\
+                                shape = (nsamples, int(np.prod(grid_shape))))
+    G.sort_indices()
+    return G
+
+"""
+parallel gridding with precomputed weights, race free spreading by spatial tiles
+the first two axes of the oversampled grid are cut into nt1 X nt2 tiles and the samples are sorted
+by the tile of their home grid point (m + 0), see _compute_tiles(), this is done once per trajectory
+type 1: each tile is spread by one thread into its private subgrid, which covers the tile plus nspread
+        on both sides, then the subgrids are reduced into ftau, each row of ftau is owned by one thread
+type 2: interpolation is parallel over samples, the sorted order keeps neighboring samples close in memory
+the idx, w arrays are in the sorted order, c is in the original order, c[order[p]] is the sample p
+all kernels are batched, c is nsamples X nbatch and the grid has a trailing nbatch axis (coils, echoes...),
+each neighbor weight is computed once and applied to all batch channels in the inner contiguous loop
+"""
+def _compute_tiles( idx, grid_shape, nspread, ntiles ):
+    nt = []
+    for d in range(2):
+        #at least 2*nspread grid points per tile so that the subgrids overlap at most 2x
+        nmax = max(grid_shape[d] // (2 * nspread), 1)
+        nt.append(min(int(np.ceil(np.sqrt(ntiles))), nmax))
+    start1 = np.arange(nt[0] + 1) * grid_shape[0] // nt[0]
+    start2 = np.arange(nt[1] + 1) * grid_shape[1] // nt[1]
+    t1 = np.searchsorted(start1, idx[0][:, nspread], side = 'right') - 1
+    t2 = np.searchsorted(start2, idx[1][:, nspread], side = 'right') - 1
+    tile = t1 * nt[1] + t2
+    order = np.argsort(tile, kind = 'mergesort')
+    tile_ptr = np.zeros(nt[0] * nt[1] + 1, dtype = np.int64)
+    tile_ptr[1:] = np.cumsum(np.bincount(tile, minlength = nt[0] * nt[1]))
+    #private subgrid of each tile
+    sub_shape = (nt[0] * nt[1],\
+                 min(np.max(np.diff(start1)) + 2 * nspread, grid_shape[0]),\
+                 min(np.max(np.diff(start2)) + 2 * nspread, grid_shape[1])) + tuple(grid_shape[2:])
+    return order, tile_ptr, start1.astype(np.int64), start2.astype(np.int64), sub_shape
+
+#2d grid type 1 with precomputed weights, parallel over tiles
+#c is nsamples X nbatch, ftau is nf1 X nf2 X nbatch, each weight is applied to all the batch channels
+@numba.jit(nopython=True, parallel=True)
+def build_grid_2d1_tiled( c, order, tile_ptr, start1, start2, idx1, w1, idx2, w2, sub, ftau ):
+    nf1 = ftau.shape[0]
+    nf2 = ftau.shape[1]
+    nb  = ftau.shape[2]
+    nt1 = start1.shape[0] - 1
+    nt2 = start2.shape[0] - 1
+    ns1 = idx1.shape[1] // 2
+    ns2 = idx2.shape[1] // 2
+    for t in numba.prange(nt1 * nt2):
+        t1 = t // nt2
+        t2 = t % nt2
+        sub[t] = 0
+        for p in range(tile_ptr[t], tile_ptr[t + 1]):
+            j = order[p]
+            for mm1 in range(idx1.shape[1]):
+                l1 = (idx1[p, mm1] - start1[t1] + ns1) % nf1
+                for mm2 in range(idx2.shape[1]):
+                    l2 = (idx2[p, mm2] - start2[t2] + ns2) % nf2
+                    W0 = w1[p, mm1] * w2[p, mm2]
+                    for ib in range(nb):
+                        sub[t, l1, l2, ib] += W0 * c[j, ib]
+    #reduce the subgrids, row r1 of ftau is only written by one thread
+    for r1 in numba.prange(nf1):
+        for t1 in range(nt1):
+            l1 = (r1 - start1[t1] + ns1) % nf1
+            if l1 >= min(start1[t1 + 1] - start1[t1] + 2 * ns1, sub.shape[1]):
+                continue
+            for t2 in range(nt2):
+                t = t1 * nt2 + t2
+                if tile_ptr[t] == tile_ptr[t + 1]:
+                    continue
+                for l2 in range(min(start2[t2 + 1] - start2[t2] + 2 * ns2, sub.shape[2])):
+                    r2 = (start2[t2] - ns2 + l2) % nf2
+                    for ib in range(nb):
+                        ftau[r1, r2, ib] += sub[t, l1, l2, ib]
+    return ftau
+
+#2d grid type 2 with precomputed weights, parallel over samples, c need to be zeros
+@numba.jit(nopython=True, parallel=True)
+def build_grid_2d2_par( fntau, order, idx1, w1, idx2, w2, c ):
+    nb = fntau.shape[2]
+    for p in numba.prange(order.shape[0]):
+        j = order[p]
+        for mm1 in range(idx1.shape[1]):
+            for mm2 in range(idx2.shape[1]):
+                W0 = w1[p, mm1] * w2[p, mm2]
+                for ib in range(nb):
+                    c[j, ib] += fntau[idx1[p, mm1], idx2[p, mm2], ib] * W0
+    return c
+
+#3d grid type 1 with precomputed weights, parallel over tiles of the first two axes
+#c is nsamples X nbatch, ftau is nf1 X nf2 X nf3 X nbatch
+@numba.jit(nopython=True, parallel=True)
+def build_grid_3d1_tiled( c, order, tile_ptr, start1, start2, idx1, w1, idx2, w2, idx3, w3, sub, ftau ):
+    nf1 = ftau.shape[0]
+    nf2 = ftau.shape[1]
+    nf3 = ftau.shape[2]
+    nb  = ftau.shape[3]
+    nt1 = start1.shape[0] - 1
+    nt2 = start2.shape[0] - 1
+    ns1 = idx1.shape[1] // 2
+    ns2 = idx2.shape[1] // 2
+    for t in numba.prange(nt1 * nt2):
+        t1 = t // nt2
+        t2 = t % nt2
+        sub[t] = 0
+        for p in range(tile_ptr[t], tile_ptr[t + 1]):
+            j = order[p]
+            for mm1 in range(idx1.shape[1]):
+                l1 = (idx1[p, mm1] - start1[t1] + ns1) % nf1
+                for mm2 in range(idx2.shape[1]):
+                    l2 = (idx2[p, mm2] - start2[t2] + ns2) % nf2
+                    W0 = w1[p, mm1] * w2[p, mm2]
+                    for mm3 in range(idx3.shape[1]):
+                        W1 = W0 * w3[p, mm3]
+                        l3 = idx3[p, mm3]
+                        for ib in range(nb):
+                            sub[t, l1, l2, l3, ib] += W1 * c[j, ib]
+    #reduce the subgrids, row r1 of ftau is only written by one thread
+    for r1 in numba.prange(nf1):
+        for t1 in range(nt1):
+            l1 = (r1 - start1[t1] + ns1) % nf1
+            if l1 >= min(start1[t1 + 1] - start1[t1] + 2 * ns1, sub.shape[1]):
+                continue
+            for t2 in range(nt2):
+                t = t1 * nt2 + t2
+                if tile_ptr[t] == tile_ptr[t + 1]:
+                    continue
+                for l2 in range(min(start2[t2 + 1] - start2[t2] + 2 * ns2, sub.shape[2])):
+                    r2 = (start2[t2] - ns2 + l2) % nf2
+                    for r3 in range(nf3):
+                        for ib in range(nb):
+                            ftau[r1, r2, r3, ib] += sub[t, l1, l2, r3, ib]
+    return ftau
+
+#3d grid type 2 with precomputed weights, parallel over samples, c need to be zeros
+@numba.jit(nopython=True, parallel=True)
+def build_grid_3d2_par( fntau, order, idx1, w1, idx2, w2, idx3, w3, c ):
+    nb = fntau.shape[3]
+    for p in numba.prange(order.shape[0]):
+        j = order[p]
+        for mm1 in range(idx1.shape[1]):
+            for mm2 in range(idx2.shape[1]):
+                W0 = w1[p, mm1] * w2[p, mm2]
+                for mm3 in range(idx3.shape[1]):
+                    W1 = W0 * w3[p, mm3]
+                    for ib in range(nb):
+                        c[j, ib] += fntau[idx1[p, mm1], idx2[p, mm2], idx3[p, mm3], ib] * W1
+    return c
+
 
 #def test():
     #test nudft
@@ -230,3 +230,38 @@ def time_nufft3d2( nufft_func1, nufft_func2, ms=1000, mt=1000, mu=1000, mc=10000
     ut.plot(x,np.real(c),'o')
     ut.plot(np.real(c0),np.real(c),'o')
     print("- Execution time (M={0}): {1:.2g} sec".format(mc, np.median(times)))
+
+"""
+accuracy vs speed of the gridding kernels in the nufft plan, fft/nufft_class.py
+the 2d type 1 of each kernel/oversampling is compared with the direct nudft_func, e.g. nudft2d1()
+for each eps it prints the relative l2 error, the grid size, the number of neighbors per axis,
+the setup time of the plan and the median time of one type 1 (backward)
+usage:
+benchmark_nufft2d1_kernels(nudft2d1, 64, 64, 20000)
+"""
+def benchmark_nufft2d1_kernels( nudft_func, ms=64, mt=64, mc=20000, Reptime=5,\
+                                eps_list=(1E-3, 1E-4, 1E-6, 1E-8),\
+                                kernels=(('gauss', 2.0), ('kb', 1.25), ('kb', 1.5), ('kb', 2.0)) ):
+    import nufft_class
+    rng = np.random.RandomState(0)
+    x = np.pi * (2 * rng.rand(mc) - 1)
+    y = np.pi * (2 * rng.rand(mc) - 1)
+    c = np.sin(2*x) + 1j*np.cos(2*y)
+    F0 = nudft_func(x, y, c, ms, mt)
+    print(30 * '-')
+    print("{0:>8} {1:>6} {2:>8} {3:>10} {4:>12} {5:>8} {6:>10} {7:>10}".format(\
+          'eps', 'kernel', 'upsamp', 'error', 'grid', 'nspread', 'setup(s)', 'type1(s)'))
+    for eps in eps_list:
+        for kernel, upsampfac in kernels:
+            t0 = time()
+            nft_opt = nufft_class.NUFFT2d(x, y, ms, mt, eps = eps, kernel = kernel, upsampfac = upsampfac)
+            tsetup = time() - t0
+            times = []
+            for i in range(Reptime):
+                t0 = time()
+                F = nft_opt.backward(c)
+                times.append(time() - t0)
+            err = np.linalg.norm(F - F0) / np.linalg.norm(F0)
+            print("{0:8.0e} {1:>6} {2:8.2f} {3:10.2e} {4:>12} {5:8d} {6:10.3g} {7:10.3g}".format(\
+                  eps, kernel, upsampfac, err, 'x'.join(str(n) for n in nft_opt.grid_shape),\
+                  nft_opt.nspread, tsetup, np.median(times)))
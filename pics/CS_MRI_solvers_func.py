@@ -1,23 +1,34 @@
 import numpy as np
 import proximal_func as pf
+import opt_alg as alg
 #from numba import jit
+"""
+the solvers take an optional telemetry (utilities_class.telemetry) which records the residual, step and
+the forward/backward/prox wall time of each iteration, without it there is no extra work
+"""
+# forward, backward and prox functions timed by telemetry
+def _timed( telemetry, Afunc, invAfunc, prox ):
+    return telemetry.timed('forward', Afunc), telemetry.timed('backward', invAfunc), telemetry.timed('prox', prox)
+
 """
 iterative soft-thresholding
 argmin ||Ax-b|||_2^2+(th/2)*||x||_1
 matrix A input
 """
-def IST_1( A, b, Nite, step, th ):
+def IST_1( A, b, Nite, step, th, telemetry = None ):
     #inverse operator
     invA = np.linalg.pinv(A)
     x_acc = step*(invA.dot(b))#np.zeros(x.shape)
     # iteration
-    for _ in range(Nite):
+    for k in range(Nite):
         # soft threshold
         x = pf.prox_l1_soft_thresh(x_acc,th)
         #residual
         r = A.dot(x) - b
         x_acc = x_acc - step*(invA.dot(r))
-        print np.linalg.norm(r)
+        if telemetry is not None:
+            telemetry.record(k, residual = np.linalg.norm(r), step = step,\
+                             objective = lambda: np.linalg.norm(r)**2 + th*np.sum(np.abs(x)))
     return x
 
 """
@@ -25,16 +36,21 @@ iterative soft-thresholding
 argmin ||A(x)-b|||_2^2+(th/2)*||x||_1
 function A() input
 """
-def IST_2( Afunc, invAfunc, b, Nite, step, th ):
+def IST_2( Afunc, invAfunc, b, Nite, step, th, telemetry = None ):
+    prox = pf.prox_l1_soft_thresh2
+    if telemetry is not None:
+        Afunc, invAfunc, prox = _timed(telemetry, Afunc, invAfunc, prox)
     x_acc = step*invAfunc(b)#np.zeros(x.shape)
     # iteration
-    for _ in range(Nite):
+    for k in range(Nite):
         # soft threshold
-        x = pf.prox_l1_soft_thresh2(x_acc, th)
+        x = prox(x_acc, th)
         #residual
         r = Afunc(x) - b
         x_acc = x_acc - step*invAfunc(r)
-        print np.linalg.norm(r)
+        if telemetry is not None:
+            telemetry.record(k, residual = np.linalg.norm(r), step = step,\
+                             objective = lambda: np.linalg.norm(r)**2 + th*np.sum(np.abs(x)))
     return x
 
 """
@@ -44,17 +60,25 @@ function A() input
 Tfunc can be wavelet, singular values of Hankel etc.
 proximal gradient method which is
 x^k = prox_tkh(x^k-1 - tk * grad(x^k-1))
+step None is 1/||invAfunc(Afunc())|| from power iteration, alg.max_eig_AHA()
 """
-def IST_3( Afunc, invAfunc, Tfunc, invTfunc, b, Nite, step, th ):
+def IST_3( Afunc, invAfunc, Tfunc, invTfunc, b, Nite, step, th, telemetry = None ):
+    if step is None:
+        step = 1.0/alg.max_eig_AHA(Afunc, invAfunc, invAfunc(b).shape)
+    prox = pf.prox_l1_Tf_soft_thresh2
+    if telemetry is not None:
+        Afunc, invAfunc, prox = _timed(telemetry, Afunc, invAfunc, prox)
     x_acc = step*invAfunc(b) #np.zeros(x.shape)
     # iteration
-    for _ in range(Nite):
+    for k in range(Nite):
         # soft threshold
-        x = pf.prox_l1_Tf_soft_thresh2(Tfunc,invTfunc,x_acc, th)
+        x = prox(Tfunc,invTfunc,x_acc, th)
         #residual
         r = Afunc(x) - b
         x_acc = x_acc - step*invAfunc(r)
-        print np.linalg.norm(r)
+        if telemetry is not None:
+            telemetry.record(k, residual = np.linalg.norm(r), step = step,\
+                             objective = lambda: np.linalg.norm(r)**2 + th*np.sum(np.abs(Tfunc(x))))
     return x
 
 """
@@ -66,8 +90,14 @@ proximal gradient method which is
 y^0 = x^0
 x^k = prox_tkh(y^k-1 - tk * grad(y^k-1))
 y^k = x^k + (k-1)/(k+2) (x^k - x^k-1)
+step None is 1/||invAfunc(Afunc())|| from power iteration, alg.max_eig_AHA()
 """ 
-def FIST_3( Afunc, invAfunc, Tfunc, invTfunc, b, Nite, step, th ):
+def FIST_3( Afunc, invAfunc, Tfunc, invTfunc, b, Nite, step, th, telemetry = None ):
+    if step is None:
+        step = 1.0/alg.max_eig_AHA(Afunc, invAfunc, invAfunc(b).shape)
+    prox = pf.prox_l1_Tf_soft_thresh2
+    if telemetry is not None:
+        Afunc, invAfunc, prox = _timed(telemetry, Afunc, invAfunc, prox)
     y     = step*invAfunc(b) #np.zeros(x.shape)
     y_acc = np.zeros(y.shape,dtype=b.dtype)
     x_pre = y
@@ -78,11 +108,105 @@ def FIST_3( Afunc, invAfunc, Tfunc, invTfunc, b, Nite, step, th ):
         r = Afunc(y) - b
         y_acc = y_acc - step*invAfunc(r)
         # soft threshold
-        x = pf.prox_l1_Tf_soft_thresh2(Tfunc,invTfunc,y_acc, th)        
+        x = prox(Tfunc,invTfunc,y_acc, th)        
         y = x + np.multiply((k-1)/(k+2), (x - x_pre))
         x_pre = x
+        if telemetry is not None:
+            telemetry.record(k, residual = np.linalg.norm(r), step = step,\
+                             objective = lambda: np.linalg.norm(r)**2 + th*np.sum(np.abs(Tfunc(x))))
         k += 1
-        print np.linalg.norm(r)
+    return x
+
+"""
+FISTA with backtracking, adaptive restart and stopping on the relative change, or POGM
+argmin (1/2)*||A(x)-b||_2^2 + th*||Tfunc(x)||_1, for invAfunc = c*A^H the l2 term is scaled by c
+Beck and Teboulle, A fast iterative shrinkage-thresholding algorithm for linear inverse problems, 2009
+O'Donoghue and Candes, Adaptive restart for accelerated gradient schemes, 2015
+Kim and Fessler, Adaptive restart of the optimized gradient method for convex optimization, 2018
+
+x^k = prox_th/L(y^k-1 - invAfunc(A(y^k-1)-b)/L)
+t^k = (1+sqrt(1+4*(t^k-1)^2))/2, y^k = x^k + (t^k-1 - 1)/t^k*(x^k - x^k-1)
+A is linear so A(y^k) = A(x^k) + beta*(A(x^k) - A(x^k-1)), each iteration is one Afunc and one invAfunc
+
+step is 1/L, if None L is the power iteration estimate of ||invAfunc(Afunc())|| from alg.max_eig_AHA(),
+backtrack increases L by eta while ||A(d)||^2*c > L*||d||^2 for d = x^k - y^k-1 (no extra Afunc),
+restart resets the momentum when <y^k-1 - x^k, x^k - x^k-1> > 0 (gradient restart),
+stop when ||x^k - x^k-1|| < tol*||x^k||,
+pogm = True uses the proximal optimized gradient method with the fixed L, a faster worst case than FISTA
+"""
+def FISTA_3( Afunc, invAfunc, Tfunc, invTfunc, b, th, Nite = 100, step = None, tol = 1e-4,\
+             restart = True, backtrack = True, eta = 1.5, pogm = False, telemetry = None ):
+    x   = invAfunc(b)
+    if step is None:
+        L = alg.max_eig_AHA(Afunc, invAfunc, x.shape, x.dtype)
+    else:
+        L = 1.0 / step
+    prox = lambda v, L: pf.prox_l1_Tf_soft_thresh2(Tfunc, invTfunc, v, th / L)
+    if telemetry is not None:
+        Afunc, invAfunc, prox = _timed(telemetry, Afunc, invAfunc, prox)
+    if pogm:
+        return _POGM_3(Afunc, invAfunc, prox, b, x, L, Nite, tol, restart, telemetry)
+    Ax  = Afunc(x)
+    # c in invAfunc = c*A^H, for the backtracking condition
+    g   = invAfunc(Ax - b)
+    Ag  = Afunc(g)
+    c   = np.vdot(g, invAfunc(Ag)).real / max(np.vdot(Ag, Ag).real, 1e-30)
+    y, Ay, t = x, Ax, 1.0
+    for k in range(Nite):
+        if k > 0:
+            g = invAfunc(Ay - b)
+        while True:
+            x_new  = prox(y - g / L, L)
+            Ax_new = Afunc(x_new)
+            if not backtrack:
+                break
+            d  = x_new - y
+            Ad = Ax_new - Ay
+            if c * np.vdot(Ad, Ad).real <= L * np.vdot(d, d).real * (1.0 + 1e-10):
+                break
+            L = L * eta
+        dx    = x_new - x
+        rel   = np.linalg.norm(dx) / max(np.linalg.norm(x_new), 1e-30)
+        restarted = restart and np.vdot(y - x_new, dx).real > 0
+        if restarted:
+            t = 1.0 #momentum goes uphill, restart
+        t_new = (1.0 + np.sqrt(1.0 + 4.0 * t * t)) / 2.0
+        beta  = (t - 1.0) / t_new
+        y     = x_new + beta * dx
+        Ay    = Ax_new + beta * (Ax_new - Ax)
+        x, Ax, t = x_new, Ax_new, t_new
+        if telemetry is not None:
+            telemetry.record(k, relative_change = rel, step = 1.0 / L, restart = restarted,\
+                             objective = lambda: 0.5*c*np.linalg.norm(Ax - b)**2 + th*np.sum(np.abs(Tfunc(x))))
+        if rel < tol:
+            break
+    return x
+
+# POGM, x is the secondary sequence where the gradient is taken, w the gradient steps, z the primary sequence
+def _POGM_3( Afunc, invAfunc, prox, b, x, L, Nite, tol, restart, telemetry ):
+    w_pre, z_pre, x_pre = x, x, x
+    theta, gamma = 1.0, 1.0 / L
+    for k in range(Nite):
+        w = x_pre - invAfunc(Afunc(x_pre) - b) / L
+        if k == Nite - 1:
+            theta_new = (1.0 + np.sqrt(1.0 + 8.0 * theta * theta)) / 2.0
+        else:
+            theta_new = (1.0 + np.sqrt(1.0 + 4.0 * theta * theta)) / 2.0
+        gamma_new = (2.0 * theta + theta_new - 1.0) / (L * theta_new)
+        z = w + ((theta - 1.0) / theta_new) * (w - w_pre) + (theta / theta_new) * (w - x_pre)\
+              + ((theta - 1.0) / (L * gamma * theta_new)) * (z_pre - x_pre)
+        x = prox(z, 1.0 / gamma_new)
+        dx  = x - x_pre
+        rel = np.linalg.norm(dx) / max(np.linalg.norm(x), 1e-30)
+        restarted = restart and np.vdot(z - x, dx).real > 0
+        if restarted:
+            theta_new = 1.0 #restart the momentum
+        w_pre, z_pre, x_pre = w, z, x
+        theta, gamma = theta_new, gamma_new
+        if telemetry is not None:
+            telemetry.record(k, relative_change = rel, step = gamma, restart = restarted)
+        if rel < tol:
+            break
     return x
 
 
@@ -109,31 +233,33 @@ x^k+1 = prox_l2_Axnb(A,b,x0=z^k-u^k,rho)
 z^k+1 = prox_l1_soft_thresh(x0=x^k+u^k,th = lambda/rho)
 u^k+1 = u^k + alphi*(x^k+1-z^k+1)
 """
-def ADMM_l2Axnb_l1x_1( A, b, Nite, step, l1_r, rho ):
+def ADMM_l2Axnb_l1x_1( A, b, Nite, step, l1_r, rho, telemetry = None ):
     z = np.pinv(A).dot(b)
     u = np.zeros(z.shape)
     # iteration
-    for _ in range(Nite):
+    for k in range(Nite):
         # soft threshol
         x = pf.prox_l2_Axnb(A,b,z-u,rho)
         z = pf.prox_l1_soft_thresh(x+u,l1_r/rho)
         u = u + step*(x-z)
-        print np.linalg.norm(x-z)
+        if telemetry is not None:
+            telemetry.record(k, residual = np.linalg.norm(x-z), step = step, rho = rho)
     return x
 """
 faster version with percalculation
 """
-def ADMM_l2Axnb_l1x_2( A, b, Nite, step, l1_r, rho ):
+def ADMM_l2Axnb_l1x_2( A, b, Nite, step, l1_r, rho, telemetry = None ):
     z = np.pinv(A).dot(b)
     u = np.zeros(z.shape)
     Q_dot, A_T_b = prox_l2_Axnb_precomputpart( A, b, rho )
     # iteration
-    for _ in range(Nite):
+    for k in range(Nite):
         # soft threshold
         x = Q_dot(A_T_b + rho*(z-u)) #prox_l2_Axnb_iterpart( Q_dot, A_T_b, z-u, rho )
         z = pf.prox_l1_soft_thresh(x+u,l1_r/rho)
         u = u + step*(x-z)
-        print np.linalg.norm(x-z)
+        if telemetry is not None:
+            telemetry.record(k, residual = np.linalg.norm(x-z), step = step, rho = rho)
     return x
 
 """
@@ -159,24 +285,27 @@ x^k+1 = prox_l2_Afxnb_GD(Afunc, invAfunc, b, x0=z^k-u^k, rho, Nite=100, step=0.0
 z^k+1 = prox_l1_soft_thresh(x0=x^k+u^k,th = lambda/rho)
 u^k+1 = u^k + alphi*(x^k+1-z^k+1)
 """
-def ADMM_l2Afxnb_l1x( Afunc, invAfunc, b, Nite, step, l1_r, rho, cgd_Nite = 3 ):
+def ADMM_l2Afxnb_l1x( Afunc, invAfunc, b, Nite, step, l1_r, rho, cgd_Nite = 3, telemetry = None ):
     z = invAfunc(b) #np.zeros(x.shape)
     u = np.zeros(z.shape)
+    x = z #warm start of the CG in the x-update
     # iteration
-    for _ in range(Nite):
+    for k in range(Nite):
         # soft threshold
         #x = pf.prox_l2_Afxnb_GD(Afunc,invAfunc,b,z-u,rho,10,0.1)
-        x = pf.prox_l2_Afxnb_CGD( Afunc, invAfunc, b, z-u, rho, cgd_Nite )
+        x = pf.prox_l2_Afxnb_CG( Afunc, invAfunc, b, z-u, rho, cgd_Nite, x_init = x )
         z = pf.prox_l1_soft_thresh(x+u,l1_r/rho)
         u = u + step*(x-z)
-        print np.linalg.norm(x-z)
+        if telemetry is not None:
+            telemetry.record(k, residual = np.linalg.norm(x-z), step = step, rho = rho)
     return x
 
 #tv minimization
 #tv_r, regularization parameter for tv term
-def ADMM_l2Afxnb_tvx( Afunc, invAfunc, b, Nite, step, tv_r, rho, cgd_Nite = 3, tvndim = 2 ):
+def ADMM_l2Afxnb_tvx( Afunc, invAfunc, b, Nite, step, tv_r, rho, cgd_Nite = 3, tvndim = 2, telemetry = None ):
     z = invAfunc(b) #np.zeros(x.shape), z=AH(b)
     u = np.zeros(z.shape)
+    x = z #warm start of the CG in the x-update
     # 2d or 3d, use different proximal funcitons
     if tvndim is 2:
         tvprox = pf.prox_tv2d_r
@@ -186,20 +315,22 @@ def ADMM_l2Afxnb_tvx( Afunc, invAfunc, b, Nite, step, tv_r, rho, cgd_Nite = 3, t
         print('dimension imcompatiable in ADMM_l2Afxnb_tvx')
         return None
     # iteration
-    for _ in range(Nite):
+    for k in range(Nite):
         # soft threshold
         #x = pf.prox_l2_Afxnb_GD(Afunc,invAfunc,b,z-u,rho,20,0.1)
-        x = pf.prox_l2_Afxnb_CGD( Afunc, invAfunc, b, z-u, rho, cgd_Nite )
+        x = pf.prox_l2_Afxnb_CG( Afunc, invAfunc, b, z-u, rho, cgd_Nite, x_init = x )
         z = tvprox(x + u, 2.0 * tv_r/rho)#pf.prox_tv2d(x+u,2*tv_r/rho)
         u = u + step * (x - z)
-        print( 'gradient in ADMM %g' % np.linalg.norm(x-z))
+        if telemetry is not None:
+            telemetry.record(k, residual = np.linalg.norm(x-z), step = step, rho = rho)
     return x
 
 #tv minimization
 #tv_r, regularization parameter for tv term
-def ADMM_l2Afxnb_tvTfx( Afunc, invAfunc, Tfunc, invTfunc, b, Nite, step, tv_r, rho, cgd_Nite = 3, tvndim = 2 ):
+def ADMM_l2Afxnb_tvTfx( Afunc, invAfunc, Tfunc, invTfunc, b, Nite, step, tv_r, rho, cgd_Nite = 3, tvndim = 2, telemetry = None ):
     z = invAfunc(b) #np.zeros(x.shape), z=AH(b)
     u = np.zeros(z.shape)
+    x = z #warm start of the CG in the x-update
     # 2d or 3d, use different proximal funcitons
     if tvndim is 2:
         tvprox = pf.prox_tv2d_r
@@ -209,27 +340,30 @@ def ADMM_l2Afxnb_tvTfx( Afunc, invAfunc, Tfunc, invTfunc, b, Nite, step, tv_r, r
         print('dimension imcompatiable in ADMM_l2Afxnb_tvx')
         return None
     # iteration
-    for _ in range(Nite):
+    for k in range(Nite):
         # soft threshold
         #x = pf.prox_l2_Afxnb_GD(Afunc,invAfunc,b,z-u,rho,20,0.1)
-        x = pf.prox_l2_Afxnb_CGD( Afunc, invAfunc, b, z-u, rho, cgd_Nite )
+        x = pf.prox_l2_Afxnb_CG( Afunc, invAfunc, b, z-u, rho, cgd_Nite, x_init = x )
         z = invTfunc(tvprox(Tfunc(x + u), 2.0 * tv_r/rho))#pf.prox_tv2d(x+u,2*tv_r/rho)
         u = u + step * (x - z)
-        print( 'gradient in ADMM %g' % np.linalg.norm(x-z))
+        if telemetry is not None:
+            telemetry.record(k, residual = np.linalg.norm(x-z), step = step, rho = rho)
     return x
 
 #l1 with tranform function Tf, which can be wavelet transform
-def ADMM_l2Afxnb_l1Tfx( Afunc, invAfunc, Tfunc, invTfunc, b, Nite, step, l1_r, rho, cgd_Nite = 3 ):
+def ADMM_l2Afxnb_l1Tfx( Afunc, invAfunc, Tfunc, invTfunc, b, Nite, step, l1_r, rho, cgd_Nite = 3, telemetry = None ):
     z = invAfunc(b)#np.zeros(x.shape)
     u = np.zeros(z.shape)
+    x = z #warm start of the CG in the x-update
     # iteration
-    for _ in range(Nite):
+    for k in range(Nite):
         # soft threshold
         #x = pf.prox_l2_Afxnb_GD(Afunc,invAfunc,b,z-u,rho,10,0.1)
-        x = pf.prox_l2_Afxnb_CGD( Afunc, invAfunc, b, z-u, rho, cgd_Nite )        
+        x = pf.prox_l2_Afxnb_CG( Afunc, invAfunc, b, z-u, rho, cgd_Nite, x_init = x )        
         z = pf.prox_l1_Tf_soft_thresh(Tfunc,invTfunc,x+u,l1_r/rho)
         u = u + step*(x-z)
-        print( 'gradient in ADMM %g' % np.linalg.norm(x-z))
+        if telemetry is not None:
+            telemetry.record(k, residual = np.linalg.norm(x-z), step = step, rho = rho)
     return x
 
 """
@@ -257,13 +391,13 @@ x_3^k+1 = prox_l1_Tf_soft_thresh(Tfunc,invTfunc,x0=z^k-u_3^k,th = lambda2/rho)
 z^k+1 = average(x_i^k)
 u_i^k+1 = u_i^k + alphi*(x_i^k+1-z^k+1)
 """
-def ADMM_l2Afxnb_l1x_l1Tfx( Afunc, invAfunc, Tfunc, invTfunc, b, Nite, step, l1_r1, L1_r2, rho ):
+def ADMM_l2Afxnb_l1x_l1Tfx( Afunc, invAfunc, Tfunc, invTfunc, b, Nite, step, l1_r1, L1_r2, rho, telemetry = None ):
     z = invAfunc(b)
     u1 = np.zeros(z.shape)
     u2 = np.zeros(z.shape)
     u3 = np.zeros(z.shape)
     # iteration
-    for _ in range(Nite):
+    for k in range(Nite):
         # soft threshold
         x1 = pf.prox_l2_Afxnb_GD(Afunc,invAfunc,b,z-u1,rho,10,0.1)
         x2 = pf.prox_l1_soft_thresh(z-u2,l1_r1/rho)
@@ -272,21 +406,24 @@ def ADMM_l2Afxnb_l1x_l1Tfx( Afunc, invAfunc, Tfunc, invTfunc, b, Nite, step, l1_
         u1 = u1 + step*(x1-z)
         u2 = u2 + step*(x2-z)
         u3 = u3 + step*(x3-z)
-        print np.linalg.norm(x1-z)
+        if telemetry is not None:
+            telemetry.record(k, residual = np.linalg.norm(x1-z), step = step, rho = rho)
     return x1
 
-def ADMM_l2Afxnb_l1x_2( Afunc, invAfunc, b, Nite, step, l1_r1, rho, cgd_Nite = 3 ):
+def ADMM_l2Afxnb_l1x_2( Afunc, invAfunc, b, Nite, step, l1_r1, rho, cgd_Nite = 3, telemetry = None ):
     z = invAfunc(b)
     u1 = np.zeros(z.shape)
     u2 = np.zeros(z.shape)
+    x1 = z #warm start of the CG in the x-update
     # iteration
-    for _ in range(Nite):
+    for k in range(Nite):
         # soft threshold
         #x1 = pf.prox_l2_Afxnb_GD(Afunc,invAfunc,b,z-u1,rho,10,0.1)
-        x1 = pf.prox_l2_Afxnb_CGD( Afunc, invAfunc, b, z-u1, rho, cgd_Nite )
+        x1 = pf.prox_l2_Afxnb_CG( Afunc, invAfunc, b, z-u1, rho, cgd_Nite, x_init = x1 )
         x2 = pf.prox_l1_soft_thresh(z-u2,l1_r1/rho)
         z = (x1 + x2)/2.0 + (u1 + u2)/2.0
         u1 = u1 + step*(x1-z)
         u2 = u2 + step*(x2-z)
-        print np.linalg.norm(x2-x1)
+        if telemetry is not None:
+            telemetry.record(k, residual = np.linalg.norm(x2-x1), step = step, rho = rho)
     return x1
@@ -1,15 +1,152 @@
-# A concept with a CS MRI class contains ADMM reconstruction algorithm that can have variable number of reglarizations
+import numpy as np
+from multiprocessing.pool import ThreadPool
+from pics.linop_class import apply_opt
+from pics.opt_alg import linear_cg
+from utilities.parallel_func import numba_threadsafe
+"""
+CS MRI recon class with ADMM that can have variable number of reglarizations
+
+argmin_x ||A(x)-b||_2^2 + sum_i lambda_i*R_i(T_i(x))
+
+A is the encoding operator (e.g. joint2operators(esp, FTm)), with forward, adjoint and normal as linop_class,
+T_i is the sparsifying transform of regularization i in the convention of the solvers in CS_MRI_solvers_func.py:
+T_i(x) is transform.backward(x) (image -> sparse domain) and T_i^H(z) is transform.forward(z), e.g. TV2d() or DWT2d(),
+transform None is identity, prox_i(v, th) is argmin_z th*R_i(z) + 1/2*||z-v||_2^2, e.g. pf.prox_l1_soft_thresh
+
+ADMM with z_i = T_i(x) in the scaled form, Boyd et al., Distributed optimization and statistical learning
+via the alternating direction method of multipliers, 2011, sections 3.3, 3.4.1 and 3.4.3
+x^k+1   = argmin_x ||A(x)-b||_2^2 + sum_i (rho/2)*||T_i(x)-z_i^k+u_i^k||_2^2
+          solved by CG on (2A^H A + rho*sum_i T_i^H T_i) x = 2A^H b + rho*sum_i T_i^H(z_i^k-u_i^k), warm start at x^k,
+          or exactly by A.solve_normal() when all T_i are identity/unitary, e.g. A = FFT2d_kmask
+Tx_i    = alpha*T_i(x^k+1) + (1-alpha)*z_i^k,  over-relaxation, alpha in [1.5, 1.8] is usually faster than 1
+z_i^k+1 = prox_i(Tx_i + u_i^k, lambda_i/rho)
+u_i^k+1 = u_i^k + Tx_i - z_i^k+1
+the z/u updates of different regularizations are independent and run in a thread pool (numpy releases the GIL),
+they run one after the other if numba uses the workqueue threading layer, which aborts when the parallel prox
+kernels of proximal_func.py/tvop_class.py are launched from several threads (see parallel_func.numba_threadsafe)
+
+stopping, primal residual r = ||T(x)-z||, dual residual s = rho*||z^k+1-z^k|| (exact for orthogonal T),
+stop when r < sqrt(p)*eps_abs + eps_rel*max(||T(x)||,||z||) and s < sqrt(n)*eps_abs + eps_rel*rho*||u||
+adaptive rho, residual balancing on the relative residuals r/max(||T(x)||,||z||) and s/(rho*||u||),
+rho*tau if r > mu*s, rho/tau if s > mu*r, and u is rescaled by the inverse
+
+usage:
+rec = recon(Aopt, b)
+rec.add_reglarization(tvop, pf.prox_l1_soft_thresh, 0.01)
+rec.add_reglarization(dwt, pf.prox_l1_soft_thresh, 0.005)
+x = rec.ADMM(rho = 1.0, Nite = 100)
+"""
 class recon:
-    def __init__( self ):
+    "this is CS MRI recon with ADMM for a list of regularizations"
+    def __init__( self, Aopt = None, b = None ):
+        self.Aopt = Aopt
+        self.b    = b
         self.reglarization = []
         self.Nreg = 0
+        self.history = [] #(primal residual, dual residual, rho) for each iteration
 
-    def add_reglarization( self, reglarization ):
+    # transform is None for regularization on the image, weight is lambda_i
+    def add_reglarization( self, transform, prox, weight = 1.0 ):
         self.Nreg = self.Nreg + 1
-        self.reglarization.append(reglarization)
+        self.reglarization.append((transform, prox, weight))
+        return self
+
+    # T_i(x), T_i^H(z) and T_i^H T_i(x)
+    def _T( self, i, x ):
+        transform = self.reglarization[i][0]
+        return x if transform is None else transform.backward(x)
+
+    def _TH( self, i, z ):
+        transform = self.reglarization[i][0]
+        return z if transform is None else transform.forward(z)
+
+    # 2A^H A x + rho*sum_i T_i^H T_i x
+    def _lhs( self, x, rho ):
+        y = 2.0 * apply_opt(self.Aopt, 'normal', x)
+        for i in range(self.Nreg):
+            y += rho * self._TH(i, self._T(i, x))
+        return y
+
+    # linear conjugate gradient for the x-update, warm start at x, one normal of A per iteration
+    # if all T_i are identity or unitary the lhs is 2A^H A + rho*Nreg*I, solved exactly by A.solve_normal() if it exists
+    def _xupdate( self, x, rhs, rho, cg_Nite, cg_tol ):
+        solve = getattr(self.Aopt, 'solve_normal', None)
+        if solve is not None and all(t is None or getattr(t, 'unitary', False) for t, _, _ in self.reglarization):
+            return solve(rho * self.Nreg / 2.0, rhs / 2.0)
+        return linear_cg(lambda xi: self._lhs(xi, rho), rhs, x, cg_Nite, cg_tol)
+
+    # z/u update of regularization i, returns squared norms for the residuals
+    def _zupdate( self, i, Tx, z, u, rho, alpha ):
+        prox, weight = self.reglarization[i][1:]
+        Tx_hat = alpha * Tx + (1.0 - alpha) * z
+        z_new  = prox(Tx_hat + u, weight / rho)
+        u_new  = u + Tx_hat - z_new
+        return z_new, u_new, np.linalg.norm(Tx - z_new) ** 2, np.linalg.norm(z_new - z) ** 2,\
+               np.linalg.norm(Tx) ** 2, np.linalg.norm(z_new) ** 2, np.linalg.norm(u_new) ** 2
 
-    def ADMM( self, param )
-        pass
+    """
+    x0 is the initial image, A^H b/||A||^2 like invAfunc(b) if None
+    rho is the initial penalty, alpha the over-relaxation, cg_Nite the CG iterations per x-update,
+    threads is the number of threads for the z-updates, None for one per regularization,
+    one thread under the workqueue threading layer of numba,
+    telemetry (utilities_class.telemetry) records the residuals and rho of each iteration
+    """
+    def ADMM( self, x0 = None, rho = 1.0, Nite = 100, alpha = 1.6, cg_Nite = 5, cg_tol = 1e-6,\
+              eps_abs = 1e-5, eps_rel = 1e-3, adaptive_rho = True, mu = 10.0, tau = 2.0,\
+              threads = None, telemetry = None ):
+        Ahb = apply_opt(self.Aopt, 'adjoint', self.b)
+        if x0 is None:
+            x = apply_opt(self.Aopt, 'backward', self.b)
+        else:
+            x = x0.copy()
+        z = [self._T(i, x) for i in range(self.Nreg)]
+        u = [np.zeros_like(zi) for zi in z]
+        n = x.size
+        p = sum(zi.size for zi in z)
+        if threads is None:
+            threads = self.Nreg
+        if threads > 1 and self.Nreg > 1 and numba_threadsafe():
+            pool = ThreadPool(threads)
+        else:
+            pool = None
+        self.history = []
+        try:
+            for k in range(Nite):
+                rhs = 2.0 * Ahb
+                for i in range(self.Nreg):
+                    rhs += rho * self._TH(i, z[i] - u[i])
+                x  = self._xupdate(x, rhs, rho, cg_Nite, cg_tol)
+                Tx = [self._T(i, x) for i in range(self.Nreg)]
+                args = [(i, Tx[i], z[i], u[i], rho, alpha) for i in range(self.Nreg)]
+                if pool is None:
+                    res = [self._zupdate(*a) for a in args]
+                else:
+                    res = pool.map(lambda a: self._zupdate(*a), args)
+                z = [r[0] for r in res]
+                u = [r[1] for r in res]
+                rnorm, snorm, Txnorm, znorm, unorm = [np.sqrt(sum(r[j] for r in res)) for j in range(2, 7)]
+                snorm   = rho * snorm
+                eps_pri = np.sqrt(p) * eps_abs + eps_rel * max(Txnorm, znorm)
+                eps_dua = np.sqrt(n) * eps_abs + eps_rel * rho * unorm
+                self.history.append((rnorm, snorm, rho))
+                if telemetry is not None:
+                    telemetry.record(k, residual = rnorm, dual_residual = snorm, rho = rho)
+                if rnorm < eps_pri and snorm < eps_dua:
+                    break
+                if adaptive_rho:
+                    #balance the residuals relative to their tolerances, Wohlberg 2017
+                    rrel = rnorm / max(Txnorm, znorm, 1e-30)
+                    srel = snorm / max(rho * unorm, 1e-30)
+                    if rrel > mu * srel:
+                        rho = rho * tau
+                        u   = [ui / tau for ui in u]
+                    elif srel > mu * rrel:
+                        rho = rho / tau
+                        u   = [ui * tau for ui in u]
+        finally:
+            if pool is not None:
+                pool.close()
+        return x
 
     #def CG( self, param )
         #pass
@@ -0,0 +1,117 @@
+import numpy as np
+import scipy.sparse.linalg
+from pics.linop_class import LinearOperator, to_out
+"""
+block Hankel matrix of hankel_func.hankelnd_r(a, win_shape) flattened to (prod(win_shape), prod(moves)),
+H[p, q] = a[p + q], p is the index in the window, q the movement of the window, moves = a.shape - win_shape + 1,
+applied without forming H, which has prod(win_shape) copies of the data (e.g. the espirit calibration k-space)
+
+H*v   (v over the moves, u over the window), u[p] = sum_q a[p+q] v[q], a correlation of a with v
+H^H*u v[q] = sum_p conj(a[p+q]) u[p]
+both are done with ffts of the size of a, p + q < a.shape so the circular correlation has no wrap around,
+the fft of a is computed once, the memory is a few arrays of the size of a (times the number of vectors)
+
+average(U, s, Vh) is the inverse of hankelnd_r for a low rank matrix U*diag(s)*Vh, the average over the
+entries of the same p + q (an averaging invhankelnd), sum_r s_r*conv(U[:, r], Vh[r, :]) divided by the counts,
+also with ffts, without forming the matrix
+
+the vectors can be flattened (prod(moves),) or shaped as moves, with an optional last axis of vectors,
+aslinearoperator() gives the scipy LinearOperator for scipy.sparse.linalg.svds or low_rank/svd_func.py
+
+usage:
+hop = Hankelnd_r(xcrop, (6, 6, 1))      #xcrop is nx, ny, ncoil, the window is 1 along the coils
+U, s, Vh = lr.low_rank_svd(hop.aslinearoperator(), 150)
+"""
+class Hankelnd_r( LinearOperator ):
+    "this apply the block Hankel matrix of the data a and its adjoint with ffts"
+    def __init__( self, a, win_shape ):
+        self.win_shape  = tuple(int(w) for w in win_shape)
+        self.set_data(a)
+
+    # new data of the same shape, e.g. in an iterative low rank prox
+    def set_data( self, a ):
+        self.a          = a
+        self.a_shape    = a.shape
+        self.move_shape = tuple(n - w + 1 for n, w in zip(a.shape, self.win_shape))
+        self.ishape     = self.move_shape
+        self.oshape     = self.win_shape
+        self.shape      = (int(np.prod(self.win_shape)), int(np.prod(self.move_shape)))
+        self.axes       = tuple(range(a.ndim))
+        self.a_f        = np.fft.fftn(a, axes = self.axes)
+        self.dtype      = self.a_f.dtype
+        self._count     = None
+
+    # v as (vectors) + vshape, from the flattened (prod(vshape), vectors) or the shaped vshape + (vectors),
+    # the vectors are put first so each fft is over contiguous data
+    def _split( self, v, vshape ):
+        size = int(np.prod(vshape))
+        flat = v.ndim <= 2 and v.shape[0] == size and v.shape[:len(vshape)] != vshape
+        if flat:
+            v = v.reshape(vshape + v.shape[1:])
+        batch = v.shape[len(vshape):]
+        return np.moveaxis(v, tuple(range(len(vshape))), tuple(range(len(batch), v.ndim))), batch, flat
+
+    # move the vectors back to the last axes, flattened if the input was
+    def _join( self, res, batch, flat, size ):
+        res = np.moveaxis(res, tuple(range(len(batch))), tuple(range(res.ndim - len(batch), res.ndim)))
+        if flat:
+            res = res.reshape((size,) + batch)
+        return res
+
+    # zero pad v (batch + vshape) to the shape of a, returns its fft
+    def _fft_pad( self, v, vshape, batch ):
+        pad = np.zeros(batch + self.a_shape, dtype = self.dtype)
+        pad[(Ellipsis,) + tuple(slice(0, n) for n in vshape)] = v
+        return np.fft.fftn(pad, axes = self._axes(batch))
+
+    def _axes( self, batch ):
+        return tuple(range(len(batch), len(batch) + len(self.a_shape)))
+
+    # sum_q a[p+q] w[q] for p in out_shape, w given by its fft
+    def _corr( self, w_f, batch, out_shape ):
+        c = np.fft.ifftn(self.a_f * np.conj(w_f), axes = self._axes(batch))
+        return c[(Ellipsis,) + tuple(slice(0, n) for n in out_shape)]
+
+    # H*v, v over the moves
+    def forward( self, v, out = None ):
+        v, batch, flat = self._split(v, self.move_shape)
+        res = self._corr(self._fft_pad(np.conj(v), self.move_shape, batch), batch, self.win_shape)
+        return to_out(self._join(res, batch, flat, self.shape[0]), out)
+
+    # H^H*u, u over the window
+    def adjoint( self, u, out = None ):
+        u, batch, flat = self._split(u, self.win_shape)
+        res = np.conj(self._corr(self._fft_pad(u, self.win_shape, batch), batch, self.move_shape))
+        return to_out(self._join(res, batch, flat, self.shape[1]), out)
+
+    def backward( self, u, out = None ):
+        return self.adjoint(u, out = out)
+
+    # number of (p, q) with p + q at each position of a
+    def count( self ):
+        if self._count is None:
+            ones_w = np.zeros(self.a_shape)
+            ones_m = np.zeros(self.a_shape)
+            ones_w[tuple(slice(0, n) for n in self.win_shape)]  = 1.0
+            ones_m[tuple(slice(0, n) for n in self.move_shape)] = 1.0
+            c = np.fft.ifftn(np.fft.fftn(ones_w) * np.fft.fftn(ones_m)).real
+            self._count = np.maximum(np.round(c), 1.0)
+        return self._count
+
+    # average of the anti diagonals of U*diag(s)*Vh, U is (prod(win), k), Vh is (k, prod(moves))
+    def average( self, U, s, Vh ):
+        k = (len(s),)
+        U_f  = self._fft_pad((np.asarray(U) * s).T.reshape(k + self.win_shape), self.win_shape, k)
+        V_f  = self._fft_pad(np.asarray(Vh).reshape(k + self.move_shape), self.move_shape, k)
+        conv = np.fft.ifftn(np.sum(U_f * V_f, axis = 0), axes = self.axes)
+        return conv / self.count()
+
+    # dense matrix, as hankelnd_r(a, win_shape).reshape(prod(win), prod(moves))
+    def todense( self ):
+        a = np.ascontiguousarray(self.a)
+        h = np.lib.stride_tricks.as_strided(a, shape = self.win_shape + self.move_shape, strides = a.strides * 2)
+        return h.reshape(self.shape)
+
+    def aslinearoperator( self ):
+        return scipy.sparse.linalg.LinearOperator(self.shape, matvec = self.forward, rmatvec = self.adjoint,\
+               matmat = self.forward, rmatmat = self.adjoint, dtype = self.dtype)
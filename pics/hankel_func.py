@@ -1,3 +1,4 @@
+from __future__ import print_function
 import numpy as np
 """
 hankel1d
@@ -39,7 +40,7 @@ def invhankel1d(h, a, win_w, step_w = 1):
     #strides define the moving steps along each dim of the block hankel matrix
     #strides: step_of__moving, step_1_each_item
     bh_strides = (step_w*a.itemsize, a.itemsize)
-    print bh_shape, bh_strides
+    print(bh_shape, bh_strides)
     np.lib.stride_tricks.as_strided(a, shape=bh_shape, strides=bh_strides)[:] = h
     return a
 
@@ -232,10 +233,10 @@ def test():
 
     #test hankelnd
     a = np.arange(4*5*6).reshape(4,5,6)
-    print a
+    print(a)
     h = hankelnd(a, (2, 3, 4))
     invh = np.zeros(a.shape)
-    print invhankelnd(h,invh,(2,3,4))
+    print(invhankelnd(h,invh,(2,3,4)))
 
 #if __name__ == "__main__":
     #test()
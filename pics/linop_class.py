@@ -0,0 +1,310 @@
+import numpy as np
+import abc
+"""
+base class of the linear operators used in CS MRI recon, and the classes that combine them
+
+the operators follow the forward/backward convention of operators_class.py,
+forward is the operator A, e.g. image -> k-space for fft, coefficients -> image for dwt,
+backward is the inverse or adjoint used by the older solvers (ifft is A^H/n for the unnormalized fft),
+adjoint is the exact A^H, it is backward by default and the operators where backward is scaled override it,
+normal is A^H A, adjoint(forward(x)) by default, operators that have a cheaper fused path override it,
+e.g. masked fft: one fft, |mask|^2 and one ifft; coil sensitivity: x*sum(|sens|^2)
+
+the combined operators (composition, sum, scaling, stack) build backward from the backward of their operands
+with the same formula as their adjoint, (A + B).backward = A.backward + B.backward,
+(alpha*A).backward = conj(alpha)*A.backward, (B A).backward = A.backward B.backward, so (A + A).backward is
+(2*A).backward, it is the inverse only when the operands' backward are inverses and the combination is unitary
+
+forward, backward, adjoint and normal take an optional out array, the combined operators keep their
+intermediate arrays between calls (keyed on input shape and dtype), so iterating a chain does not
+allocate a new intermediate for each operator each time
+
+usage:
+Aopt = FTm * esp               #composition, esp is applied first, as joint2operators(esp, FTm)
+Bopt = 0.5 * tvop              #scaling
+Copt = Aopt + Bopt             #sum, the operators must have the same input and output shapes
+Dopt = StackedOperator([tvop.H, dwt.H])  #image -> [gradient, wavelet coefficients], adjoint sums over the list
+x = Aopt.normal(im)            #FTm.normal() is used inside, esp^H (F^H M F) esp im
+
+forward and backward are abstract, a subclass that does not define them can not be instantiated
+"""
+class LinearOperator( abc.ABC ):
+    "this is the base class of linear operators for CS MRI recon"
+    ishape = None #input shape, None if the operator applies to any shape
+    oshape = None #output shape
+    dtype  = None #data type, None if it follows the input
+    unitary = False #A^H A = A A^H = I
+    __array_ufunc__ = None #ndarray * operator calls __rmul__ of the operator, not an elementwise product
+    solve_normal = None #solve_normal(rho, rhs) is (A^H A + rho*I)^-1 rhs if the operator has an exact inverse
+
+    @abc.abstractmethod
+    def forward( self, x, out = None ):
+        pass
+
+    @abc.abstractmethod
+    def backward( self, y, out = None ):
+        pass
+
+    # exact adjoint A^H
+    def adjoint( self, y, out = None ):
+        return self.backward(y, out = out)
+
+    # A^H A
+    def normal( self, x, out = None ):
+        return self.adjoint(self.forward(x), out = out)
+
+    # self * other is the composition, other is applied first; self * scalar is scaling
+    def __mul__( self, other ):
+        if np.isscalar(other):
+            return ScaledOperator(other, self)
+        return ComposedOperator([_check_operator(other), self])
+
+    def __rmul__( self, other ):
+        if np.isscalar(other):
+            return ScaledOperator(other, self)
+        _check_operator(other)
+        return NotImplemented
+
+    def __add__( self, other ):
+        return SumOperator([self, _check_operator(other)])
+
+    def __sub__( self, other ):
+        return SumOperator([self, ScaledOperator(-1.0, _check_operator(other))])
+
+    def __neg__( self ):
+        return ScaledOperator(-1.0, self)
+
+    # adjoint operator A^H, e.g. tvop.H.forward(im) is the gradient
+    @property
+    def H( self ):
+        return AdjointOperator(self)
+
+"""
+helpers for operators written without the base class (e.g. only forward and backward defined),
+and without the out argument
+"""
+# operators without the base class need forward and backward, arrays are not operators
+def _check_operator( op ):
+    if isinstance(op, LinearOperator) or \
+       (not isinstance(op, np.ndarray) and hasattr(op, 'forward') and hasattr(op, 'backward')):
+        return op
+    raise TypeError("{0} is not a linear operator, use a scalar or an operator".format(type(op).__name__))
+
+# copy res to out if out is given
+def to_out( res, out ):
+    if out is None or res is out:
+        return res
+    out[...] = res
+    return out
+
+# call op.name(x), with out if op supports it
+def apply_opt( op, name, x, out = None ):
+    if isinstance(op, LinearOperator):
+        return getattr(op, name)(x, out = out)
+    if name == 'adjoint' and not hasattr(op, 'adjoint'):
+        name = 'backward'
+    if name == 'normal' and not hasattr(op, 'normal'):
+        return to_out(apply_opt(op, 'adjoint', op.forward(x)), out)
+    return to_out(getattr(op, name)(x), out)
+
+# the output array of a stage is reused if it is a new array which the next call can write into
+def _reusable( y, x ):
+    return isinstance(y, np.ndarray) and y is not x and y.base is None
+
+"""
+A^H as an operator, forward is the adjoint of A and adjoint is the forward of A,
+backward is also the forward of A, which is the adjoint (not the inverse)
+"""
+class AdjointOperator( LinearOperator ):
+    "this apply the adjoint of an operator"
+    def __init__( self, op ):
+        self.op     = op
+        self.ishape = getattr(op, 'oshape', None)
+        self.oshape = getattr(op, 'ishape', None)
+        self.dtype  = getattr(op, 'dtype', None)
+
+    def forward( self, y, out = None ):
+        return apply_opt(self.op, 'adjoint', y, out)
+
+    def backward( self, x, out = None ):
+        return apply_opt(self.op, 'forward', x, out)
+
+"""
+composition, ops are in the order they are applied, ComposedOperator([A, B]).forward(x) = B(A(x))
+the adjoint goes through the list in reverse, normal is A^H (B^H B) A with the fused normal of the last operator
+"""
+class ComposedOperator( LinearOperator ):
+    "this apply a list of operators one after another"
+    def __init__( self, ops ):
+        self.ops     = list(ops)
+        self.ishape  = getattr(self.ops[0], 'ishape', None)
+        self.oshape  = getattr(self.ops[-1], 'oshape', None)
+        self.dtype   = getattr(self.ops[-1], 'dtype', None)
+        self.buffers = {} #intermediate arrays for each (method, shape, dtype) of the input
+
+    # apply the list of (op, method name), intermediates are written into the cached buffers
+    def _chain( self, tag, stages, x, out ):
+        key  = (tag, np.shape(x), getattr(x, 'dtype', None))
+        bufs = self.buffers.get(key)
+        n    = len(stages)
+        y    = x
+        if bufs is None:
+            #first call, the operators allocate the intermediates, keep arrays of the same shapes
+            bufs = []
+            for i, (op, name) in enumerate(stages):
+                yin = y
+                y   = apply_opt(op, name, yin, out if i == n - 1 else None)
+                if i < n - 1:
+                    bufs.append(np.empty_like(y) if _reusable(y, yin) else None)
+            self.buffers[key] = bufs
+        else:
+            for i, (op, name) in enumerate(stages):
+                y = apply_opt(op, name, y, out if i == n - 1 else bufs[i])
+        if out is None and any(y is b for b in bufs):
+            y = y.copy()#do not return the buffer to the caller
+        return y
+
+    def forward( self, x, out = None ):
+        return self._chain('forward', [(op, 'forward') for op in self.ops], x, out)
+
+    def backward( self, y, out = None ):
+        return self._chain('backward', [(op, 'backward') for op in self.ops[::-1]], y, out)
+
+    def adjoint( self, y, out = None ):
+        return self._chain('adjoint', [(op, 'adjoint') for op in self.ops[::-1]], y, out)
+
+    def normal( self, x, out = None ):
+        stages = [(op, 'forward') for op in self.ops[:-1]] + [(self.ops[-1], 'normal')] \
+               + [(op, 'adjoint') for op in self.ops[-2::-1]]
+        return self._chain('normal', stages, x, out)
+
+    # exact solve if the operators before the last one are unitary and the last has solve_normal,
+    # (B U)^H (B U) + rho*I = U^H (B^H B + rho*I) U
+    @property
+    def solve_normal( self ):
+        if getattr(self.ops[-1], 'solve_normal', None) is None or \
+           not all(getattr(op, 'unitary', False) for op in self.ops[:-1]):
+            return None
+        return self._solve_normal
+
+    def _solve_normal( self, rho, rhs, out = None, adjoint = True ):
+        y = rhs
+        for op in self.ops[:-1]:
+            y = apply_opt(op, 'forward', y)
+        y = self.ops[-1].solve_normal(rho, y, adjoint = adjoint)
+        for op in self.ops[-2::-1]:
+            y = apply_opt(op, 'adjoint', y)
+        return to_out(y, out)
+
+"""
+sum of operators with the same input and output shapes
+"""
+class SumOperator( LinearOperator ):
+    "this apply the sum of operators"
+    def __init__( self, ops ):
+        self.ops     = list(ops)
+        self.ishape  = getattr(self.ops[0], 'ishape', None)
+        self.oshape  = getattr(self.ops[0], 'oshape', None)
+        self.dtype   = getattr(self.ops[0], 'dtype', None)
+        self.buffers = {}
+
+    def _sum( self, name, x, out ):
+        y = apply_opt(self.ops[0], name, x, out)
+        if out is not None:
+            y = to_out(y, out)#also when the operator returns x or ignores out
+        elif y is x:
+            y = y.copy()
+        key = (name, np.shape(x), getattr(x, 'dtype', None))
+        for op in self.ops[1:]:
+            buf = self.buffers.get(key)
+            z   = apply_opt(op, name, x, buf)
+            if buf is None and _reusable(z, x):
+                self.buffers[key] = z
+            y += z
+        return y
+
+    def forward( self, x, out = None ):
+        return self._sum('forward', x, out)
+
+    def backward( self, y, out = None ):
+        return self._sum('backward', y, out)
+
+    def adjoint( self, y, out = None ):
+        return self._sum('adjoint', y, out)
+
+"""
+alpha * A, the normal keeps the fused normal of A
+"""
+class ScaledOperator( LinearOperator ):
+    "this apply a scalar times an operator"
+    def __init__( self, alpha, op ):
+        self.alpha  = alpha
+        self.op     = op
+        self.ishape = getattr(op, 'ishape', None)
+        self.oshape = getattr(op, 'oshape', None)
+        self.dtype  = getattr(op, 'dtype', None)
+
+    def _scale( self, name, x, alpha, out ):
+        y = apply_opt(self.op, name, x, out)
+        if out is not None:
+            return np.multiply(y, alpha, out = out)#also when the operator returns x or ignores out
+        if y is x:
+            return np.multiply(y, alpha)
+        return np.multiply(y, alpha, out = y)
+
+    def forward( self, x, out = None ):
+        return self._scale('forward', x, self.alpha, out)
+
+    # conj(alpha)*backward(A), as the adjoint
+    def backward( self, y, out = None ):
+        return self._scale('backward', y, np.conj(self.alpha), out)
+
+    def adjoint( self, y, out = None ):
+        return self._scale('adjoint', y, np.conj(self.alpha), out)
+
+    def normal( self, x, out = None ):
+        return self._scale('normal', x, np.abs(self.alpha) ** 2, out)
+
+"""
+stack of operators applied to the same input, e.g. several regularization transforms,
+forward returns a list with one output for each operator, adjoint takes the list and sums,
+normal is the sum of the (fused) normals
+"""
+class StackedOperator( LinearOperator ):
+    "this apply a list of operators to the same input"
+    def __init__( self, ops ):
+        self.ops     = list(ops)
+        self.ishape  = getattr(self.ops[0], 'ishape', None)
+        self.oshape  = [getattr(op, 'oshape', None) for op in self.ops]
+        self.dtype   = getattr(self.ops[0], 'dtype', None)
+        self.buffers = {}
+
+    def forward( self, x, out = None ):
+        if out is None:
+            out = [None] * len(self.ops)
+        return [apply_opt(op, 'forward', x, o) for op, o in zip(self.ops, out)]
+
+    def _sum( self, name, ys, out ):
+        y = apply_opt(self.ops[0], name, ys[0], out)
+        if out is not None:
+            y = to_out(y, out)
+        elif y is ys[0]:
+            y = y.copy()
+        for i in range(1, len(self.ops)):
+            key = (name, i, np.shape(ys[i]), getattr(ys[i], 'dtype', None))
+            buf = self.buffers.get(key)
+            z   = apply_opt(self.ops[i], name, ys[i], buf)
+            if buf is None and _reusable(z, ys[i]):
+                self.buffers[key] = z
+            y += z
+        return y
+
+    # backward is the least squares inverse only for a single operator, here it is the sum as the adjoint
+    def backward( self, ys, out = None ):
+        return self._sum('backward', ys, out)
+
+    def adjoint( self, ys, out = None ):
+        return self._sum('adjoint', ys, out)
+
+    def normal( self, x, out = None ):
+        return self._sum('normal', [x] * len(self.ops), out)
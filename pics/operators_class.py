@@ -3,7 +3,8 @@ import dwt.dwt_func as dwt_func
 import scipy.io as sio
 #from fft.cufft import fftnc2c_cuda, ifftnc2c_cuda
 import fft.fftw_func as fftw
-from utilities.utilities_func import dim_match
+from utilities.utilities_func import dim_match, complex_dtype, padnd
+from pics.linop_class import LinearOperator, ComposedOperator, to_out
 class data_class:
     def __init__( self, data, dims_name ):
         self.dims_name = dims_name
@@ -31,264 +32,413 @@ these classes apply  FFT for the input image,
 the order is 
 k-space -> image for forward; 
 image -> k-space is backward
+the output has the precision of the input, complex64 in complex64 out,
+numpy.fft may compute in double precision, the result is cast back by complex_dtype()
+
+the fftshift/ifftshift around the fft are folded into phase modulations before and after the fft,
+see fftw.centered_phase(), for even sizes these are +/-1 checkerboards, for the masked operators
+the mask is folded into the phase after the fft, forward/backward take an optional out array
+
+the classes derive from linop_class.LinearOperator, backward is ifft (A^H/n), adjoint is the exact n*ifft
+with conj(mask), and normal is the fused A^H A: fft, |mask|^2 and ifft with one multiplication between them,
+there is no backward -> mask -> forward round trip, and without mask it is n times the input
 """
 #2d fft
-class FFT2d:
+class FFT2d( LinearOperator ):
     "this is 2d FFT without k-space mask for CS MRI recon"
     def __init__( self, axes = (0,1)):
         #self.mask = mask #save the k-space mask
         self.axes = axes    
+        self.phase = {} #phases of adjoint and normal, for each (shape, dtype)
     # let's call k-space <- image as forward
-    def forward( self, im ):
-        im = np.fft.fftshift(im,self.axes)        
-        ksp = np.fft.fft2(im,s=None,axes=self.axes)
-        ksp = np.fft.ifftshift(ksp,self.axes)
-        return ksp
+    def forward( self, im, out = None ):
+        pre, post = fftw.centered_phase(im.shape, self.axes, complex_dtype(im.dtype))
+        ksp = np.fft.fft2(np.multiply(im, pre), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(ksp.shape, dtype = complex_dtype(im.dtype))
+        return np.multiply(ksp, post, out = out)
 
     # let's call image <- k-space as backward
-    def backward( self, ksp ):
-        ksp = np.fft.fftshift(ksp,self.axes)
-        #im = np.fft.ifft2(ksp,s=None,axes=(0,1))#noted that numpy.fft by default applies to last two dims
-        im = np.fft.ifft2(ksp,s=None,axes=self.axes)
-        im = np.fft.ifftshift(im,self.axes)
-        return im
+    def backward( self, ksp, out = None ):
+        pre, post = fftw.centered_phase(ksp.shape, self.axes, complex_dtype(ksp.dtype), inverse = True)
+        #noted that numpy.fft by default applies to last two dims
+        im = np.fft.ifft2(np.multiply(ksp, pre), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(im.shape, dtype = complex_dtype(ksp.dtype))
+        return np.multiply(im, post, out = out)
+
+    # exact adjoint, n*ifft(ksp)
+    def adjoint( self, ksp, out = None ):
+        pre, post = _adjoint_phase(self.phase, None, ksp.shape, self.axes, complex_dtype(ksp.dtype))
+        im = np.fft.ifft2(np.multiply(ksp, pre), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(im.shape, dtype = complex_dtype(ksp.dtype))
+        return np.multiply(im, post, out = out)
+
+    # A^H A of the unnormalized fft is n times identity
+    def normal( self, im, out = None ):
+        return np.multiply(im, _fft_size(im.shape, self.axes), out = out, dtype = complex_dtype(im.dtype))
+
+    # exact solve of (A^H A + rho*I) x = rhs, rhs/(n+rho), or rhs/(1+rho) for (backward(forward(x)) + rho*x) = rhs
+    def solve_normal( self, rho, rhs, out = None, adjoint = True ):
+        n = _fft_size(rhs.shape, self.axes) if adjoint else 1
+        return np.divide(rhs, n + rho, out = out, dtype = complex_dtype(rhs.dtype))
 
 #2d fft with mask
-class FFT2d_kmask:
+class FFT2d_kmask( LinearOperator ):
     "this is 2d FFT with k-space mask for CS MRI recon"
     def __init__( self, mask, axes=(0,1) ):
         self.mask = mask #save the k-space mask
-        self.axes = axes        
+        self.axes = axes
+        self.phase = {} #phases of adjoint and normal, for each (shape, dtype)
+        self.post_mask = {} #phase after fft times mask, for each (shape, dtype)
     # let's call k-space <- image as forward
-    def forward( self, im ):
-        im   = np.fft.fftshift(im,self.axes)         
-        ksp  = np.fft.fft2(im,s=None,axes=self.axes)
-        ksp  = np.fft.ifftshift(ksp,self.axes)
-        #try to match the dims of ksp and mask
-        if len(ksp.shape) is not len(self.mask.shape):
-            #try to match the dimensions of ksp and mask
-            ksp_out_shape, mask_out_shape = dim_match(ksp.shape, self.mask.shape)
-            mksp = np.multiply(ksp.reshape(ksp_out_shape),\
-                         self.mask.reshape(mask_out_shape))#apply mask
-        else:
-            mksp = np.multiply(ksp,self.mask)#apply mask
-        return mksp
+    def forward( self, im, out = None ):
+        pre, post = fftw.centered_phase(im.shape, self.axes, complex_dtype(im.dtype))
+        post = _fold_mask(self.post_mask, self.mask, post)
+        ksp  = np.fft.fft2(np.multiply(im, pre), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(ksp.shape, dtype = complex_dtype(im.dtype))
+        return np.multiply(ksp, post, out = out)#apply mask
 
     # let's call image <- k-space as backward
-    def backward( self, ksp ):
-        """
-        #try to match the dims of ksp and mask
-        if len(ksp.shape) is not len(self.mask.shape):
-            #try to match the dimensions of ksp and mask
-            ksp_out_shape, mask_out_shape = dim_match(ksp.shape, self.mask.shape)
-            mksp = np.multiply(ksp.reshape(ksp_out_shape),\
-                         self.mask.reshape(mask_out_shape))#apply mask
-        else:
-            mksp = np.multiply(ksp,self.mask)#apply mask
-        """
-        ksp = np.fft.fftshift(ksp,self.axes)
-        im = np.fft.ifft2(ksp,s=None,axes=self.axes)
-        #im = np.fft.ifft2(ksp,s=None,axes=self.axes)
-        im = np.fft.ifftshift(im,self.axes)
-        return im
+    def backward( self, ksp, out = None ):
+        pre, post = fftw.centered_phase(ksp.shape, self.axes, complex_dtype(ksp.dtype), inverse = True)
+        im = np.fft.ifft2(np.multiply(ksp, pre), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(im.shape, dtype = complex_dtype(ksp.dtype))
+        return np.multiply(im, post, out = out)
+
+    # exact adjoint, n*ifft(conj(mask)*ksp), n and the mask are folded into the phase before the ifft
+    def adjoint( self, ksp, out = None ):
+        pre, post = _adjoint_phase(self.phase, self.mask, ksp.shape, self.axes, complex_dtype(ksp.dtype))
+        im = np.fft.ifft2(np.multiply(ksp, pre), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(im.shape, dtype = complex_dtype(ksp.dtype))
+        return np.multiply(im, post, out = out)
+
+    # fused normal, n*ifft(|mask|^2*fft(im)), the phases, mask and n between the ffts are one multiplication
+    def normal( self, im, out = None ):
+        pre, mid, post = _normal_phase(self.phase, self.mask, im.shape, self.axes, complex_dtype(im.dtype))
+        ksp = np.fft.fft2(np.multiply(im, pre), s=None, axes=self.axes)
+        im  = np.fft.ifft2(np.multiply(ksp, mid, out = ksp), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(im.shape, dtype = complex_dtype(ksp.dtype))
+        return np.multiply(im, post, out = out)
+
+    # exact solve of (A^H A + rho*I) x = rhs, diagonal in k-space, ifft(fft(rhs)/(n*|mask|^2+rho))
+    # adjoint = False solves (backward(forward(x)) + rho*x) = rhs, ifft(fft(rhs)/(mask+rho))
+    def solve_normal( self, rho, rhs, out = None, adjoint = True ):
+        pre, mid, post = _solve_phase(self.phase, self.mask, rhs.shape, self.axes, complex_dtype(rhs.dtype), rho, adjoint)
+        ksp = np.fft.fft2(np.multiply(rhs, pre), s=None, axes=self.axes)
+        im  = np.fft.ifft2(np.multiply(ksp, mid, out = ksp), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(im.shape, dtype = complex_dtype(ksp.dtype))
+        return np.multiply(im, post, out = out)
 
 #nd fft, default is 3d
-class FFTnd:
+class FFTnd( LinearOperator ):
     "this is ndim FFT without k-space mask for CS MRI recon"
     def __init__( self, axes = (0,1,2)):
         #self.mask = mask #save the k-space mask
         self.axes = axes
+        self.phase = {} #phases of adjoint and normal, for each (shape, dtype)
 
     # let's call k-space <- image as forward
-    def forward( self, im ):
-        im  = np.fft.fftshift(im,self.axes)                
-        ksp = np.fft.fftn(im,s=None,axes=self.axes)
-        ksp = np.fft.ifftshift(ksp,self.axes)        
-        return ksp
+    def forward( self, im, out = None ):
+        pre, post = fftw.centered_phase(im.shape, self.axes, complex_dtype(im.dtype))
+        ksp = np.fft.fftn(np.multiply(im, pre), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(ksp.shape, dtype = complex_dtype(im.dtype))
+        return np.multiply(ksp, post, out = out)
 
     # let's call image <- k-space as backward
-    def backward( self, ksp ):
-        ksp = np.fft.fftshift(ksp,self.axes)
-        #im = np.fft.ifftn(ksp,s=None,axes=self.axes) 
-        im = np.fft.ifftn(ksp,s=None,axes=self.axes)
-        im = np.fft.ifftshift(im,self.axes)               
-        return im
+    def backward( self, ksp, out = None ):
+        pre, post = fftw.centered_phase(ksp.shape, self.axes, complex_dtype(ksp.dtype), inverse = True)
+        im = np.fft.ifftn(np.multiply(ksp, pre), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(im.shape, dtype = complex_dtype(ksp.dtype))
+        return np.multiply(im, post, out = out)
+
+    # exact adjoint, n*ifft(ksp)
+    def adjoint( self, ksp, out = None ):
+        pre, post = _adjoint_phase(self.phase, None, ksp.shape, self.axes, complex_dtype(ksp.dtype))
+        im = np.fft.ifftn(np.multiply(ksp, pre), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(im.shape, dtype = complex_dtype(ksp.dtype))
+        return np.multiply(im, post, out = out)
+
+    # A^H A of the unnormalized fft is n times identity
+    def normal( self, im, out = None ):
+        return np.multiply(im, _fft_size(im.shape, self.axes), out = out, dtype = complex_dtype(im.dtype))
+
+    # exact solve of (A^H A + rho*I) x = rhs, rhs/(n+rho), or rhs/(1+rho) for (backward(forward(x)) + rho*x) = rhs
+    def solve_normal( self, rho, rhs, out = None, adjoint = True ):
+        n = _fft_size(rhs.shape, self.axes) if adjoint else 1
+        return np.divide(rhs, n + rho, out = out, dtype = complex_dtype(rhs.dtype))
 
 #nd fft with mask
-class FFTnd_kmask:
+class FFTnd_kmask( LinearOperator ):
     "this is ndim FFT with k-space mask for CS MRI recon"
     def __init__( self, mask, axes = (0,1,2)):
         self.mask = mask #save the k-space mask
         self.axes = axes
+        self.phase = {} #phases of adjoint and normal, for each (shape, dtype)
+        self.post_mask = {} #phase after fft times mask, for each (shape, dtype)
 
     # let's call k-space <- image as forward
-    def forward( self, im ):
-        im  = np.fft.fftshift(im,self.axes)         
-        ksp = np.fft.fftn(im,s=None,axes=self.axes)
-        ksp = np.fft.ifftshift(ksp,self.axes)
-        #return np.multiply(ksp,self.mask)
-        #try to match the dims of ksp and mask
-        if len(ksp.shape) is not len(self.mask.shape):
-            #try to match the dimensions of ksp and mask
-            ksp_out_shape, mask_out_shape = dim_match(ksp.shape, self.mask.shape)
-            mksp = np.multiply(ksp.reshape(ksp_out_shape),\
-                         self.mask.reshape(mask_out_shape))#apply mask
-        else:
-            mksp = np.multiply(ksp,self.mask)#apply mask
-        return mksp
+    def forward( self, im, out = None ):
+        pre, post = fftw.centered_phase(im.shape, self.axes, complex_dtype(im.dtype))
+        post = _fold_mask(self.post_mask, self.mask, post)
+        ksp  = np.fft.fftn(np.multiply(im, pre), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(ksp.shape, dtype = complex_dtype(im.dtype))
+        return np.multiply(ksp, post, out = out)#apply mask
 
     # let's call image <- k-space as backward
-    def backward( self, ksp ):
-        """
-        #try to match the dims of ksp and mask
-        if len(ksp.shape) is not len(self.mask.shape):
-            #try to match the dimensions of ksp and mask
-            ksp_out_shape, mask_out_shape = dim_match(ksp.shape, self.mask.shape)
-            mksp = np.multiply(ksp.reshape(ksp_out_shape),\
-                         self.mask.reshape(mask_out_shape))#apply mask
+    def backward( self, ksp, out = None ):
+        pre, post = fftw.centered_phase(ksp.shape, self.axes, complex_dtype(ksp.dtype), inverse = True)
+        im = np.fft.ifftn(np.multiply(ksp, pre), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(im.shape, dtype = complex_dtype(ksp.dtype))
+        return np.multiply(im, post, out = out)
+
+    # exact adjoint, n*ifft(conj(mask)*ksp), n and the mask are folded into the phase before the ifft
+    def adjoint( self, ksp, out = None ):
+        pre, post = _adjoint_phase(self.phase, self.mask, ksp.shape, self.axes, complex_dtype(ksp.dtype))
+        im = np.fft.ifftn(np.multiply(ksp, pre), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(im.shape, dtype = complex_dtype(ksp.dtype))
+        return np.multiply(im, post, out = out)
+
+    # fused normal, n*ifft(|mask|^2*fft(im)), the phases, mask and n between the ffts are one multiplication
+    def normal( self, im, out = None ):
+        pre, mid, post = _normal_phase(self.phase, self.mask, im.shape, self.axes, complex_dtype(im.dtype))
+        ksp = np.fft.fftn(np.multiply(im, pre), s=None, axes=self.axes)
+        im  = np.fft.ifftn(np.multiply(ksp, mid, out = ksp), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(im.shape, dtype = complex_dtype(ksp.dtype))
+        return np.multiply(im, post, out = out)
+
+    # exact solve of (A^H A + rho*I) x = rhs, diagonal in k-space, ifft(fft(rhs)/(n*|mask|^2+rho))
+    # adjoint = False solves (backward(forward(x)) + rho*x) = rhs, ifft(fft(rhs)/(mask+rho))
+    def solve_normal( self, rho, rhs, out = None, adjoint = True ):
+        pre, mid, post = _solve_phase(self.phase, self.mask, rhs.shape, self.axes, complex_dtype(rhs.dtype), rho, adjoint)
+        ksp = np.fft.fftn(np.multiply(rhs, pre), s=None, axes=self.axes)
+        im  = np.fft.ifftn(np.multiply(ksp, mid, out = ksp), s=None, axes=self.axes)
+        if out is None:
+            out = np.empty(im.shape, dtype = complex_dtype(ksp.dtype))
+        return np.multiply(im, post, out = out)
+
+"""
+fold the k-space mask into the phase after the fft, the mask is matched to the dims of post
+by adding 1 in the extra dims as dim_match(), cache is a dict of the operator keyed on (shape, dtype)
+"""
+def _fold_mask( cache, mask, post ):
+    key = (post.shape, post.dtype.str)
+    if key not in cache:
+        post_out_shape, mask_out_shape = dim_match(post.shape, mask.shape)
+        cache[key] = np.multiply(post.reshape(post_out_shape), mask.reshape(mask_out_shape), dtype = post.dtype)
+    return cache[key]
+
+"""
+phases for adjoint() and normal(), the adjoint of the unnormalized fft is n*ifft, n is the number of points along axes,
+adjoint  = n*ifft(conj(mask)*ksp), the scaling and conj(mask) are in the phase before the ifft
+normal   = n*ifft(|mask|^2*fft(im)), the phase after the fft, |mask|^2, n and the phase before the ifft are one array mid
+mask is None for the operators without k-space mask, cache is a dict of the operator
+"""
+def _fft_size( shape, axes ):
+    return int(np.prod([shape[ax] for ax in axes]))
+
+def _adjoint_phase( cache, mask, shape, axes, dtype ):
+    key = ('adjoint', tuple(shape), np.dtype(dtype).str)
+    if key not in cache:
+        pre, post = fftw.centered_phase(shape, axes, dtype, inverse = True)
+        pre = np.multiply(pre, _fft_size(shape, axes), dtype = pre.dtype)
+        if mask is not None:
+            pre = _fold_mask({}, mask if np.isrealobj(mask) else np.conj(mask), pre)
+        cache[key] = (pre, post)
+    return cache[key]
+
+def _normal_phase( cache, mask, shape, axes, dtype ):
+    key = ('normal', tuple(shape), np.dtype(dtype).str)
+    if key not in cache:
+        pre, post   = fftw.centered_phase(shape, axes, dtype)
+        ipre, ipost = fftw.centered_phase(shape, axes, dtype, inverse = True)
+        mid = np.multiply(post * ipre, _fft_size(shape, axes), dtype = post.dtype)
+        if mask is not None:
+            mid = _fold_mask({}, np.abs(mask).astype(np.float64) ** 2, mid)
+        cache[key] = (pre, mid, ipost)
+    return cache[key]
+
+# phases for solve_normal(), as normal() with 1/(n*|mask|^2+rho) for mid, only the last rho is kept,
+# adjoint = False has 1/(mask+rho), backward(forward(x)) is ifft(mask*fft(x)) as forward applies the mask once
+def _solve_phase( cache, mask, shape, axes, dtype, rho, adjoint = True ):
+    key = ('solve', tuple(shape), np.dtype(dtype).str, adjoint)
+    if key not in cache or cache[key][0] != rho:
+        pre, post   = fftw.centered_phase(shape, axes, dtype)
+        ipre, ipost = fftw.centered_phase(shape, axes, dtype, inverse = True)
+        n   = _fft_size(shape, axes) if adjoint else 1
+        mid = np.multiply(post, ipre, dtype = post.dtype)
+        if mask is None:
+            mid = np.divide(mid, n + rho, dtype = mid.dtype)
+        elif adjoint:
+            mid = _fold_mask({}, 1.0 / (n * np.abs(mask).astype(np.float64) ** 2 + rho), mid)
         else:
-            mksp = np.multiply(ksp,self.mask)#apply mask
-        """
-        ksp = np.fft.fftshift(ksp,self.axes)
-        #im = np.fft.ifftn(ksp,s=None,axes=self.axes)
-        im  = np.fft.ifftn(ksp,s=None,axes=self.axes)
-        im  = np.fft.ifftshift(im,self.axes)          
-        return im
+            mid = _fold_mask({}, 1.0 / (mask + rho), mid)
+        cache[key] = (rho, (pre, mid, ipost))
+    return cache[key][1]
 
 """
 those classes use fftw lib wihich support multi-threads
+the plans and aligned buffers are cached in fftw_func, each call is one pass into the fftw input buffer
+with the phase before the fft, the fft, and one pass out with the phase (and mask) after the fft
 """
 #2d fft
-class FFTW2d:
+class FFTW2d( LinearOperator ):
     "this is ndim FFTW for CS MRI recon"
     def __init__( self, axes = (0,1), threads = 1 ):
         self.axes = axes
+        self.phase = {} #phases of adjoint and normal, for each (shape, dtype)
         self.threads = threads
 
     # let's call k-space <- image as forward
-    def forward( self, im):
-        im  = np.fft.fftshift(im,self.axes)         
-        ksp = fftw.fftw2d(im, axes=self.axes, threads = self.threads)
-        ksp = np.fft.ifftshift(ksp,self.axes)
-        return ksp
+    def forward( self, im, out = None ):
+        pre, post = fftw.centered_phase(im.shape, self.axes, complex_dtype(im.dtype))
+        return fftw.fftw_centered(im, pre, post, self.axes, 'FFTW_FORWARD', self.threads, out)
 
     # let's call image <- k-space as backward
-    def backward( self, ksp ):
-        ksp = np.fft.fftshift(ksp,self.axes)
-        im  = fftw.ifftw2d(ksp,axes=self.axes, threads = self.threads)
-        im  = np.fft.ifftshift(im,self.axes)          
-        return im
+    def backward( self, ksp, out = None ):
+        pre, post = fftw.centered_phase(ksp.shape, self.axes, complex_dtype(ksp.dtype), inverse = True)
+        return fftw.fftw_centered(ksp, pre, post, self.axes, 'FFTW_BACKWARD', self.threads, out)
+
+    # exact adjoint, n*ifft(ksp)
+    def adjoint( self, ksp, out = None ):
+        pre, post = _adjoint_phase(self.phase, None, ksp.shape, self.axes, complex_dtype(ksp.dtype))
+        return fftw.fftw_centered(ksp, pre, post, self.axes, 'FFTW_BACKWARD', self.threads, out)
+
+    # A^H A of the unnormalized fft is n times identity
+    def normal( self, im, out = None ):
+        return np.multiply(im, _fft_size(im.shape, self.axes), out = out, dtype = complex_dtype(im.dtype))
+
+    # exact solve of (A^H A + rho*I) x = rhs, rhs/(n+rho), or rhs/(1+rho) for (backward(forward(x)) + rho*x) = rhs
+    def solve_normal( self, rho, rhs, out = None, adjoint = True ):
+        n = _fft_size(rhs.shape, self.axes) if adjoint else 1
+        return np.divide(rhs, n + rho, out = out, dtype = complex_dtype(rhs.dtype))
 
 #2d fft with mask
-class FFTW2d_kmask:
+class FFTW2d_kmask( LinearOperator ):
     "this is 2dim FFTW with k-space mask for CS MRI recon"
     def __init__( self, mask, axes = (0,1), threads = 1 ):
         self.mask = mask #save the k-space mask
         self.axes = axes
+        self.phase = {} #phases of adjoint and normal, for each (shape, dtype)
         self.threads = threads
+        self.post_mask = {} #phase after fft times mask, for each (shape, dtype)
 
     # let's call k-space <- image as forward
-    def forward( self, im):
-        im  = np.fft.fftshift(im,self.axes)         
-        ksp = fftw.fftw2d(im, axes=self.axes, threads = self.threads)
-        ksp = np.fft.ifftshift(ksp,self.axes)
-        #return np.multiply(ksp,self.mask)
-        #try to match the dims of ksp and mask
-        if len(ksp.shape) is not len(self.mask.shape):
-            #try to match the dimensions of ksp and mask
-            ksp_out_shape, mask_out_shape = dim_match(ksp.shape, self.mask.shape)
-            mksp = np.multiply(ksp.reshape(ksp_out_shape),\
-                         self.mask.reshape(mask_out_shape))#apply mask
-        else:
-            mksp = np.multiply(ksp,self.mask)#apply mask
-        return mksp
+    def forward( self, im, out = None ):
+        pre, post = fftw.centered_phase(im.shape, self.axes, complex_dtype(im.dtype))
+        post = _fold_mask(self.post_mask, self.mask, post)#apply mask
+        return fftw.fftw_centered(im, pre, post, self.axes, 'FFTW_FORWARD', self.threads, out)
 
     # let's call image <- k-space as backward
-    def backward( self, ksp ):
-        """
-        #try to match the dims of ksp and mask
-        if len(ksp.shape) is not len(self.mask.shape):
-            #try to match the dimensions of ksp and mask
-            ksp_out_shape, mask_out_shape = dim_match(ksp.shape, self.mask.shape)
-            mksp = np.multiply(ksp.reshape(ksp_out_shape),\
-                         self.mask.reshape(mask_out_shape))#apply mask
-        else:
-            mksp = np.multiply(ksp,self.mask)#apply mask
-        """
-        ksp = np.fft.fftshift(ksp,self.axes)
-        im  = fftw.ifftw2d(ksp,axes=self.axes, threads = self.threads)
-        im  = np.fft.ifftshift(im,self.axes)          
-        return im
+    def backward( self, ksp, out = None ):
+        pre, post = fftw.centered_phase(ksp.shape, self.axes, complex_dtype(ksp.dtype), inverse = True)
+        return fftw.fftw_centered(ksp, pre, post, self.axes, 'FFTW_BACKWARD', self.threads, out)
+
+    # exact adjoint, n*ifft(conj(mask)*ksp), n and the mask are folded into the phase before the ifft
+    def adjoint( self, ksp, out = None ):
+        pre, post = _adjoint_phase(self.phase, self.mask, ksp.shape, self.axes, complex_dtype(ksp.dtype))
+        return fftw.fftw_centered(ksp, pre, post, self.axes, 'FFTW_BACKWARD', self.threads, out)
+
+    # fused normal, n*ifft(|mask|^2*fft(im)), the fft output goes into the ifft input with one multiplication
+    def normal( self, im, out = None ):
+        pre, mid, post = _normal_phase(self.phase, self.mask, im.shape, self.axes, complex_dtype(im.dtype))
+        return fftw.fftw_centered_normal(im, pre, mid, post, self.axes, self.threads, out)
+
+    # exact solve of (A^H A + rho*I) x = rhs, diagonal in k-space, ifft(fft(rhs)/(n*|mask|^2+rho))
+    # adjoint = False solves (backward(forward(x)) + rho*x) = rhs, ifft(fft(rhs)/(mask+rho))
+    def solve_normal( self, rho, rhs, out = None, adjoint = True ):
+        pre, mid, post = _solve_phase(self.phase, self.mask, rhs.shape, self.axes, complex_dtype(rhs.dtype), rho, adjoint)
+        return fftw.fftw_centered_normal(rhs, pre, mid, post, self.axes, self.threads, out)
 
 
 #nd fft
-class FFTWnd:
+class FFTWnd( LinearOperator ):
     "this is ndim FFTW with k-space mask for CS MRI recon"
     def __init__( self, axes = (0,1,2), threads = 1 ):
         self.axes = axes
+        self.phase = {} #phases of adjoint and normal, for each (shape, dtype)
         self.threads = threads
 
     # let's call k-space <- image as forward
-    def forward( self, im):
-        im  = np.fft.fftshift(im,self.axes)         
-        ksp = fftw.fftwnd(im, axes=self.axes, threads = self.threads)
-        ksp = np.fft.ifftshift(ksp,self.axes)
-        return ksp
+    def forward( self, im, out = None ):
+        pre, post = fftw.centered_phase(im.shape, self.axes, complex_dtype(im.dtype))
+        return fftw.fftw_centered(im, pre, post, self.axes, 'FFTW_FORWARD', self.threads, out)
 
     # let's call image <- k-space as backward
-    def backward( self, ksp ):
-        ksp = np.fft.fftshift(ksp,self.axes)
-        im  = fftw.ifftwnd(ksp,axes=self.axes, threads = self.threads)
-        im  = np.fft.ifftshift(im,self.axes)          
-        return im
+    def backward( self, ksp, out = None ):
+        pre, post = fftw.centered_phase(ksp.shape, self.axes, complex_dtype(ksp.dtype), inverse = True)
+        return fftw.fftw_centered(ksp, pre, post, self.axes, 'FFTW_BACKWARD', self.threads, out)
+
+    # exact adjoint, n*ifft(ksp)
+    def adjoint( self, ksp, out = None ):
+        pre, post = _adjoint_phase(self.phase, None, ksp.shape, self.axes, complex_dtype(ksp.dtype))
+        return fftw.fftw_centered(ksp, pre, post, self.axes, 'FFTW_BACKWARD', self.threads, out)
+
+    # A^H A of the unnormalized fft is n times identity
+    def normal( self, im, out = None ):
+        return np.multiply(im, _fft_size(im.shape, self.axes), out = out, dtype = complex_dtype(im.dtype))
+
+    # exact solve of (A^H A + rho*I) x = rhs, rhs/(n+rho), or rhs/(1+rho) for (backward(forward(x)) + rho*x) = rhs
+    def solve_normal( self, rho, rhs, out = None, adjoint = True ):
+        n = _fft_size(rhs.shape, self.axes) if adjoint else 1
+        return np.divide(rhs, n + rho, out = out, dtype = complex_dtype(rhs.dtype))
 
 #nd fft with mask
-class FFTWnd_kmask:
+class FFTWnd_kmask( LinearOperator ):
     "this is ndim FFTW with k-space mask for CS MRI recon"
     def __init__( self, mask, axes = (0,1,2), threads = 1 ):
         self.mask = mask #save the k-space mask
         self.axes = axes
+        self.phase = {} #phases of adjoint and normal, for each (shape, dtype)
         self.threads = threads
+        self.post_mask = {} #phase after fft times mask, for each (shape, dtype)
 
     # let's call k-space <- image as forward
-    def forward( self, im):
-        im  = np.fft.fftshift(im,self.axes)         
-        ksp = fftw.fftwnd(im, axes=self.axes, threads = self.threads)
-        ksp = np.fft.ifftshift(ksp,self.axes)
-        #return np.multiply(ksp,self.mask)
-        #try to match the dims of ksp and mask
-        if len(ksp.shape) is not len(self.mask.shape):
-            #try to match the dimensions of ksp and mask
-            ksp_out_shape, mask_out_shape = dim_match(ksp.shape, self.mask.shape)
-            mksp = np.multiply(ksp.reshape(ksp_out_shape),\
-                         self.mask.reshape(mask_out_shape))#apply mask
-        else:
-            mksp = np.multiply(ksp,self.mask)#apply mask
-        return mksp
+    def forward( self, im, out = None ):
+        pre, post = fftw.centered_phase(im.shape, self.axes, complex_dtype(im.dtype))
+        post = _fold_mask(self.post_mask, self.mask, post)#apply mask
+        return fftw.fftw_centered(im, pre, post, self.axes, 'FFTW_FORWARD', self.threads, out)
 
     # let's call image <- k-space as backward
-    def backward( self, ksp ):
-        """
-        #try to match the dims of ksp and mask
-        if len(ksp.shape) is not len(self.mask.shape):
-            #try to match the dimensions of ksp and mask
-            ksp_out_shape, mask_out_shape = dim_match(ksp.shape, self.mask.shape)
-            mksp = np.multiply(ksp.reshape(ksp_out_shape),\
-                         self.mask.reshape(mask_out_shape))#apply mask
-        else:
-            mksp = np.multiply(ksp,self.mask)#apply mask
-        """
-        ksp = np.fft.fftshift(ksp,self.axes)
-        im  = fftw.ifftwnd(ksp,axes=self.axes, threads = self.threads)
-        im  = np.fft.ifftshift(im,self.axes)          
-        return im
+    def backward( self, ksp, out = None ):
+        pre, post = fftw.centered_phase(ksp.shape, self.axes, complex_dtype(ksp.dtype), inverse = True)
+        return fftw.fftw_centered(ksp, pre, post, self.axes, 'FFTW_BACKWARD', self.threads, out)
+
+    # exact adjoint, n*ifft(conj(mask)*ksp), n and the mask are folded into the phase before the ifft
+    def adjoint( self, ksp, out = None ):
+        pre, post = _adjoint_phase(self.phase, self.mask, ksp.shape, self.axes, complex_dtype(ksp.dtype))
+        return fftw.fftw_centered(ksp, pre, post, self.axes, 'FFTW_BACKWARD', self.threads, out)
+
+    # fused normal, n*ifft(|mask|^2*fft(im)), the fft output goes into the ifft input with one multiplication
+    def normal( self, im, out = None ):
+        pre, mid, post = _normal_phase(self.phase, self.mask, im.shape, self.axes, complex_dtype(im.dtype))
+        return fftw.fftw_centered_normal(im, pre, mid, post, self.axes, self.threads, out)
+
+    # exact solve of (A^H A + rho*I) x = rhs, diagonal in k-space, ifft(fft(rhs)/(n*|mask|^2+rho))
+    # adjoint = False solves (backward(forward(x)) + rho*x) = rhs, ifft(fft(rhs)/(mask+rho))
+    def solve_normal( self, rho, rhs, out = None, adjoint = True ):
+        pre, mid, post = _solve_phase(self.phase, self.mask, rhs.shape, self.axes, complex_dtype(rhs.dtype), rho, adjoint)
+        return fftw.fftw_centered_normal(rhs, pre, mid, post, self.axes, self.threads, out)
 
 
 """
 discrete wavelet transform operators
 """
 #2d dwt
-class DWT2d:
+class DWT2d( LinearOperator ):
     "this is 2d wavelet transform for CS MRI recon"
     def __init__( self, wavelet = 'db2', level = 2, axes = (0, 1) ):
         self.wavelet      = wavelet
@@ -297,23 +447,23 @@ class DWT2d:
         self.axes         = axes 
         self.shape        = None       
     # wavelet domain --> image, forward
-    def forward( self, arr_coeff ):
+    def forward( self, arr_coeff, out = None ):
         im  = dwt_func.idwt2d(arr_coeff, self.coeff_slices, self.wavelet, self.axes)
         if self.shape is not None:       
             for i in range(len(self.axes)):
                 if self.shape[i] < im.shape[i]:#if shape mismatch, delete the last line 
                     im = np.delete(im,(im.shape[i]-1),axis=i)        
-        return im
+        return to_out(im, out)
     # image --> wavelet domain, backward
-    def backward( self, im ):
+    def backward( self, im, out = None ):
         if self.shape is None:
             self.shape = im.shape
         arr_coeff, self.coeff_slices  = dwt_func.dwt2d(im, self.wavelet, self.level, self.axes)
         #ut.plotim1(arr_coeff)
-        return arr_coeff
+        return to_out(arr_coeff, out)
 
 ## nd dwt
-class DWTnd:
+class DWTnd( LinearOperator ):
     "this is nd wavelet transform for CS MRI recon"
     def __init__( self, wavelet = 'db2', level = 2, axes = (0, 1, 2) ):
         self.wavelet      = wavelet
@@ -322,20 +472,20 @@ class DWTnd:
         self.axes         = axes
         self.shape        = None
     # wavelet domain --> image, forward
-    def forward( self, arr_coeff ):
+    def forward( self, arr_coeff, out = None ):
         im         = dwt_func.idwtnd(arr_coeff, self.coeff_slices, self.wavelet, self.axes)
         if self.shape is not None:
             for i in range(len(self.axes)):
                 if self.shape[i] < im.shape[i]:#if shape mismatch, delete the last line 
                     im = np.delete(im,(im.shape[i]-1),axis=i)
-        return im
+        return to_out(im, out)
     # image --> wavelet domain, backward
-    def backward( self, im ):
+    def backward( self, im, out = None ):
         if self.shape is None:
             self.shape = im.shape     
         arr_coeff, self.coeff_slices  = dwt_func.dwtnd(im, self.wavelet, self.level, self.axes)
         #ut.plotim1(arr_coeff)
-        return arr_coeff
+        return to_out(arr_coeff, out)
 
 """
 this class appy coil conbation for 2d image
@@ -356,7 +506,7 @@ class SENSE2d:
 this class appy coil conbation for 2d image
 """
 
-class espirit:
+class espirit( LinearOperator ):
     "this is coil sensitivity operator"
     def __init__( self, sensitivity = None, coil_axis = None ):
         self.sens = sensitivity
@@ -365,22 +515,38 @@ class espirit:
             self.coil_axis = len(sensitivity.shape)-1
         else:
             self.coil_axis = coil_axis
+        self._sens_sos = None #sum(|sens|^2) over coils, for normal()
 
     #  apply coil combination
-    def backward( self, im_coils ):  
+    def backward( self, im_coils, out = None ):  
         sens_out_shape, im_out_shape = dim_match(self.sens.shape,im_coils.shape)
         # coil combination is sum(conj(sens)*im)
         return np.sum(np.multiply(im_coils.reshape(im_out_shape),\
-                     np.conj(self.sens).reshape(sens_out_shape))\
-                    , axis=self.coil_axis)
+                     np.conj(self.sens).reshape(sens_out_shape), dtype = complex_dtype(im_coils.dtype))\
+                    , axis=self.coil_axis, out = out)
 
     # multiply image with coil sensitivity profile
-    def forward( self, im_sos ):
+    def forward( self, im_sos, out = None ):
         sens_out_shape, im_out_shape = dim_match(self.sens.shape,im_sos.shape)
         #appying sensitivity profile is sens*im
         return np.multiply(im_sos.reshape(im_out_shape),\
-                        self.sens.reshape(sens_out_shape))
+                        self.sens.reshape(sens_out_shape), dtype = complex_dtype(im_sos.dtype), out = out)
+
+    # fused normal, sum(conj(sens)*sens*im) = im*sum(|sens|^2), no multi-coil intermediate
+    def normal( self, im_sos, out = None ):
+        if im_sos.ndim > self.coil_axis:#input has the coil axis, go through forward and backward
+            return LinearOperator.normal(self, im_sos, out)
+        if self._sens_sos is None:
+            self._sens_sos = np.sum(np.abs(self.sens) ** 2, axis = self.coil_axis)
+        sos_out_shape, im_out_shape = dim_match(self._sens_sos.shape, im_sos.shape)
+        return np.multiply(im_sos.reshape(im_out_shape), self._sens_sos.reshape(sos_out_shape),\
+                           dtype = complex_dtype(im_sos.dtype), out = out)
     
+    # single coil with |sens| = 1 is unitary, (A S)^H (A S) + rho*I = S^H (A^H A + rho*I) S
+    @property
+    def unitary( self ):
+        return self.sens.shape[self.coil_axis] == 1 and np.allclose(np.abs(self.sens), 1.0)
+
     #define save function
     def save( self, name ):
         sio.savemat(name, {'sens': self.sens, 'coil_axis': self.coil_axis})
@@ -391,17 +557,86 @@ class espirit:
         mat_contents   = sio.loadmat(name); 
         self.sens      = mat_contents['sens']
         self.coil_axis = np.int_(mat_contents['coil_axis'])
+        self._sens_sos  = None
         return self
 
 
+"""
+zero padding interpolation of x (shape of the leading axes of x) to shape, padnd between FFTnd forward
+and backward as espirit_2d/3d after the pixelwise step, scaled to keep the values of x
+"""
+def fourier_upsample( x, shape ):
+    nd   = len(shape)
+    ft   = FFTnd(tuple(range(nd)))
+    kpad = padnd(ft.forward(x), shape)
+    return ft.backward(kpad, out = kpad) * (float(np.prod(shape)) / np.prod(x.shape[:nd]))
+
+"""
+multi map espirit sensitivity operator with maps on a coarse grid (espirit_func.espirit_coarse),
+Vim is (coarse grid, ncoil, nmaps) and sim (coarse grid, nmaps), shape is the image shape,
+the maps are upsampled to shape by fourier_upsample only when the operator is first applied (sens),
+slice(i, axis) upsamples the maps along axis at slice i only, and returns the operator of the slice
+with the other axes still on the coarse grid, so a slice by slice recon of a 3d fov never has the 3d maps,
+each map is normalized over the coils after the upsampling, as espirit_2d/3d,
+and zeroed where its eigenvalue is below crop*max(sim), Uecker et al., ESPIRiT, 2014
+forward: im (shape + (nmaps,)) -> coil images sum_m S_m*im_m (shape + (ncoil,)),
+backward: sum_c conj(S_cm)*y_c, the exact adjoint
+"""
+class espirit_maps( LinearOperator ):
+    "this is multi map coil sensitivity operator, upsampled on demand"
+    def __init__( self, Vim, sim, shape, crop = 0.0 ):
+        self.Vim    = Vim
+        self.sim    = sim
+        self.shape  = tuple(shape)
+        self.nmaps  = Vim.shape[-1]
+        self.thresh = crop * np.max(sim) #global, so the slices use the same threshold
+        self._sens  = None
+
+    # full resolution maps, shape + (ncoil, nmaps), computed at the first use
+    @property
+    def sens( self ):
+        if self._sens is None:
+            self._sens = self._maps(fourier_upsample(self.Vim, self.shape),\
+                                    fourier_upsample(self.sim, self.shape))
+        return self._sens
+
+    def _maps( self, Vim, sim ):
+        Vim = Vim / (1e-6 + np.linalg.norm(Vim, axis = -2, keepdims = True))
+        if self.thresh > 0:
+            Vim = Vim * (np.abs(sim) >= self.thresh)[..., np.newaxis, :]
+        return Vim
+
+    # operator of slice i along axis, the interpolation weights of slice i are a row of the
+    # upsampling of the identity, applied on the coarse maps
+    def slice( self, i, axis = 0 ):
+        n, N = self.Vim.shape[axis], self.shape[axis]
+        w    = fourier_upsample(np.eye(n), (N,))[i]
+        res  = espirit_maps(np.tensordot(w, self.Vim, axes = (0, axis)), np.tensordot(w, self.sim, axes = (0, axis)),\
+                            self.shape[:axis] + self.shape[axis+1:])
+        res.thresh = self.thresh
+        return res
+
+    def forward( self, im, out = None ):
+        return np.sum(np.multiply(self.sens, im[..., np.newaxis, :], dtype = complex_dtype(im.dtype)),\
+                      axis = -1, out = out)
+
+    def backward( self, im_coils, out = None ):
+        return np.sum(np.multiply(np.conj(self.sens), im_coils[..., np.newaxis], dtype = complex_dtype(im_coils.dtype)),\
+                      axis = -2, out = out)
+
+
 # do nothing operator
-class None_opt:
+class None_opt( LinearOperator ):
     "this apply nothing"
-    def forward( self, xin ):
-        return xin
+    unitary = True
+    def forward( self, xin, out = None ):
+        return to_out(xin, out)
 
-    def backward( self, xin ):
-        return xin
+    def backward( self, xin, out = None ):
+        return to_out(xin, out)
+
+    def normal( self, xin, out = None ):
+        return to_out(xin, out)
 
 """
 this class combine two operators together, this is usefull for parallel imaging
@@ -415,35 +650,20 @@ sense2d = SENSE3d(sensitivity)
 ft_sense = joint2operators(fft2dm,sense2d)
 
 """
-class joint2operators:
+class joint2operators( ComposedOperator ):
     "this apply two operators jointly"
     def __init__( self, Aopt, Bopt ):
+        ComposedOperator.__init__(self, [Aopt, Bopt])
         self.Aopt = Aopt
         self.Bopt = Bopt
 
-    def forward( self, xin ):
-        xout = self.Bopt.forward(self.Aopt.forward(xin))
-        return xout
-
-    def backward( self, xin ):
-        xout = self.Aopt.backward(self.Bopt.backward(xin))
-        return xout
-
 """
-this class combine three operators together
-
+this class combine three operators together, Aopt is applied first in forward and last in backward
 """
-class joint3operators:
-    "this apply two operators jointly"
-    def __inital__( self, Aopt, Bopt, Copt ):
+class joint3operators( ComposedOperator ):
+    "this apply three operators jointly"
+    def __init__( self, Aopt, Bopt, Copt ):
+        ComposedOperator.__init__(self, [Aopt, Bopt, Copt])
         self.Aopt = Aopt
         self.Bopt = Bopt
         self.Copt = Copt
-
-    def forward( self, xin ):
-        xout = self.Copt.forward(self.Bopt.forward(self.Aopt.forward(xin)))
-        return xout
-
-    def backward( self, xin ):
-        xout = self.Copt.backward(self.Aopt.backward(self.Bopt.backward(xin)))
-        return xout
@@ -1,4 +1,5 @@
 import numpy as np
+import hashlib
 
 """
 back tracking line search from
@@ -68,8 +69,13 @@ def BacktrackingLineSearch2( f, df, x, p, c = 0.0001, rho = 0.2, ls_Nite = 10 ):
 """
 gradient descent, more general than the ones in proximal_func.py
 minimize function f(x) and gradient is df(x)
+step None is 1/(scale*max_eig_AHA(Afunc, invAfunc)), for df(x) = scale*invAfunc(Afunc(x)-b) + ...
 """
-def gradient_descent( df, x0, Nite, step ):
+def gradient_descent( df, x0, Nite, step = None, Afunc = None, invAfunc = None, scale = 1.0 ):
+    if step is None:
+        if Afunc is None or invAfunc is None:
+            raise ValueError("gradient_descent needs step, or Afunc and invAfunc for the default step")
+        step = 1.0 / (scale * max_eig_AHA(Afunc, invAfunc, x0.shape, x0.dtype))
     x      = x0#np.zeros(x0.shape)    
     eps    = 0.001 #stop criterion
     r      = -df(x)#zero as intial guess #-2*invAfunc(Afunc(x0)-b)#x=x0 as intial guess, i.e. here r=df(x0)
@@ -109,7 +115,7 @@ nonlinear conjugate gradient, more general than the ones in proximal_func.py
 minimize function f(x) and gradient is df(x)
 
 """
-def conjugate_gradient( f, df, x0, Nite, ls_Nite = 10 ):
+def conjugate_gradient( f, df, x0, Nite, ls_Nite = 10, telemetry = None ):
     x = x0#np.zeros(df(x0).shape)
     eps = 0.001
     i = 0
@@ -131,11 +137,114 @@ def conjugate_gradient( f, df, x0, Nite, ls_Nite = 10 ):
         #alpha linear search argmin_alpha f(x + alpha*s)
         alpha,nstp = BacktrackingLineSearch(f, df, x, s, ls_Nite=ls_Nite)
         x = x + alpha * s
+        if telemetry is not None:
+            telemetry.record(i, residual = deltanew, step = alpha, line_search = nstp, objective = lambda: f(x))
         i = i + 1
-        #print(deltanew)
-        #print(nstp)
     return x
 
+"""
+linear (preconditioned) conjugate gradient for M(x) = rhs, M is hermitian positive definite,
+e.g. M(x) = 2*A^H A x + rho*x of a l2 proximal, the step size is exact so there is no line search,
+and each iteration applies M once, x0 is the warm start,
+Pfunc is an optional preconditioner that applies an approximate inverse of M,
+stops after Nite iterations or when ||r|| < tol*||rhs||
+"""
+def linear_cg( Mfunc, rhs, x0, Nite, tol = 1e-6, Pfunc = None ):
+    x  = np.array(x0, dtype = np.result_type(x0, rhs))
+    r  = rhs - Mfunc(x)
+    z  = r if Pfunc is None else Pfunc(r)
+    p  = z.copy()
+    rz = np.vdot(r, z).real
+    stop = (tol * np.linalg.norm(rhs)) ** 2
+    i = 0
+    while i < Nite and np.vdot(r, r).real > stop:
+        Mp    = Mfunc(p)
+        alpha = rz / np.vdot(p, Mp).real #exact minimizer along p
+        x    += alpha * p
+        r    -= alpha * Mp
+        z     = r if Pfunc is None else Pfunc(r)
+        rz_old = rz
+        rz    = np.vdot(r, z).real
+        p     = z + (rz / rz_old) * p
+        i     = i + 1
+    return x
+
+"""
+power iteration for the largest eigenvalue of a hermitian positive semidefinite Mfunc,
+e.g. Mfunc(x) = invAfunc(Afunc(x)), which is the Lipschitz constant of the gradient of the l2 term,
+x0 is the (random) starting vector, stops after Nite iterations or when the relative change < tol
+"""
+def power_iteration( Mfunc, x0, Nite = 30, tol = 1e-4 ):
+    x   = x0 / np.linalg.norm(x0)
+    lam = 0.0
+    for _ in range(Nite):
+        y       = Mfunc(x)
+        lam_old = lam
+        lam     = np.vdot(x, y).real
+        x       = y / np.linalg.norm(y)
+        if abs(lam - lam_old) < tol * abs(lam):
+            break
+    return lam
+
+"""
+largest eigenvalue of invAfunc(Afunc()) by power iteration, 1/max_eig_AHA() is the default step of
+IST_3, FIST_3 and gradient_descent, the result is cached on the operator configuration:
+the hash covers the class and method names, the scalar/tuple attributes and the arrays of the operators
+(k-space mask, trajectory, sensitivity maps ...) of bound methods, so a new operator object with the same
+mask/trajectory/sensitivity reuses the cached value,
+plain functions and lambdas are not cached, their globals can change between calls with the same code,
+neither are operators nested deeper than 4 levels or with attributes that can not be hashed
+"""
+_max_eig_cache = {}
+
+# returns False if obj can not be hashed completely, the caller does not cache then
+def _hash_update( h, obj, depth = 0 ):
+    if depth > 4:
+        return False
+    if isinstance(obj, np.ndarray):
+        h.update(str((obj.shape, obj.dtype.str)).encode())
+        h.update(np.ascontiguousarray(obj).view(np.uint8).data)
+    elif obj is None or isinstance(obj, (bool, int, float, complex, str, np.number, np.dtype, slice)):
+        h.update(repr(obj).encode())
+    elif isinstance(obj, (list, tuple)):
+        h.update(str(len(obj)).encode())
+        return all(_hash_update(h, o, depth + 1) for o in obj)
+    elif hasattr(obj, '__self__') and hasattr(obj, '__func__'):#bound method
+        h.update(type(obj.__self__).__name__.encode())
+        h.update(obj.__func__.__name__.encode())
+        return _hash_update(h, obj.__self__, depth + 1)
+    elif hasattr(obj, '__code__'):#function or lambda
+        return False
+    elif hasattr(obj, '__dict__'):#operator, caches in dicts or _attributes and other objects (fftw plans) are skipped
+        h.update(type(obj).__name__.encode())
+        for name in sorted(obj.__dict__):
+            if not name.startswith('_') and not isinstance(obj.__dict__[name], dict):
+                h.update(name.encode())
+                if not _hash_update(h, obj.__dict__[name], depth + 1):
+                    return False
+    else:
+        return False
+    return True
+
+# sha1 of the operators, None if one of them can not be hashed
+def operator_hash( *objs ):
+    h = hashlib.sha1()
+    for obj in objs:
+        if not _hash_update(h, obj):
+            return None
+    return h.hexdigest()
+
+def max_eig_AHA( Afunc, invAfunc, shape, dtype = np.complex128, Nite = 30, tol = 1e-4 ):
+    op_hash = operator_hash(Afunc, invAfunc)
+    key = (op_hash, tuple(shape), np.dtype(dtype).str)
+    if op_hash is None or key not in _max_eig_cache:
+        x0  = np.random.RandomState(0).randn(*shape).astype(dtype)
+        lam = power_iteration(lambda xi: invAfunc(Afunc(xi)), x0, Nite, tol)
+        if op_hash is None:
+            return lam
+        _max_eig_cache[key] = lam
+    return _max_eig_cache[key]
+
 """
 based on function gradObj = gOBJ(x,params) in  Miki's sparse MRI
 % computes the gradient of the data consistency
@@ -1,34 +1,115 @@
 import numpy as np
+import numba
 from opt_alg import BacktrackingLineSearch
-import tvop_func as tv
 import tvop_class as tv_class
 import operators_class as opts
 import opt_alg as alg
+from utilities.utilities_func import complex_dtype
 """
 softthreshold/proximal for l1 norm, th = lambda/rho
 argmin_x (lambda)*||x||_1 + (rho/2)*||x-x0||_2^2
 
+the output keeps the precision of x0, complex64/float32 in, complex64/float32 out
+
+for a scalar th the thresholds are fused numba kernels, one parallel pass reading x0 and writing the output,
+x0*max(|x0|-th,0)/|x0| without the abs, angle, exp and division temporaries,
+out is an optional (c-contiguous) output array, it can be x0 itself for thresholding in place,
+an array th (e.g. spatially varying threshold) uses the numpy expressions
 """
+#|v|^2, the sqrt of it is much faster than abs(), which is hypot for complex
+@numba.jit(nopython=True)
+def _abs2( v ):
+    return v.real * v.real + v.imag * v.imag
+
+@numba.jit(nopython=True, parallel=True)
+def _soft_thresh_kernel( x, th, out ):
+    for i in numba.prange(x.shape[0]):
+        a = np.sqrt(_abs2(x[i]))
+        if a > th:
+            out[i] = x[i] * ((a - th) / a)
+        else:
+            out[i] = 0
+
+#x/(|x|+1e-6)*max(|x|-th,0) as prox_l1_soft_thresh2 has always been
+@numba.jit(nopython=True, parallel=True)
+def _soft_thresh2_kernel( x, th, out ):
+    for i in numba.prange(x.shape[0]):
+        a = np.sqrt(_abs2(x[i]))
+        if a > th:
+            out[i] = x[i] * ((a - th) / (a + 1e-6))
+        else:
+            out[i] = 0
+
+@numba.jit(nopython=True, parallel=True)
+def _hard_thresh_kernel( x, th, out ):
+    for i in numba.prange(x.shape[0]):
+        a = np.sqrt(_abs2(x[i]))
+        if a >= th:
+            out[i] = x[i] * (a / (a + 1e-6))
+        else:
+            out[i] = 0
+
+#x is (n1, ng, n2), the groups are along the middle axis
+@numba.jit(nopython=True, parallel=True)
+def _group_soft_thresh_kernel( x, th, out ):
+    n1, ng, n2 = x.shape
+    for t in numba.prange(n1 * n2):
+        i = t // n2
+        j = t % n2
+        s = 0.0
+        for g in range(ng):
+            s += _abs2(x[i, g, j])
+        a = np.sqrt(s)
+        scale = (a - th) / a if a > th else 0.0
+        for g in range(ng):
+            out[i, g, j] = x[i, g, j] * scale
+
+# run a threshold kernel on the flattened x0 and out, th in the precision of x0
+def _thresh( kernel, x0, th, out, dtype, shape = (-1,) ):
+    x0 = np.ascontiguousarray(x0)
+    if out is None:
+        out = np.empty(x0.shape, dtype = dtype)
+    elif not out.flags.c_contiguous:
+        raise ValueError('out must be c-contiguous')
+    kernel(x0.reshape(shape), np.abs(x0.dtype.type(0)).dtype.type(th), out.reshape(shape))
+    return out
+
 # output always complex data type
-def prox_l1_soft_thresh( x0, th ):
+def prox_l1_soft_thresh( x0, th, out = None ):
+    if np.isscalar(th):
+        return _thresh(_soft_thresh_kernel, x0, th, out, complex_dtype(x0.dtype))
     a_th = np.abs(x0) - th
     a_th[a_th<0] = 0
     a_angle = np.angle(x0)
-    return np.multiply(np.exp(1j*a_angle), a_th)
+    return np.multiply(np.exp(1j*a_angle), a_th, dtype = complex_dtype(x0.dtype), out = out)
 
 #modified, input float type, output float type
-def prox_l1_soft_thresh2( x0, th ):
+def prox_l1_soft_thresh2( x0, th, out = None ):
+    if np.isscalar(th):
+        return _thresh(_soft_thresh2_kernel, x0, th, out, x0.dtype)
     a_th = np.abs(x0) - th
     a_th[a_th<0] = 0
     a_dir = np.divide(x0,np.abs(x0)+1e-6)
-    return np.multiply(a_dir, a_th)
+    return np.multiply(a_dir, a_th, dtype = x0.dtype, out = out)
 
 # hard threshold
-def prox_l0_hard_thresh( x0, th ):
+def prox_l0_hard_thresh( x0, th, out = None ):
+    if np.isscalar(th):
+        return _thresh(_hard_thresh_kernel, x0, th, out, x0.dtype)
     a_th = np.abs(x0) #- th
     a_th[a_th<th] = 0
     a_dir = np.divide(x0,np.abs(x0)+1e-6)
-    return np.multiply(a_dir, a_th)
+    return np.multiply(a_dir, a_th, dtype = x0.dtype, out = out)
+
+"""
+group (joint) sparsity, l2 norm across axis and l1 over the rest, e.g. axis is the coils or echoes
+argmin_x (lambda)*sum_r ||x_r||_2 + (rho/2)*||x-x0||_2^2, x_r is x at r along axis
+x0_r*max(||x0_r||_2-th,0)/||x0_r||_2, the coefficients of all coils/echoes are kept or zeroed together
+"""
+def prox_l1_group_soft_thresh( x0, th, axis = -1, out = None ):
+    axis  = axis % x0.ndim
+    shape = (int(np.prod(x0.shape[:axis])), x0.shape[axis], int(np.prod(x0.shape[axis+1:])))
+    return _thresh(_group_soft_thresh_kernel, x0, th, out, x0.dtype, shape)
 
 """
 softthreshold for proximal transformed l1 norm, th = lambda/rho
@@ -36,20 +117,10 @@ argmin_x (lambda)*||Tfunc(x)||_1 + (rho/2)*||x-x0||_2^2
 """
 # output is always complex type
 def prox_l1_Tf_soft_thresh( Tfunc, invTfunc, x0, th ):
-    Tfx0 = Tfunc(x0)
-    a_th = np.abs(Tfx0) - th
-    a_th[a_th<0] = 0
-    a_angle = np.angle(Tfx0)
-    Tfx = np.multiply(np.exp(1j*a_angle), a_th)
-    return invTfunc(Tfx)
+    return invTfunc(prox_l1_soft_thresh(Tfunc(x0), th))
 #input float type, output float type
 def prox_l1_Tf_soft_thresh2( Tfunc, invTfunc, x0, th ):
-    Tfx0 = Tfunc(x0)
-    a_th = np.abs(Tfx0) - th
-    a_th[a_th<0] = 0
-    a_dir = np.divide(Tfx0,np.abs(Tfx0)+1e-6)
-    Tfx = np.multiply(a_dir, a_th)
-    return invTfunc(Tfx)
+    return invTfunc(prox_l1_soft_thresh2(Tfunc(x0), th))
 
 """
 total variation minimization
@@ -67,114 +138,52 @@ and a pdf file
 Total Variation Regularization with Chambolle Algorihtm.pdf
 """
 
-# ingeneral for any TV operator defined in tvop_class, 2d/3d/2d_r/3d_r currently supporting
-def prox_tv( tvopt, y, lambda_tv, step = 0.1 ):
+# ingeneral for any TV operator defined in tvop_class, 2d/3d/2d_r/3d_r/nd currently supporting
+# the tvop_class operators run each iteration as two fused passes, Div_add and grad_update, on preallocated G and v,
+# other operators with grad, Div and amp use the numpy expressions
+# the dual step converges for step <= 1/||Div||^2 = 1/(4*sum(w_k^2)), None takes this bound from the tv weights,
+# 1/8 for 2d and 1/12 for 3d with unit weights
+# changes from the former prox_tv/prox_tv2d..., which had step = 0.1 and normalized G by sqrt(sum(G**2)):
+# the default step is this bound instead of 0.1 (0.1 is above it for 3d, and diverges for weights > 1), pass step = 0.1 for
+# the former results, and |G| is the magnitude sqrt(sum(|G|**2)) for complex data, G**2 was not a norm
+# for complex G, real data gives the same result as before with the same step
+def prox_tv( tvopt, y, lambda_tv, step = None, Nite = 40 ):
     #lambda_tv = 2/rho
     #nx, ny, nz = y.shape
-    sizeg = y.shape+(y.ndim,) #size of gradient tensor
-    G = np.zeros(sizeg)#intial gradient tensor
-    i = 0
-    #amp = lambda u : np.sqrt(np.sum(u ** 2,axis=3))#nomalize u along the third dimension
-    #norm_g0 = np.linalg.norm(tvopt.grad(y))
-    #norm_g = norm_g0
-    while i < 40:
+    if step is None:
+        w    = np.asarray(getattr(tvopt, 'weights', np.ones(tvopt.ndim)), dtype = np.float64)
+        step = 1.0 / (4.0 * np.sum(w ** 2))
+    sizeg = y.shape+(tvopt.ndim,) #size of gradient tensor
+    G = np.zeros(sizeg, dtype = y.dtype)#intial gradient tensor, same precision as y
+    if hasattr(tvopt, 'grad_update'):
+        v = np.empty(y.shape, dtype = y.dtype)
+        for _ in range(Nite):
+            tvopt.Div_add(G, 1.0, y, -1.0/lambda_tv, out = v)#Div(G)-y/lambda_tv
+            tvopt.grad_update(G, v, step)#gradient desent on G, normalized to ensure the |G|<1
+        return tvopt.Div_add(G, -lambda_tv, y, 1.0)#y - lambda_tv * Div(G)
+    for _ in range(Nite):
         dG = tvopt.grad(tvopt.Div(G)-y/lambda_tv)#gradient of G
         G = G - step*dG#gradient desent, tested to work with negative sign for gradient update
-        d = tvopt.amp(G)#np.tile(amp(G)[:,:,np.newaxis], (1,1,1,2))#.reshape(sizeg)
-        G = G/np.maximum(d,1.0*np.ones(sizeg))#normalize to ensure the |G|<1
-        i = i + 1
-        #lambda_tv = lambda_tv*ntheta/np.linalg.norm(f-y)
-        #norm_g = np.linalg.norm(G)
+        d = tvopt.amp(G)
+        G = G/np.maximum(d,1.0)#normalize to ensure the |G|<1
     f = y - lambda_tv * tvopt.Div(G)
     return f
 
 #for 2d input data
-def prox_tv2d( y, lambda_tv, step = 0.1 ):
-    #lambda_tv = 2/rho
-    nx, ny = y.shape
-    sizeg = (nx,ny,2) #size of gradient tensor
-    G = np.zeros(sizeg)#intial gradient tensor
-    i = 0
-
-    amp = lambda u : np.sqrt(np.sum(u ** 2,axis=2))#nomalize u along the third dimension
-
-    while i < 40:
-        dG = tv.grad(tv.Div(G)-y/lambda_tv)#gradient of G
-        G = G - step*dG#gradient desent, tested to work with negative sign for gradient update
-        d = np.tile(amp(G)[:,:,np.newaxis], (1,1,2))#.reshape(sizeg)
-        G = G/np.maximum(d,1.0*np.ones(sizeg))#normalize to ensure the |G|<1
-        i = i + 1
-        #lambda_tv = lambda_tv*ntheta/np.linalg.norm(f-y)
-        #print np.linalg.norm(G)
-    f = y - lambda_tv * tv.Div(G)
-
-    return f
+def prox_tv2d( y, lambda_tv, step = None ):
+    return prox_tv(tv_class.TV2d(), y, lambda_tv, step)
 
 #for 2d tv on muti-dimension  (nd > 2) input data
-def prox_tv2d_r( y, lambda_tv, step = 0.1 ):
-    #lambda_tv = 2/rho
-    #nx, ny, nz = y.shape
-    sizeg = y.shape+(2,) #size of gradient tensor
-    G = np.zeros(sizeg)#intial gradient tensor
-    i = 0
-    tvopt = tv_class.TV2d_r()
-    #amp = lambda u : np.sqrt(np.sum(u ** 2,axis=3))#nomalize u along the third dimension
-    #norm_g0 = np.linalg.norm(tvopt.grad(y))
-    #norm_g = norm_g0
-    while i < 40:
-        dG = tvopt.grad(tvopt.Div(G)-y/lambda_tv)#gradient of G
-        G = G - step*dG#gradient desent, tested to work with negative sign for gradient update
-        d = tvopt.amp(G)#np.tile(amp(G)[:,:,np.newaxis], (1,1,1,2))#.reshape(sizeg)
-        G = G/np.maximum(d,1.0*np.ones(sizeg))#normalize to ensure the |G|<1
-        i = i + 1
-        #lambda_tv = lambda_tv*ntheta/np.linalg.norm(f-y)
-        #norm_g = np.linalg.norm(G)
-    f = y - lambda_tv * tvopt.Div(G)
-    return f
+def prox_tv2d_r( y, lambda_tv, step = None ):
+    return prox_tv(tv_class.TV2d_r(), y, lambda_tv, step)
 
 #for 3d input data
-def prox_tv3d( y, lambda_tv, step = 0.1 ):
-    #lambda_tv = 2/rho
-    #nx, ny, nz = y.shape
-    sizeg = y.shape+(y.ndim,) #size of gradient tensor
-    G = np.zeros(sizeg)#intial gradient tensor
-    i = 0
-    tvopt = tv_class.TV3d()
-    #amp = lambda u : np.sqrt(np.sum(u ** 2,axis=3))#nomalize u along the third dimension
-    #norm_g0 = np.linalg.norm(tvopt.grad(y))
-    #norm_g = norm_g0
-    while i < 40:
-        dG = tvopt.grad(tvopt.Div(G)-y/lambda_tv)#gradient of G
-        G = G - step*dG#gradient desent, tested to work with negative sign for gradient update
-        d = tvopt.amp(G)#np.tile(amp(G)[:,:,np.newaxis], (1,1,1,2))#.reshape(sizeg)
-        G = G/np.maximum(d,1.0*np.ones(sizeg))#normalize to ensure the |G|<1
-        i = i + 1
-        #lambda_tv = lambda_tv*ntheta/np.linalg.norm(f-y)
-        #norm_g = np.linalg.norm(G)
-    f = y - lambda_tv * tvopt.Div(G)
-    return f
+def prox_tv3d( y, lambda_tv, step = None ):
+    return prox_tv(tv_class.TV3d(), y, lambda_tv, step)
 
-#for 2d tv on muti-dimension  (nd > 2) input data
-def prox_tv3d_r( y, lambda_tv, step = 0.1 ):
-    #lambda_tv = 2/rho
-    #nx, ny, nz = y.shape
-    sizeg = y.shape+(y.ndim,) #size of gradient tensor
-    G = np.zeros(sizeg)#intial gradient tensor
-    i = 0
-    tvopt = tv_class.TV3d_r()
-    #amp = lambda u : np.sqrt(np.sum(u ** 2,axis=3))#nomalize u along the third dimension
-    #norm_g0 = np.linalg.norm(tvopt.grad(y))
-    #norm_g = norm_g0
-    while i < 40:
-        dG = tvopt.grad(tvopt.Div(G)-y/lambda_tv)#gradient of G
-        G = G - step*dG#gradient desent, tested to work with negative sign for gradient update
-        d = tvopt.amp(G)#np.tile(amp(G)[:,:,np.newaxis], (1,1,1,2))#.reshape(sizeg)
-        G = G/np.maximum(d,1.0*np.ones(sizeg))#normalize to ensure the |G|<1
-        i = i + 1
-        #lambda_tv = lambda_tv*ntheta/np.linalg.norm(f-y)
-        #norm_g = np.linalg.norm(G)
-    f = y - lambda_tv * tvopt.Div(G)
-    return f
+#for 3d tv on muti-dimension  (nd > 3) input data
+def prox_tv3d_r( y, lambda_tv, step = None ):
+    return prox_tv(tv_class.TV3d_r(), y, lambda_tv, step)
 
 
 """
@@ -279,7 +288,7 @@ Anfunc(x) = 2*invAfunc(Afunc(x)) + rho*x
 bn = 2*invAfunc(b) + rho*x0
 should use nonlinear conjugate gradient method
 """
-def prox_l2_Afxnb_CGD( Afunc, invAfunc, b, x0, rho, Nite, ls_Nite = 10 ):
+def prox_l2_Afxnb_CGD( Afunc, invAfunc, b, x0, rho, Nite, ls_Nite = 10, telemetry = None ):
     #x = np.zeros(x0.shape)
     eps = 0.001
     i = 0
@@ -306,10 +315,38 @@ def prox_l2_Afxnb_CGD( Afunc, invAfunc, b, x0, rho, Nite, ls_Nite = 10 ):
         #alpha linear search argmin_alpha f(x + alpha*s)
         alpha,nstp = BacktrackingLineSearch(f, df, x, s, ls_Nite = ls_Nite)
         x = x + alpha * s
+        if telemetry is not None:
+            telemetry.record(i, residual = deltanew, step = alpha, line_search = nstp, objective = lambda: f(x))
         i = i + 1
-        #print nstp
     return x
 
+"""
+linear conjugate gradient for the same proximal, the minimizer solves Anfunc(x) = bn, i.e.
+(2*invAfunc(Afunc(x)) + rho*x) = 2*invAfunc(b) + rho*x0
+the step size is exact and each iteration costs one Afunc/invAfunc pair, or one call of ATAfunc,
+ATAfunc is an optional fused invAfunc(Afunc(x)), e.g. FFT2d_kmask.normal with invAfunc = FFT2d_kmask.adjoint,
+x_init is the warm start, e.g. x of the previous ADMM iteration, x0 if None,
+Pfunc is an optional preconditioner, an approximate inverse of Anfunc
+if Afunc and invAfunc are the forward and adjoint/backward of an operator with solve_normal(),
+e.g. FFT2d_kmask, the system is solved exactly, two ffts and no CG iterations
+"""
+def prox_l2_Afxnb_CG( Afunc, invAfunc, b, x0, rho, Nite, tol = 1e-6, x_init = None, ATAfunc = None, Pfunc = None ):
+    # the methods may be wrapped by a timing telemetry
+    Amethod, invAmethod = getattr(Afunc, '__wrapped__', Afunc), getattr(invAfunc, '__wrapped__', invAfunc)
+    opt   = getattr(Amethod, '__self__', None)
+    solve = getattr(opt, 'solve_normal', None)
+    if ATAfunc is None and solve is not None and invAmethod in (opt.adjoint, opt.backward):
+        # (invA A + rho/2) x = invA b + rho/2 x0
+        return solve(rho/2.0, invAfunc(b) + (rho/2.0)*x0, adjoint = (invAmethod == opt.adjoint))
+    if ATAfunc is None:
+        ATAfunc = lambda xi: invAfunc(Afunc(xi))
+    def Anfunc(xi):
+        return 2*ATAfunc(xi) + rho*xi
+    bn = 2*invAfunc(b) + rho*x0
+    if x_init is None:
+        x_init = x0
+    return alg.linear_cg(Anfunc, bn, x_init, Nite, tol, Pfunc)
+
 # cost func is f(x) = ||Ax -b ||_2^2
 def prox_l2_Afxnb_CGD2( Afunc, invAfunc, b, Nite, ls_Nite = 10 ):
     x = invAfunc(b)#np.zeros(invAfunc(b).shape)
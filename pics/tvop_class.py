@@ -1,236 +1,189 @@
 import numpy as np
+import numba
+from pics.linop_class import LinearOperator, to_out
 """
 define total variation gradient and divergense functions
-this class is for 2d tv minimization
 prox function is from
 Chambolle, An algorithm for total variation minimizations and applications, 2004
 and a pdf file
 Total Variation Regularization with Chambolle Algorihtm.pdf
+
+forward is Div (sparse domain -> image), which is the exact adjoint of grad, backward is grad,
+so adjoint() of the LinearOperator base is backward
+
+grad is the forward difference along each of the first ndim axes, zero at the last row,
+Dx[i] = w_x*(x[i+1]-x[i]), the gradient tensor has one more (last) dimension of size ndim,
+the axes after the first ndim ones (e.g. coils, echoes or time frames) are not differentiated,
+w are optional anisotropic weights, e.g. voxel size or a temporal weight
+
+grad, Div and the Chambolle iteration of prox_tv are fused numba stencils on c-contiguous arrays,
+one parallel pass each, written into preallocated buffers (out) without the shifted copies,
+the loops go over rows of the image so the boundary tests are computed once per row
 """
-class TV2d:
-    "this define functions related to totalvariation minimization"
-    def __init__( self ):
-        self.ndim    = 2         #number of image dimension
-        #self.imdim   = (0, 1)    #image dimension
-        #self.tvopdim = (0, 1)    #apply tv on those dimensions
-        #self.tmpdim  = self.imdim + (self.ndim,) #tmp data dimensions, which has one more dim for saving the gradient
-        #self.imshape = None
-
-    def grad( self, x ): #gradient of x
-        sx, sy = x.shape
-        Dx = x[np.r_[1:sx, sx-1],:] - x
-        Dy = x[:,np.r_[1:sy, sy-1]] - x
-        #res = np.concatenate((Dx,Dy),2)
-        res = np.zeros((sx,sy,2), dtype=x.dtype)
-        res[:,:,0] = Dx
-        res[:,:,1] = Dy
-        return res
-
-    def adjDy( self, x ): #used in computing divergense of x
-        sx,sy = x.shape
-        res = x[:,np.r_[0, 0:sy-1]] - x
-        res[:,0] = -x[:,0]
-        res[:,-1] = x[:,-2]
-        return res
-
-    def adjDx( self, x ): #used in computing divergense of x
-        sx,sy = x.shape
-        res = x[np.r_[0, 0:sx-1],:] - x
-        res[0,:] = -x[0,:]
-        res[-1,:] = x[-2,:]
-        return res
-
-    def Div( self, y ):  #divergense of x
-        #res = np.zeros(y.shape)
-        res = self.adjDx(y[:,:,0]) + self.adjDy(y[:,:,1])
-        return res
+#bit masks of the axes (except the last tv axis) where row q has a next/previous neighbour
+@numba.jit(nopython=True)
+def _row_masks( q, sizes ):
+    nxt = 0
+    prv = 0
+    for k in range(sizes.shape[0] - 2, -1, -1):
+        p = q % sizes[k]
+        if p < sizes[k] - 1:
+            nxt |= 1 << k
+        if p > 0:
+            prv |= 1 << k
+        q //= sizes[k]
+    return nxt, prv
+
+#out = grad(x), x and out are flattened, strides[k] is the step of tv axis k in x
+@numba.jit(nopython=True, parallel=True)
+def _grad_kernel( x, strides, sizes, w, out ):
+    d  = sizes.shape[0]
+    nl = sizes[d - 1]
+    R  = strides[d - 1]
+    for q in numba.prange(x.shape[0] // (nl * R)):
+        nxt, prv = _row_masks(q, sizes)
+        for p in range(nl):
+            for r in range(R):
+                i = (q * nl + p) * R + r
+                for k in range(d):
+                    if (k < d - 1 and (nxt >> k) & 1) or (k == d - 1 and p < nl - 1):
+                        out[i * d + k] = w[k] * (x[i + strides[k]] - x[i])
+                    else:
+                        out[i * d + k] = 0
+
+#out = alpha*Div(g) + beta*y
+@numba.jit(nopython=True, parallel=True)
+def _div_kernel( g, strides, sizes, w, alpha, y, beta, out ):
+    d  = sizes.shape[0]
+    nl = sizes[d - 1]
+    R  = strides[d - 1]
+    for q in numba.prange(out.shape[0] // (nl * R)):
+        nxt, prv = _row_masks(q, sizes)
+        for p in range(nl):
+            for r in range(R):
+                i = (q * nl + p) * R + r
+                v = 0 * g[0]
+                if beta != 0:
+                    v += beta * y[i]
+                for k in range(d):
+                    if (k < d - 1 and (prv >> k) & 1) or (k == d - 1 and p > 0):
+                        v += alpha * w[k] * g[(i - strides[k]) * d + k]
+                    if (k < d - 1 and (nxt >> k) & 1) or (k == d - 1 and p < nl - 1):
+                        v -= alpha * w[k] * g[i * d + k]
+                out[i] = v
+
+#G = G - step*grad(v), then G = G/max(|G|,1) with |G| over the tv axes, in place
+@numba.jit(nopython=True, parallel=True)
+def _grad_update_kernel( G, v, strides, sizes, w, step ):
+    d  = sizes.shape[0]
+    nl = sizes[d - 1]
+    R  = strides[d - 1]
+    for q in numba.prange(v.shape[0] // (nl * R)):
+        nxt, prv = _row_masks(q, sizes)
+        for p in range(nl):
+            for r in range(R):
+                i = (q * nl + p) * R + r
+                s = 0.0
+                for k in range(d):
+                    g = G[i * d + k]
+                    if (k < d - 1 and (nxt >> k) & 1) or (k == d - 1 and p < nl - 1):
+                        g = g - step * w[k] * (v[i + strides[k]] - v[i])
+                    G[i * d + k] = g
+                    s += g.real * g.real + g.imag * g.imag
+                if s > 1.0:
+                    a = 1.0 / np.sqrt(s)
+                    for k in range(d):
+                        G[i * d + k] = G[i * d + k] * a
 
+"""
+tv over the first ndim axes of arbitrary dimensional data
+"""
+class TVnd( LinearOperator ):
+    "this define functions related to totalvariation minimization"
+    def __init__( self, ndim = 2, weights = None ):
+        self.ndim    = ndim      #number of image dimension the tv is applied on
+        self.weights = np.ones(ndim) if weights is None else np.asarray(weights, dtype = np.float64)
+        self._geometry = {}      #strides and sizes for each image shape
+
+    def _geom( self, shape ):
+        if shape not in self._geometry:
+            sizes   = np.array(shape[:self.ndim], dtype = np.int64)
+            strides = np.array([int(np.prod(shape[k+1:])) for k in range(self.ndim)], dtype = np.int64)
+            self._geometry[shape] = (strides, sizes)
+        return self._geometry[shape]
+
+    # weights in the precision of data
+    def _w( self, dtype ):
+        return self.weights.astype(np.abs(np.zeros(1, dtype = dtype)).dtype)
+
+    # write into out if it can be used by the kernels, else into a new array
+    def _out( self, out, shape, dtype ):
+        if out is not None and out.flags.c_contiguous and out.shape == shape and out.dtype == dtype:
+            return out
+        return np.empty(shape, dtype = dtype)
+
+    def grad( self, x, out = None ): #gradient of x
+        x = np.ascontiguousarray(x)
+        strides, sizes = self._geom(x.shape)
+        res = self._out(out, x.shape + (self.ndim,), x.dtype)
+        _grad_kernel(x.reshape(-1), strides, sizes, self._w(x.dtype), res.reshape(-1))
+        return to_out(res, out)
+
+    # alpha*Div(y) + beta*b, the prox_tv iteration and result in one pass
+    def Div_add( self, y, alpha = 1.0, b = None, beta = 0.0, out = None ):
+        y = np.ascontiguousarray(y)
+        shape = y.shape[:-1]
+        strides, sizes = self._geom(shape)
+        if b is None:
+            b = y.reshape(-1)[:1] #not read for beta = 0
+            dtype = y.dtype
+        else:
+            b = np.ascontiguousarray(b)
+            dtype = np.result_type(y.dtype, b.dtype)
+        res = self._out(out, shape, dtype)
+        _div_kernel(y.reshape(-1), strides, sizes, self._w(dtype), alpha, b.reshape(-1), beta, res.reshape(-1))
+        return to_out(res, out)
+
+    def Div( self, y, out = None ):  #divergense of x
+        return self.Div_add(y, out = out)
+
+    # G = G - step*grad(v), G = G/max(|G|,1), in place on the c-contiguous G
+    def grad_update( self, G, v, step ):
+        v = np.ascontiguousarray(v)
+        strides, sizes = self._geom(v.shape)
+        _grad_update_kernel(G.reshape(-1), v.reshape(-1), strides, sizes, self._w(G.dtype), step)
+        return G
+
+    # magnitude of the gradient over the last axis, broadcastable to grad
     def amp( self, grad ):
-        amp = np.sqrt(np.sum(grad ** 2,axis=self.ndim))#nomalize u along the third dimension
-        d = np.tile(amp[:,:,np.newaxis], (1,1,self.ndim))#.reshape(sizeg)
-        return d
+        return np.sqrt(np.sum(np.abs(grad) ** 2, axis = -1, keepdims = True))
     # image --> sparse domain
-    def backward( self, x ):
-        return self.grad(x)
+    def backward( self, x, out = None ):
+        return self.grad(x, out = out)
     # sparse domain --> image
-    def forward( self, y ):
-        return self.Div(y)    
+    def forward( self, y, out = None ):
+        return self.Div(y, out = out)
 
-class TV2d_r:
+# 2d tv of 2d data
+class TV2d( TVnd ):
     "this define functions related to totalvariation minimization"
-    def __init__( self ):
-        self.ndim    = 2         #number of image dimension
-
-    def grad( self, x ): #gradient of x
-        sx = x.shape[0]
-        sy = x.shape[1]    
-        Dx = x[np.r_[1:sx, sx-1],:] - x
-        Dy = x[:,np.r_[1:sy, sy-1]] - x
-        #res = np.zeros((sx,sy,2), dtype=x.dtype)
-        res = np.zeros(x.shape + (self.ndim,), dtype = x.dtype)
-        res[...,0] = Dx
-        res[...,1] = Dy
-        return res
-
-    def adjDy( self, x ): #used in computing divergense of x
-        sx = x.shape[0]
-        sy = x.shape[1]
-        res = x[:,np.r_[0, 0:sy-1]] - x
-        res[:,0] = -x[:,0]
-        res[:,-1] = x[:,-2]
-        return res
-
-    def adjDx( self, x ): #used in computing divergense of x
-        sx = x.shape[0]
-        sy = x.shape[1]
-        res = x[np.r_[0, 0:sx-1],:] - x
-        res[0,:] = -x[0,:]
-        res[-1,:] = x[-2,:]
-        return res
-
-    def Div( self, y ):  #divergense of x
-        #res = np.zeros(y.shape)
-        res = self.adjDx(y[...,0]) + self.adjDy(y[...,1])
-        return res
+    def __init__( self, weights = None ):
+        TVnd.__init__(self, 2, weights)
 
-    def amp( self, grad ):
-        amp = np.sqrt(np.sum(grad ** 2, axis=(len(grad.shape)-1)))#nomalize u along the third dimension
-        amp_shape = amp.shape + (1,)
-        #amp_vec   = tuple(np.ones(len(amp.shape))) + (self.ndim,)
-        #d = np.tile(amp.reshape(amp_shape), amp_vec)#.reshape(sizeg)
-        d = np.ones(amp.shape + (self.ndim,), dtype = amp.dtype)
-        d = np.multiply(amp.reshape(amp_shape), d)
-        return d
-    # image --> sparse domain
-    def backward( self, x ):
-        return self.grad(x)
-    # sparse domain --> image
-    def forward( self, y ):
-        return self.Div(y)    
+# 2d tv on muti-dimension (nd > 2) data
+class TV2d_r( TVnd ):
+    "this define functions related to totalvariation minimization"
+    def __init__( self, weights = None ):
+        TVnd.__init__(self, 2, weights)
 
 # this define the 3d tv operator including gradient and divergense functions
-class TV3d:
+class TV3d( TVnd ):
     "this define functions related to totalvariation minimization"
-    def __init__( self ):
-        self.ndim    = 3         #number of image dimension
-        #self.imdim   = (0, 1, 2) #image dimension
-        #self.tvopdim = (0, 1, 2) #apply tv on those dimensions
-        #self.tmpdim  = self.imdim + (self.ndim,) #tmp data dimensions, which has one more dim for saving the gradient
-        #self.imshape = None
-
-    def grad( self, x ):  #gradient of x
-        #if self.imshape is None:
-        #    self.imshape = x.shape
-        sx, sy, sz = x.shape
-        Dx = x[np.r_[1:sx, sx-1],:,:] - x
-        Dy = x[:,np.r_[1:sy, sy-1],:] - x
-        Dz = x[:,:,np.r_[1:sz, sz-1]] - x
-        res = np.zeros((sx,sy,sz) + (self.ndim,), dtype = x.dtype)
-        res[:,:,:,0] = Dx
-        res[:,:,:,1] = Dy
-        res[:,:,:,2] = Dz
-        return res
-
-    def adjDx( self, x ):  #used in computing divergense of x
-        sx, sy, sz = x.shape
-        res = x[np.r_[0, 0:sx-1],:,:] - x
-        res[ 0, :, :] = -x[ 0, :, :]
-        res[-1, :, :] =  x[-2, :, :]
-        return res
-
-    def adjDy( self, x ): #use
-        sx, sy, sz = x.shape
-        res = x[:,np.r_[0, 0:sy-1],:] - x
-        res[ :, 0, :] = -x[ :, 0, :]
-        res[ :,-1, :] =  x[ :,-2, :]
-        return res
-
-    def adjDz( self, x ):
-        sx, sy, sz = x.shape
-        res = x[:,:,np.r_[0, 0:sz-1]] - x
-        res[ :, :, 0] = -x[ :, :, 0]
-        res[ :, :,-1] =  x[ :, :,-2]
-        return res
-
-    def Div( self, y ):
-        #res = np.zeros(y.shape)
-        res = self.adjDx(y[:,:,:,0]) + self.adjDy(y[:,:,:,1]) + self.adjDz(y[:,:,:,2])
-        return res
-
-    def amp( self, grad ):
-        amp = np.sqrt(np.sum(grad ** 2,axis=self.ndim))#nomalize u along the third dimension
-        d = np.tile(amp[:,:,:,np.newaxis], (1,1,1,self.ndim))#.reshape(sizeg)
-        return d
-    # image --> sparse domain
-    def backward( self, x ):
-        return self.grad(x)
-    # sparse domain --> image
-    def forward( self, y ):
-        return self.Div(y)    
+    def __init__( self, weights = None ):
+        TVnd.__init__(self, 3, weights)
 
-class TV3d_r:
+# 3d tv on muti-dimension (nd > 3) data
+class TV3d_r( TVnd ):
     "this define functions related to totalvariation minimization"
-    def __init__( self ):
-        self.ndim    = 3         #number of image dimension
-
-    def grad( self, x ): #gradient of x
-        sx = x.shape[0]
-        sy = x.shape[1] 
-        sz = x.shape[2]   
-        Dx = x[np.r_[1:sx, sx-1],:] - x
-        Dy = x[:,np.r_[1:sy, sy-1]] - x
-        Dz = x[:,:,np.r_[1:sz, sz-1]] - x
-        #res = np.zeros((sx,sy,2), dtype=x.dtype)
-        res = np.zeros(x.shape + (self.ndim,), dtype = x.dtype)
-        res[...,0] = Dx
-        res[...,1] = Dy
-        res[...,2] = Dz
-        return res
-
-
-    def adjDx( self, x ):  #used in computing divergense of x
-        sx = x.shape[0]
-        sy = x.shape[1] 
-        sz = x.shape[2] 
-        res = x[np.r_[0, 0:sx-1],:,:] - x
-        res[ 0, :, :] = -x[ 0, :, :]
-        res[-1, :, :] =  x[-2, :, :]
-        return res
-
-    def adjDy( self, x ): #use
-        sx = x.shape[0]
-        sy = x.shape[1] 
-        sz = x.shape[2] 
-        res = x[:,np.r_[0, 0:sy-1],:] - x
-        res[ :, 0, :] = -x[ :, 0, :]
-        res[ :,-1, :] =  x[ :,-2, :]
-        return res
-
-    def adjDz( self, x ):
-        sx = x.shape[0]
-        sy = x.shape[1] 
-        sz = x.shape[2] 
-        res = x[:,:,np.r_[0, 0:sz-1]] - x
-        res[ :, :, 0] = -x[ :, :, 0]
-        res[ :, :,-1] =  x[ :, :,-2]
-        return res
-
-    def Div( self, y ):  #divergense of x
-        #res = np.zeros(y.shape)
-        res = self.adjDx(y[:,:,:,0]) + self.adjDy(y[:,:,:,1]) + self.adjDz(y[:,:,:,2])
-        return res
-
-    def amp( self, grad ):
-        amp = np.sqrt(np.sum(grad ** 2, axis=(len(grad.shape)-1)))#nomalize u along the third dimension
-        amp_shape = amp.shape + (1,)
-        #amp_vec   = tuple(np.ones(len(amp.shape))) + (self.ndim,)
-        #d = np.tile(amp.reshape(amp_shape), amp_vec)#.reshape(sizeg)
-        d = np.ones(amp.shape + (self.ndim,), dtype = amp.dtype)
-        d = np.multiply(amp.reshape(amp_shape), d)
-        return d
-    # image --> sparse domain
-    def backward( self, x ):
-        return self.grad(x)
-    # sparse domain --> image
-    def forward( self, y ):
-        return self.Div(y) 
\ No newline at end of file
+    def __init__( self, weights = None ):
+        TVnd.__init__(self, 3, weights)
@@ -19,9 +19,43 @@
 #fftw_func.test2()
 #fftw_func.test3()
 
+#import test.fft.fftw_plan_cache as fftw_plan_cache
+#fftw_plan_cache.test()
+
+#import test.fft.fft_centered_phase as fft_centered_phase
+#fft_centered_phase.test()
+
+#import fft.benchmark_func as benchmark_func
+#benchmark_func.save_json(benchmark_func.run_all('small'), 'bench.json')
+#benchmark_func.compare_json('bench.json', 'bench_baseline.json', tol = 0.1)
+
+#import test.fft.benchmark_harness as benchmark_harness
+#benchmark_harness.test()
+
 #import test.numbaCUDA_GPU.test_cufft as test_cufft
 #test_cufft.test4()
 
+#import test.fft.nufft_adjoint_accuracy as nufft_adjoint_accuracy
+#nufft_adjoint_accuracy.test()
+
+#import test.fft.nufft_sparse_backend as nufft_sparse_backend
+#nufft_sparse_backend.test()
+
+#import test.fft.nufft_toeplitz as nufft_toeplitz
+#nufft_toeplitz.test()
+
+#import test.fft.nufft_kb_kernel as nufft_kb_kernel
+#nufft_kb_kernel.test()
+
+#import test.fft.nufft_parallel_spread as nufft_parallel_spread
+#nufft_parallel_spread.test()
+
+#import test.fft.nufft_batched as nufft_batched
+#nufft_batched.test()
+
+#import test.fft.complex64_mode as complex64_mode
+#complex64_mode.test()
+
 ##########################################################################
 # MRI regular reconstruction function testing
 ##########################################################################
@@ -37,12 +71,27 @@
 #import test.espirit.espirit_3d_uselib as espirit_3d_uselib
 #espirit_3d_uselib.test()
 
+#import test.espirit.hankel_operator as hankel_operator
+#hankel_operator.test()
+
+#import test.espirit.espirit_eig_svd as espirit_eig_svd
+#espirit_eig_svd.test()
+
+#import test.espirit.espirit_maps_multi as espirit_maps_multi
+#espirit_maps_multi.test()
+
+#import test.espirit.espirit_cache as espirit_cache
+#espirit_cache.test()
+
 #import dwi.dwi_func as dwi_func
 #dwi_func.test()
 
 #import low_rank.low_rank_tensor_func as low_rank_tensor_func
 #low_rank_tensor_func.test()
 
+#import test.low_rank.low_rank_svd_methods as low_rank_svd_methods
+#low_rank_svd_methods.test()
+
 ##########################################################################
 # MRI PICS reconstruction function testing
 ##########################################################################
@@ -69,6 +118,24 @@
 #import test.CS_MRI.cs_ADMM as cs_ADMM
 #cs_ADMM.test()
 
+#import test.CS_MRI.linop_algebra as linop_algebra
+#linop_algebra.test()
+
+#import test.CS_MRI.admm_multi_reg as admm_multi_reg
+#admm_multi_reg.test()
+
+#import test.CS_MRI.linear_cg as linear_cg
+#linear_cg.test()
+
+#import test.CS_MRI.solve_normal as solve_normal
+#solve_normal.test()
+#import test.CS_MRI.fista_restart_pogm as fista_restart_pogm
+#fista_restart_pogm.test()
+#import test.CS_MRI.solver_telemetry as solver_telemetry
+#solver_telemetry.test()
+#import test.CS_MRI.fused_thresholds as fused_thresholds
+#fused_thresholds.test()
+
 #import test.CS_MRI.cs_TV as cs_TV
 #cs_TV.test()
 
@@ -90,6 +157,12 @@
 #import test.CS_MRI.cs_TV_ADMM_3d_cuda as cs_TV_ADMM_3d_cuda
 #cs_TV_ADMM_3d_cuda.test()
 
+#import test.CS_MRI.tv_adjoint_prox_weights as tv_adjoint_prox_weights
+#tv_adjoint_prox_weights.test()
+
+#import test.CS_MRI.step_size_cache as step_size_cache
+#step_size_cache.test()
+
 
 #import test.CS_MRI.cs_MRF_CNN_IST_cuda as cs_MRF_CNN_IST_cuda
 #cs_MRF_CNN_IST_cuda.test()
@@ -202,3 +275,5 @@ cs_MRF_CNN_IST_1p5_cuda.test()
 ##########################################################################
 #import test.parallel_compute_multiCPU.blas_test as blas_test
 #blas_test.test()
+#import test.parallel_compute_multiCPU.batch_recon as batch_recon
+#batch_recon.test()
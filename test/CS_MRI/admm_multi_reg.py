@@ -0,0 +1,93 @@
+"""
+checks of the ADMM engine alg_class.recon with several regularizations against closed form solutions
+full k-space mask, A^H A = n*I, two l1 regularizations on the image:
+argmin ||A(x)-b||^2 + (lambda_1+lambda_2)*||x||_1 is soft_thresh(backward(b), (lambda_1+lambda_2)/(2n)),
+the x-update is the exact solve_normal()
+undersampled mask, two quadratic regularizations (lambda_i/2)*||T_i(x)||^2 with T_i the 2d tv gradient,
+the solution of (2A^H A + sum_i lambda_i*T_i^H T_i) x = 2A^H b with the dense matrices, the x-update is CG
+the z-updates of Nreg > 1 regularizations run in a thread pool, a child process runs ADMM with 4 l1
+regularizations on 256x256 under NUMBA_THREADING_LAYER=workqueue, which aborts (or hangs) on concurrent
+prox kernels
+"""
+import numpy as np
+import os
+import sys
+import subprocess
+import pics.operators_class as opts
+import pics.proximal_func as pf
+import pics.tvop_class as tv_class
+from pics.alg_class import recon
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+# prox of th*||z||^2/2
+def prox_l2( v, th ):
+    return v / (1.0 + th)
+
+# dense matrix of the linear function f on images of shape
+def dense( f, shape ):
+    n = int(np.prod(shape))
+    return np.stack([f(e.reshape(shape)).ravel() for e in np.eye(n, dtype = np.complex128)], axis = 1)
+
+def test_workqueue():
+    rng  = np.random.RandomState(0)
+    mask = (rng.rand(256, 256) > 0.5).astype(np.float64)
+    Aopt = opts.FFT2d_kmask(mask)
+    x    = rng.randn(256, 256) + 1j * rng.randn(256, 256)
+    rec  = recon(Aopt, Aopt.forward(x))
+    for i in range(4):
+        rec.add_reglarization(None, pf.prox_l1_soft_thresh, 0.01)
+    rec.ADMM(Nite = 20)
+
+def test():
+    rng = np.random.RandomState(0)
+    #l1 + l1, closed form
+    shape = (32, 32)
+    n     = np.prod(shape)
+    Aopt  = opts.FFT2d_kmask(np.ones(shape))
+    b     = Aopt.forward(rng.randn(*shape) + 1j * rng.randn(*shape))
+    rec   = recon(Aopt, b)
+    rec.add_reglarization(None, pf.prox_l1_soft_thresh, 20.0)
+    rec.add_reglarization(None, pf.prox_l1_soft_thresh, 30.0)
+    x     = rec.ADMM(rho = 1.0, Nite = 300, eps_abs = 1e-10, eps_rel = 1e-10)
+    x_ref = pf.prox_l1_soft_thresh(Aopt.backward(b), 50.0 / (2 * n))
+    err   = relerr(x, x_ref)
+    print('l1 + l1: error %g to soft_thresh(backward(b)), %d iterations' % (err, len(rec.history)))
+    assert err < 1e-6
+
+    #two quadratic tv terms, CG x-update, dense solution
+    shape = (8, 8)
+    mask  = (rng.rand(*shape) > 0.4).astype(np.float64)
+    Aopt  = opts.FFT2d_kmask(mask)
+    tvop  = tv_class.TV2d()
+    tvw   = tv_class.TV2d((2.0, 0.5))
+    b     = Aopt.forward(rng.randn(*shape) + 1j * rng.randn(*shape))
+    rec   = recon(Aopt, b)
+    rec.add_reglarization(tvop, prox_l2, 3.0)
+    rec.add_reglarization(tvw, prox_l2, 1.0)
+    x     = rec.ADMM(rho = 1.0, Nite = 500, cg_Nite = 10, cg_tol = 1e-12, eps_abs = 1e-12, eps_rel = 1e-12)
+    AHA   = dense(Aopt.normal, shape)
+    T1    = dense(lambda im: tvop.backward(im)[..., 0], shape), dense(lambda im: tvop.backward(im)[..., 1], shape)
+    T2    = dense(lambda im: tvw.backward(im)[..., 0], shape), dense(lambda im: tvw.backward(im)[..., 1], shape)
+    lhs   = 2 * AHA + 3.0 * sum(t.conj().T.dot(t) for t in T1) + 1.0 * sum(t.conj().T.dot(t) for t in T2)
+    x_ref = np.linalg.solve(lhs, 2 * Aopt.adjoint(b).ravel()).reshape(shape)
+    err   = relerr(x, x_ref)
+    print('quadratic tv + weighted tv: error %g to the dense solution, %d iterations' % (err, len(rec.history)))
+    assert err < 1e-6
+
+    #Nreg = 4 under the workqueue threading layer, in a child process
+    env = dict(os.environ, NUMBA_THREADING_LAYER = 'workqueue', PYTHONPATH = os.pathsep.join(sys.path))
+    child = subprocess.Popen([sys.executable, '-c', 'import test.CS_MRI.admm_multi_reg as t; t.test_workqueue()'],\
+                             env = env)
+    try:
+        res = child.wait(timeout = 300)
+    except subprocess.TimeoutExpired:
+        #the workqueue layer can also hang on a concurrent launch instead of aborting
+        child.kill()
+        res = -1
+    print('ADMM with 4 regularizations under workqueue: exit code %d' % res)
+    assert res == 0
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,77 @@
+"""
+checks of FISTA_3 in pics/CS_MRI_solvers_func.py (backtracking, adaptive restart, relative change stop and POGM)
+on a lasso with a closed form, argmin (1/2)*||A(x)-b||_2^2 + th*||x||_1 for A = Q*diag(d), Q unitary,
+the problem is separable in x, x_i = soft(d_i*(Q^H b)_i, th)/d_i^2,
+every variant reaches it (within the 1e-6 of prox_l1_soft_thresh2), backtracking from a too large step too,
+the default step is the power iteration estimate of ||A^H A||, the restarts take fewer Afunc calls
+than plain FISTA, POGM without restart follows the iteration of Kim and Fessler (2018) step by step
+(it only converges like 1/k on this strongly convex problem, so it is compared at fixed Nite),
+and Nite and tol stop the iterations
+"""
+import numpy as np
+import pics.CS_MRI_solvers_func as solvers
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def test():
+    rng = np.random.RandomState(0)
+    n   = 64
+    Q   = np.linalg.qr(rng.randn(n, n) + 1j * rng.randn(n, n))[0]
+    d   = np.linspace(0.3, 3.0, n)
+    A   = Q * d
+    #scaled so that the 1e-6 in the denominator of prox_l1_soft_thresh2 is negligible
+    b   = 100 * (A.dot(rng.randn(n) * (rng.rand(n) > 0.6)) + 0.05 * (rng.randn(n) + 1j * rng.randn(n)))
+    th  = 10.0
+    c   = d * Q.conj().T.dot(b)
+    ref = np.maximum(np.abs(c) - th, 0) * np.exp(1j * np.angle(c)) / d ** 2
+    calls = []
+    def Afunc( x ):
+        calls.append(1)
+        return A.dot(x)
+    invAfunc = lambda y: A.conj().T.dot(y)
+    Tfunc    = lambda x: x
+    L        = np.max(d) ** 2
+    ncalls   = {}
+    for name, kwargs in (('fista', dict(step = 1.0 / L, restart = False, backtrack = False)),\
+                         ('fista restart', dict(step = 1.0 / L, backtrack = False)),\
+                         ('fista backtracking from 10/L', dict(step = 10.0 / L)),\
+                         ('fista power iteration step', dict()),\
+                         ('pogm restart', dict(step = 1.0 / L, pogm = True))):
+        del calls[:]
+        x   = solvers.FISTA_3(Afunc, invAfunc, Tfunc, Tfunc, b, th, Nite = 5000, tol = 1e-10, **kwargs)
+        err = relerr(x, ref)
+        ncalls[name] = len(calls)
+        print('%s: %d Afunc calls, error %g' % (name, len(calls), err))
+        assert err < 1e-5
+    assert ncalls['fista restart'] < ncalls['fista'] and ncalls['pogm restart'] < ncalls['fista']
+
+    #pogm without restart against the iteration written out from the paper
+    soft = lambda v, t: v / (np.abs(v) + 1e-6) * np.maximum(np.abs(v) - t, 0)
+    for Nite in (1, 2, 50):
+        xr = A.conj().T.dot(b)
+        w_pre, z_pre, x_pre, theta, gamma = xr, xr, xr, 1.0, 1.0 / L
+        for k in range(Nite):
+            w = x_pre - A.conj().T.dot(A.dot(x_pre) - b) / L
+            theta_new = (1.0 + np.sqrt(1.0 + (8.0 if k == Nite - 1 else 4.0) * theta ** 2)) / 2.0
+            gamma_new = (2.0 * theta + theta_new - 1.0) / (L * theta_new)
+            z = w + (theta - 1.0) / theta_new * (w - w_pre) + theta / theta_new * (w - x_pre)\
+                  + (theta - 1.0) / (L * gamma * theta_new) * (z_pre - x_pre)
+            xr = soft(z, th * gamma_new)
+            w_pre, z_pre, x_pre, theta, gamma = w, z, xr, theta_new, gamma_new
+        del calls[:]
+        x = solvers.FISTA_3(Afunc, invAfunc, Tfunc, Tfunc, b, th, Nite = Nite, tol = 0, step = 1.0 / L,\
+                            pogm = True, restart = False)
+        print('pogm Nite %d: error to the paper iteration %g' % (Nite, relerr(x, xr)))
+        assert relerr(x, xr) < 1e-12 and len(calls) == Nite
+
+    #stopping
+    del calls[:]
+    solvers.FISTA_3(Afunc, invAfunc, Tfunc, Tfunc, b, th, Nite = 7, tol = 0, step = 1.0 / L, backtrack = False)
+    assert len(calls) == 7 + 2
+    del calls[:]
+    solvers.FISTA_3(Afunc, invAfunc, Tfunc, Tfunc, b, th, Nite = 5000, tol = 1e-3, step = 1.0 / L)
+    assert len(calls) < ncalls['fista restart']
+
+if __name__ == "__main__":
+    test()
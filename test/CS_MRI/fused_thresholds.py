@@ -0,0 +1,93 @@
+"""
+checks of the fused numba thresholds in pics/proximal_func.py against the numpy expressions they replaced
+soft:  exp(1j*angle(x))*max(|x|-th,0), complex output
+soft2: x/(|x|+1e-6)*max(|x|-th,0)
+hard:  x/(|x|+1e-6)*|x|*(|x|>=th)
+for float32/float64/complex64/complex128 x of several shapes, with zeros and |x| == th (hard keeps it),
+a non-contiguous x, the output dtype (soft is complex in the precision of x, soft2/hard keep the dtype),
+out = a given array and out = x in place, an array th (numpy path),
+the group soft threshold against x*max(||x||-th,0)/||x|| with the norm along axis, a group of one
+is the soft threshold, a non-contiguous out raises ValueError
+"""
+import numpy as np
+import pics.proximal_func as pf
+
+def old_soft( x, th ):
+    a_th = np.abs(x) - th
+    a_th[a_th < 0] = 0
+    return np.multiply(np.exp(1j * np.angle(x)), a_th)
+
+def old_soft2( x, th ):
+    a_th = np.abs(x) - th
+    a_th[a_th < 0] = 0
+    return np.multiply(np.divide(x, np.abs(x) + 1e-6), a_th)
+
+def old_hard( x, th ):
+    a_th = np.abs(x)
+    a_th[a_th < th] = 0
+    return np.multiply(np.divide(x, np.abs(x) + 1e-6), a_th)
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def test():
+    rng = np.random.RandomState(0)
+    th  = 0.75
+    for dtype, tol in ((np.float64, 1e-14), (np.complex128, 1e-14), (np.float32, 1e-6), (np.complex64, 1e-6)):
+        for shape in ((1000,), (17, 9, 5)):
+            x = rng.randn(*shape)
+            if np.iscomplexobj(dtype(0)):
+                x = x + 1j * rng.randn(*shape)
+            x = x.astype(dtype)
+            x.flat[:3] = 0
+            x.flat[3]  = th
+            cdtype = np.result_type(dtype, np.complex64)
+            for name, new, old, out_dtype in (('soft', pf.prox_l1_soft_thresh, old_soft, cdtype),\
+                                              ('soft2', pf.prox_l1_soft_thresh2, old_soft2, dtype),\
+                                              ('hard', pf.prox_l0_hard_thresh, old_hard, dtype)):
+                ref = old(x.astype(np.result_type(dtype, np.float64)), th)
+                res = new(x, th)
+                err = relerr(res, ref)
+                print('%s %s %s: error %g' % (name, np.dtype(dtype).name, shape, err))
+                assert res.dtype == out_dtype and res.shape == shape and err < tol
+                assert np.all(res.flat[:3] == 0) and np.all(np.isfinite(res))
+                assert (res.flat[3] != 0) == (name == 'hard')
+                #non-contiguous input
+                xt = x.T if x.ndim > 1 else x[::2]
+                rt = old(xt.astype(np.result_type(dtype, np.float64)), th)
+                assert relerr(new(xt, th), rt) < tol
+                #given output and in place
+                out = np.empty(shape, dtype = out_dtype)
+                assert new(x, th, out = out) is out and np.array_equal(out, res)
+                if out_dtype == dtype:
+                    xi = x.copy()
+                    assert new(xi, th, out = xi) is xi and np.array_equal(xi, res)
+                #array threshold
+                tha = rng.rand(*shape)
+                assert relerr(new(x, tha), old(x.astype(np.result_type(dtype, np.float64)), tha)) < tol
+                try:
+                    new(x, th, out = np.empty(shape + (2,), dtype = out_dtype)[..., 0])
+                    assert False
+                except ValueError:
+                    pass
+
+    #group soft threshold
+    x = rng.randn(6, 4, 5) + 1j * rng.randn(6, 4, 5)
+    x[2, :, 3] = 0
+    for axis in (0, 1, -1):
+        nrm = np.sqrt(np.sum(np.abs(x) ** 2, axis = axis, keepdims = True))
+        ref = x * np.maximum(nrm - 1.5, 0) / np.maximum(nrm, 1e-300)
+        res = pf.prox_l1_group_soft_thresh(x, 1.5, axis = axis)
+        print('group axis %d: error %g, %d of %d groups kept' % (axis, relerr(res, ref),\
+              np.sum(nrm > 1.5), nrm.size))
+        assert relerr(res, ref) < 1e-14 and np.all(np.isfinite(res))
+        kept = np.any(res != 0, axis = axis)
+        assert np.array_equal(kept, np.squeeze(nrm > 1.5, axis = axis))
+    x64 = x.astype(np.complex64)
+    res = pf.prox_l1_group_soft_thresh(x64, 1.5, axis = 1, out = x64)
+    assert res is x64 and relerr(res, pf.prox_l1_group_soft_thresh(x, 1.5, axis = 1)) < 1e-6
+    y = rng.randn(7, 1, 8) + 1j * rng.randn(7, 1, 8)
+    assert relerr(pf.prox_l1_group_soft_thresh(y, 0.5, axis = 1), old_soft(y, 0.5)) < 1e-14
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,68 @@
+"""
+checks of the linear conjugate gradient opt_alg.linear_cg() and the l2 proximal prox_l2_Afxnb_CG()
+linear_cg solves a hermitian positive definite system as np.linalg.solve, with one Mfunc call per iteration,
+a jacobi preconditioner reaches the tolerance in fewer iterations on a badly scaled system,
+the warm start at the solution stops without iterations,
+prox_l2_Afxnb_CG is argmin_x ||Ax-b||^2 + rho/2*||x-x0||^2 of the dense normal equations,
+with a fused ATAfunc too, and it reaches a lower objective than the nonlinear prox_l2_Afxnb_CGD
+it replaced (which stops in the backtracking line search) with fewer Afunc calls
+"""
+import numpy as np
+import pics.opt_alg as alg
+import pics.proximal_func as pf
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def test():
+    rng = np.random.RandomState(0)
+    n   = 40
+    B   = rng.randn(n, n) + 1j * rng.randn(n, n)
+    d   = 10.0 ** rng.uniform(0, 3, n)
+    M   = (B.conj().T.dot(B) / n + np.eye(n)) * np.sqrt(np.outer(d, d)) #badly scaled hpd
+    rhs = rng.randn(n) + 1j * rng.randn(n)
+    ref = np.linalg.solve(M, rhs)
+    calls = []
+    def Mfunc( x ):
+        calls.append(1)
+        return M.dot(x)
+    ncalls = []
+    for name, Pfunc in (('cg', None), ('jacobi pcg', lambda r: r / np.real(np.diag(M)))):
+        del calls[:]
+        x   = alg.linear_cg(Mfunc, rhs, np.zeros(n, dtype = np.complex128), 1000, tol = 1e-12, Pfunc = Pfunc)
+        err = relerr(x, ref)
+        print('%s: %d Mfunc calls, error %g' % (name, len(calls), err))
+        assert err < 1e-9
+        ncalls.append(len(calls))
+    assert ncalls[1] < ncalls[0]
+    del calls[:]
+    x = alg.linear_cg(Mfunc, rhs, ref, 100, tol = 1e-6)
+    assert len(calls) == 1 and np.array_equal(x, ref)
+
+    #l2 proximal, argmin_x ||Ax-b||^2 + rho/2*||x-x0||^2
+    m, rho = 60, 0.5
+    A  = rng.randn(m, n) + 1j * rng.randn(m, n)
+    b  = rng.randn(m) + 1j * rng.randn(m)
+    x0 = rng.randn(n) + 1j * rng.randn(n)
+    ref = np.linalg.solve(2 * A.conj().T.dot(A) + rho * np.eye(n), 2 * A.conj().T.dot(b) + rho * x0)
+    nA  = []
+    def Afunc( x ):
+        nA.append(1)
+        return A.dot(x)
+    invAfunc = lambda y: A.conj().T.dot(y)
+    x1  = pf.prox_l2_Afxnb_CG(Afunc, invAfunc, b, x0, rho, 200, tol = 1e-12)
+    n1  = len(nA)
+    AHA = A.conj().T.dot(A)
+    x2  = pf.prox_l2_Afxnb_CG(Afunc, invAfunc, b, x0, rho, 200, tol = 1e-12, ATAfunc = lambda x: AHA.dot(x), x_init = x1)
+    del nA[:]
+    x3  = pf.prox_l2_Afxnb_CGD(Afunc, invAfunc, b, x0, rho, 200)
+    n3  = len(nA)
+    f   = lambda x: np.linalg.norm(A.dot(x) - b) ** 2 + (rho / 2) * np.linalg.norm(x - x0) ** 2
+    print('prox_l2_Afxnb_CG: error %g, objective %g with %d Afunc calls, fused and warm started %g,'\
+          ' prox_l2_Afxnb_CGD: objective %g with %d Afunc calls'\
+          % (relerr(x1, ref), f(x1), n1, relerr(x2, ref), f(x3), n3))
+    assert relerr(x1, ref) < 1e-10 and relerr(x2, ref) < 1e-10
+    assert f(x1) <= f(x3) and n1 < n3
+
+if __name__ == "__main__":
+    test()
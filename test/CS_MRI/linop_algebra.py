@@ -0,0 +1,107 @@
+"""
+checks of the operator algebra in pics/linop_class.py against dense matrices
+composition, sum, complex scaling, adjoint and stack of dense matrix operators and of the
+masked fft (FFT2d_kmask) composed with coil sensitivities (espirit):
+forward is the matrix product, adjoint the conjugate transpose, normal (fused) is A^H A,
+backward follows the adjoint formula on the backward of the operands,
+out is honoured and the cached intermediate arrays do not change the results of later calls,
+arrays are rejected as operators, a subclass without backward can not be instantiated
+"""
+import numpy as np
+import pics.operators_class as opts
+from pics.linop_class import LinearOperator, StackedOperator
+
+# dense matrix M on vectors, backward is the pseudo inverse
+class MatrixOperator( LinearOperator ):
+    "this is a dense matrix operator for the checks"
+    def __init__( self, M ):
+        self.M    = M
+        self.Minv = np.linalg.pinv(M)
+    def forward( self, x, out = None ):
+        return np.dot(self.M, x, out = out)
+    def backward( self, y, out = None ):
+        return np.dot(self.Minv, y, out = out)
+    def adjoint( self, y, out = None ):
+        return np.dot(self.M.conj().T, y, out = out)
+
+class NoBackward( LinearOperator ):
+    "this forgets backward"
+    def forward( self, x, out = None ):
+        return x
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def crandn( rng, *shape ):
+    return rng.randn(*shape) + 1j * rng.randn(*shape)
+
+def test():
+    rng = np.random.RandomState(0)
+    MA, MB, MC = crandn(rng, 7, 5), crandn(rng, 6, 7), crandn(rng, 7, 5)
+    A, B, C = MatrixOperator(MA), MatrixOperator(MB), MatrixOperator(MC)
+    alpha = 0.5 - 2.0j
+    x, y, w = crandn(rng, 5), crandn(rng, 6), crandn(rng, 7)
+    H = lambda M: M.conj().T
+    #operator, dense matrix, dense backward
+    cases = (('B*A', B * A, MB.dot(MA), A.Minv.dot(B.Minv)),
+             ('A+C', A + C, MA + MC, A.Minv + C.Minv),
+             ('A-C', A - C, MA - MC, A.Minv - C.Minv),
+             ('alpha*A', alpha * A, alpha * MA, np.conj(alpha) * A.Minv),
+             ('A*alpha', A * alpha, alpha * MA, np.conj(alpha) * A.Minv),
+             ('-A', -A, -MA, -A.Minv),
+             ('B*(A+alpha*C)', B * (A + alpha * C), MB.dot(MA + alpha * MC), A.Minv.dot(B.Minv) + np.conj(alpha) * C.Minv.dot(B.Minv)),
+             ('A.H', A.H, H(MA), MA))
+    for name, op, M, Minv in cases:
+        xi = x if M.shape[1] == 5 else w
+        yi = y if M.shape[0] == 6 else (w if M.shape[0] == 7 else x)
+        errs = (relerr(op.forward(xi), M.dot(xi)), relerr(op.adjoint(yi), H(M).dot(yi)),\
+                relerr(op.normal(xi), H(M).dot(M.dot(xi))), relerr(op.backward(yi), Minv.dot(yi)))
+        print('%s: forward %g, adjoint %g, normal %g, backward %g' % ((name,) + errs))
+        assert max(errs) < 1e-12
+
+    #stack, forward is a list, adjoint and normal sum over it
+    S  = StackedOperator([A, alpha * C])
+    ys = S.forward(x)
+    assert relerr(ys[0], MA.dot(x)) < 1e-12 and relerr(ys[1], alpha * MC.dot(x)) < 1e-12
+    assert relerr(S.adjoint([w, w]), H(MA).dot(w) + np.conj(alpha) * H(MC).dot(w)) < 1e-12
+    assert relerr(S.normal(x), (H(MA).dot(MA) + abs(alpha) ** 2 * H(MC).dot(MC)).dot(x)) < 1e-12
+
+    #masked fft and coil sensitivities, fused normal and adjointness
+    shape = (16, 12)
+    mask  = (rng.rand(*shape) > 0.5).astype(np.float64)
+    sens  = crandn(rng, 16, 12, 4)
+    FTm, esp = opts.FFT2d_kmask(mask), opts.espirit(sens)
+    Aopt  = FTm * esp
+    im    = crandn(rng, *shape)
+    ksp   = crandn(rng, 16, 12, 4)
+    ref   = mask[..., np.newaxis] * np.fft.ifftshift(np.fft.fft2(np.fft.fftshift(sens * im[..., np.newaxis],\
+            axes = (0, 1)), axes = (0, 1)), axes = (0, 1))
+    err_f = relerr(Aopt.forward(im), ref)
+    err_a = abs(np.vdot(Aopt.forward(im), ksp) - np.vdot(im, Aopt.adjoint(ksp))) / abs(np.vdot(ref, ksp))
+    err_n = relerr(Aopt.normal(im), Aopt.adjoint(Aopt.forward(im)))
+    print('FTm*esp: forward %g, adjointness %g, fused normal %g' % (err_f, err_a, err_n))
+    assert max(err_f, err_a, err_n) < 1e-12
+
+    #out is honoured, the cached intermediates do not change later results
+    out = np.zeros(ksp.shape, dtype = np.complex128)
+    res = Aopt.forward(im, out = out)
+    assert res is out and relerr(out, ref) < 1e-12
+    first = Aopt.normal(im)
+    Aopt.normal(crandn(rng, *shape))
+    assert np.array_equal(Aopt.normal(im), first)
+    out = np.zeros(5, dtype = np.complex128)
+    assert (A + C).adjoint(w, out = out) is out and relerr(out, H(MA + MC).dot(w)) < 1e-12
+    out = np.zeros(7, dtype = np.complex128)
+    assert (alpha * A).forward(x, out = out) is out and relerr(out, alpha * MA.dot(x)) < 1e-12
+
+    #arrays are not operators, forward/backward are abstract
+    for f in (lambda: A * MA, lambda: MA * A, lambda: A + MA, lambda: A - MA, lambda: NoBackward()):
+        try:
+            f()
+        except TypeError as err:
+            print('TypeError: %s' % err)
+        else:
+            raise AssertionError('no TypeError')
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,62 @@
+"""
+checks of the exact solve_normal(rho, rhs) of the cartesian fft operators in pics/operators_class.py
+x = solve_normal(rho, rhs) solves normal(x) + rho*x = rhs (adjoint = True), and
+backward(forward(x)) + rho*x = rhs (adjoint = False), with and without a (weighted) mask and extra coil axes,
+a composition espirit -> FFT2d_kmask has solve_normal if the single coil map has |sens| = 1 (unitary),
+and none for several coils, the ADMM x-update of alg_class.recon with identity/unitary transforms is the
+linear CG solution of the same system, and prox_l2_Afxnb_CG with forward/adjoint of the operator is exact
+"""
+import numpy as np
+import pics.operators_class as opts
+import pics.proximal_func as pf
+import pics.alg_class as alg_class
+from pics.opt_alg import linear_cg
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def test():
+    rng   = np.random.RandomState(0)
+    shape = (16, 12, 6, 2)
+    rhs   = rng.randn(*shape) + 1j * rng.randn(*shape)
+    mask  = (rng.rand(*shape[:3]) > 0.5) * rng.uniform(0.5, 2.0, shape[:3])
+    rho   = 0.7
+    for op in (opts.FFT2d(), opts.FFT2d_kmask(mask[..., 0]), opts.FFTnd(), opts.FFTnd_kmask(mask),\
+               opts.FFTW2d(), opts.FFTW2d_kmask(mask[..., 0]), opts.FFTWnd(), opts.FFTWnd_kmask(mask)):
+        x1 = op.solve_normal(rho, rhs)
+        x2 = op.solve_normal(rho, rhs, adjoint = False)
+        err1 = relerr(op.normal(x1) + rho * x1, rhs)
+        err2 = relerr(op.backward(op.forward(x2)) + rho * x2, rhs)
+        print('%s: normal %g, backward(forward) %g' % (type(op).__name__, err1, err2))
+        assert err1 < 1e-12 and err2 < 1e-12
+
+    #composition with a unitary single coil map
+    im    = rng.randn(16, 12) + 1j * rng.randn(16, 12)
+    FTm   = opts.FFT2d_kmask(mask[..., 0])
+    phase = np.exp(1j * rng.uniform(-np.pi, np.pi, (16, 12, 1)))
+    Aopt  = opts.joint2operators(opts.espirit(phase), FTm)
+    x     = Aopt.solve_normal(rho, im)
+    err   = relerr(Aopt.normal(x) + rho * x, im)
+    print('espirit(|sens| = 1) -> FFT2d_kmask: %g' % err)
+    assert err < 1e-12
+    assert opts.joint2operators(opts.espirit(np.tile(phase, (1, 1, 2))), FTm).solve_normal is None
+
+    #ADMM x-update, exact solve against linear CG on 2*A^H A + rho*Nreg*I
+    b   = FTm.forward(rng.randn(16, 12) + 1j * rng.randn(16, 12))
+    rec = alg_class.recon(FTm, b)
+    rec.add_reglarization(None, pf.prox_l1_soft_thresh, 0.01)
+    rec.add_reglarization(opts.None_opt(), pf.prox_l1_soft_thresh, 0.01)
+    x0  = FTm.backward(b)
+    xe  = rec._xupdate(x0, im, rho, 0, 1e-12)
+    xc  = linear_cg(lambda xi: rec._lhs(xi, rho), im, x0, 500, 1e-13)
+    print('ADMM x-update, exact against CG: %g' % relerr(xe, xc))
+    assert relerr(xe, xc) < 1e-10
+
+    #l2 proximal, argmin_x ||Ax-b||^2 + rho/2*||x-x0||^2
+    xp  = pf.prox_l2_Afxnb_CG(FTm.forward, FTm.adjoint, b, x0, rho, 0)
+    xl  = pf.prox_l2_Afxnb_CG(lambda xi: FTm.forward(xi), lambda y: FTm.adjoint(y), b, x0, rho, 500, tol = 1e-13)
+    print('prox_l2_Afxnb_CG, solve_normal against CG: %g' % relerr(xp, xl))
+    assert relerr(xp, xl) < 1e-10
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,139 @@
+"""
+checks of the per-iteration telemetry (utilities_class.telemetry) of the solvers
+on a small least squares + l1 problem with a dense A:
+the iterates with telemetry are the same as without, and it costs no extra Afunc call,
+the residuals of IST_3 are ||A(x^k)-b|| of the residual loop the solver printed before,
+the objective is only evaluated with objective = True, the callback gets every record,
+forward/backward/prox times are at least the sleep in the timed functions and add up in summary(),
+FISTA_3 and POGM report their momentum restarts (none with restart = False),
+conjugate_gradient and prox_l2_Afxnb_CGD record the gradient norms and the objective of the iterate,
+recon.ADMM records its history
+"""
+import numpy as np
+import time
+import pics.CS_MRI_solvers_func as solvers
+import pics.opt_alg as alg
+import pics.proximal_func as pf
+import pics.operators_class as opts
+from pics.alg_class import recon
+from utilities.utilities_class import telemetry
+
+def test():
+    rng  = np.random.RandomState(0)
+    m, n = 48, 32
+    A    = rng.randn(m, n) + 1j * rng.randn(m, n)
+    b    = A.dot(rng.randn(n) * (rng.rand(n) > 0.7)) + 0.01 * rng.randn(m)
+    th   = 0.5
+    step = 1.0 / np.linalg.norm(A, 2) ** 2
+    calls = []
+    def Afunc( x ):
+        calls.append(1)
+        return A.dot(x)
+    invAfunc = lambda y: A.conj().T.dot(y)
+    Tfunc    = lambda x: x
+
+    #IST_3, against the loop with the residual print of the old solver
+    x_acc, res = step * invAfunc(b), []
+    for k in range(20):
+        x = pf.prox_l1_Tf_soft_thresh2(Tfunc, Tfunc, x_acc, th)
+        r = A.dot(x) - b
+        res.append(np.linalg.norm(r))
+        x_acc = x_acc - step * invAfunc(r)
+    del calls[:]
+    x0 = solvers.IST_3(Afunc, invAfunc, Tfunc, Tfunc, b, 20, step, th)
+    n0 = len(calls)
+    seen = []
+    tel  = telemetry(callback = seen.append)
+    del calls[:]
+    x1 = solvers.IST_3(Afunc, invAfunc, Tfunc, Tfunc, b, 20, step, th, telemetry = tel)
+    print('IST_3: residual error %g to the old loop' % np.max(np.abs(np.array(tel.get('residual')) - res)))
+    assert np.array_equal(x0, x1) and len(calls) == n0
+    assert np.allclose(tel.get('residual'), res, rtol = 1e-12) and tel.get('iteration') == list(range(20))
+    assert tel.get('step') == [step] * 20 and tel.get('objective') == [None] * 20
+    assert seen == tel.records
+    for key in ('forward_time', 'backward_time', 'prox_time'):
+        assert all(t is not None and t >= 0 for t in tel.get(key))
+
+    #objective on request, it is ||r||^2 + th*||x||_1 of the record
+    tel = telemetry(objective = True)
+    x2  = solvers.IST_3(Afunc, invAfunc, Tfunc, Tfunc, b, 20, step, th, telemetry = tel)
+    assert np.array_equal(x0, x2)
+    assert np.isclose(tel.records[-1]['objective'], np.linalg.norm(A.dot(x2) - b) ** 2 + th * np.sum(np.abs(x2)))
+
+    #phase timing
+    def slow( f, dt ):
+        def g( *args ):
+            time.sleep(dt)
+            return f(*args)
+        return g
+    tel = telemetry()
+    solvers.IST_2(slow(Afunc, 0.002), slow(invAfunc, 0.001), b, 5, step, th, telemetry = tel)
+    assert all(t >= 0.002 for t in tel.get('forward_time')) and all(t >= 0.001 for t in tel.get('backward_time'))
+    total = tel.summary(display = False)
+    assert np.isclose(total['forward_time'], sum(tel.get('forward_time')))
+    assert total['forward_time'] >= 0.01 and tel.records[-1]['time'] >= total['forward_time']
+
+    #FIST_3 is unchanged by the telemetry
+    del calls[:]
+    x0 = solvers.FIST_3(Afunc, invAfunc, Tfunc, Tfunc, b, 20, step, th)
+    n0 = len(calls)
+    tel = telemetry()
+    del calls[:]
+    x1 = solvers.FIST_3(Afunc, invAfunc, Tfunc, Tfunc, b, 20, step, th, telemetry = tel)
+    assert np.array_equal(x0, x1) and len(calls) == n0 and len(tel.records) == 20
+
+    #restarts of FISTA_3 and POGM
+    for pogm in (False, True):
+        for restart in (False, True):
+            kwargs = dict(Nite = 300, step = step, tol = 1e-8, restart = restart, pogm = pogm)
+            del calls[:]
+            x0 = solvers.FISTA_3(Afunc, invAfunc, Tfunc, Tfunc, b, th, **kwargs)
+            n0 = len(calls)
+            tel = telemetry()
+            del calls[:]
+            x1 = solvers.FISTA_3(Afunc, invAfunc, Tfunc, Tfunc, b, th, telemetry = tel, **kwargs)
+            nrestart = sum(tel.get('restart'))
+            print('%s restart = %s: %d iterations, %d restarts' % ('pogm' if pogm else 'fista', restart,\
+                  len(tel.records), nrestart))
+            assert np.array_equal(x0, x1) and len(calls) == n0
+            assert (nrestart > 0) == restart
+            assert tel.records[-1]['relative_change'] < 1e-8 or len(tel.records) == 300
+
+    #nonlinear conjugate gradient on a quadratic
+    M    = A.conj().T.dot(A) + np.eye(n)
+    c    = invAfunc(b)
+    f    = lambda x: 0.5 * np.vdot(x, M.dot(x)).real - np.vdot(c, x).real
+    df   = lambda x: M.dot(x) - c
+    x0   = alg.conjugate_gradient(f, df, np.zeros(n, np.complex128), 30)
+    tel  = telemetry(objective = True)
+    x1   = alg.conjugate_gradient(f, df, np.zeros(n, np.complex128), 30, telemetry = tel)
+    assert np.array_equal(x0, x1) and 0 < len(tel.records) <= 30
+    assert np.isclose(tel.records[-1]['objective'], f(x1))
+    assert all(0 <= s <= 10 for s in tel.get('line_search'))
+    #the first record is the gradient norm after the first steepest descent step
+    g0 = df(np.zeros(n, np.complex128))
+    a0, _ = alg.BacktrackingLineSearch(f, df, np.zeros(n, np.complex128), -g0)
+    assert np.isclose(tel.records[0]['residual'], np.linalg.norm(df(-a0 * g0)))
+
+    #prox_l2_Afxnb_CGD
+    rho  = 1.0
+    xs   = rng.randn(n) + 1j * rng.randn(n)
+    x0   = pf.prox_l2_Afxnb_CGD(Afunc, invAfunc, b, xs, rho, 20)
+    tel  = telemetry(objective = True)
+    x1   = pf.prox_l2_Afxnb_CGD(Afunc, invAfunc, b, xs, rho, 20, telemetry = tel)
+    assert np.array_equal(x0, x1) and 0 < len(tel.records) <= 20
+    fx   = np.linalg.norm(A.dot(x1) - b) ** 2 + (rho / 2) * np.linalg.norm(x1 - xs) ** 2
+    assert np.isclose(tel.records[-1]['objective'], fx)
+
+    #ADMM of recon
+    shape = (16, 16)
+    Aopt  = opts.FFT2d_kmask((rng.rand(*shape) > 0.5).astype(np.float64))
+    rec   = recon(Aopt, Aopt.forward(rng.randn(*shape) + 1j * rng.randn(*shape)))
+    rec.add_reglarization(None, pf.prox_l1_soft_thresh, 0.1)
+    tel   = telemetry()
+    rec.ADMM(Nite = 30, telemetry = tel)
+    assert [(r['residual'], r['dual_residual'], r['rho']) for r in tel.records] == rec.history
+    print('ADMM: %d records' % len(tel.records))
+
+if __name__ == "__main__":
+    test()
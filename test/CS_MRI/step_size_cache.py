@@ -0,0 +1,64 @@
+"""
+checks of the cached default step of pics/opt_alg.py, 1/max_eig_AHA(Afunc, invAfunc)
+the cache key is the hash of the operator configuration (class, scalar attributes and arrays) of bound methods:
+two operators with different k-space masks get different keys and eigenvalues,
+a new operator object with an equal mask reuses the cached value,
+lambdas and functions are not cached, here a lambda reading a global that changes between calls,
+gradient_descent without step, Afunc and invAfunc raises a ValueError
+"""
+import numpy as np
+import pics.operators_class as opts
+import pics.opt_alg as alg
+
+scale = 1.0
+
+def test():
+    shape = (16, 16)
+    rng   = np.random.RandomState(0)
+    mask1 = (rng.rand(*shape) > 0.5).astype(np.float64)
+    mask2 = 3.0 * mask1
+    alg._max_eig_cache.clear()
+
+    #different masks, different keys and eigenvalues
+    op1, op2 = opts.FFT2d_kmask(mask1), opts.FFT2d_kmask(mask2)
+    h1 = alg.operator_hash(op1.forward, op1.backward)
+    h2 = alg.operator_hash(op2.forward, op2.backward)
+    L1 = alg.max_eig_AHA(op1.forward, op1.backward, shape)
+    L2 = alg.max_eig_AHA(op2.forward, op2.backward, shape)
+    print('mask1: L = %g, mask2 = 3*mask1: L = %g' % (L1, L2))
+    assert h1 is not None and h2 is not None and h1 != h2
+    assert abs(L2 / L1 - 3.0) < 1e-3
+    assert len(alg._max_eig_cache) == 2
+
+    #a new operator with an equal mask hits the cache
+    op3 = opts.FFT2d_kmask(mask1.copy())
+    assert alg.operator_hash(op3.forward, op3.backward) == h1
+    assert alg.max_eig_AHA(op3.forward, op3.backward, shape) == L1
+    assert len(alg._max_eig_cache) == 2
+    #the same operator with another image shape is another key
+    alg.max_eig_AHA(op3.forward, op3.backward, (16, 16, 2))
+    assert len(alg._max_eig_cache) == 3
+
+    #a lambda with the same code and a changed global is not cached
+    global scale
+    Afunc    = lambda x: scale * op1.forward(x)
+    invAfunc = lambda y: scale * op1.backward(y)
+    assert alg.operator_hash(Afunc, invAfunc) is None
+    La = alg.max_eig_AHA(Afunc, invAfunc, shape)
+    scale = 2.0
+    Lb = alg.max_eig_AHA(Afunc, invAfunc, shape)
+    scale = 1.0
+    print('lambda: L = %g, after scale = 2: L = %g' % (La, Lb))
+    assert abs(Lb / La - 4.0) < 1e-3
+    assert len(alg._max_eig_cache) == 3
+
+    #no step and no operators
+    try:
+        alg.gradient_descent(lambda x: x, np.zeros(shape), 10)
+    except ValueError as err:
+        print('gradient_descent: %s' % err)
+    else:
+        raise AssertionError('gradient_descent without step did not raise')
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,75 @@
+"""
+checks of the weighted tv in pics/tvop_class.py and pics/proximal_func.py
+TVnd.Div is the exact adjoint of TVnd.grad, <grad(x), g> = <x, Div(g)>, for 2d, 3d,
+weighted tv and extra axes (coils, echoes), and forward/adjoint of the LinearOperator agree,
+prox_tv() with weights and the default step 1/(4*sum(w**2)) converges to the prox computed with
+5 times more iterations, the objective 0.5*|f - y|^2 + lambda_tv*sum|grad(f)| is the same,
+while the unweighted step 1/8 diverges for weights above 1 (the objective is above the one of y),
+for real data and step = 0.1, prox_tv2d() is the former prox_tv2d() with tvop_func.grad/Div,
+40 iterations with G normalized by sqrt(sum(G**2))
+"""
+import numpy as np
+import pics.tvop_class as tv_class
+import pics.proximal_func as pf
+import pics.tvop_func as tv
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def tv_obj( tvopt, f, y, lambda_tv ):
+    return 0.5 * np.linalg.norm(f - y) ** 2 + lambda_tv * np.sum(tvopt.amp(tvopt.grad(f)))
+
+# the former prox_tv2d, step = 0.1 and 40 iterations
+def prox_tv2d_func( y, lambda_tv, step = 0.1 ):
+    G = np.zeros(y.shape + (2,))
+    for _ in range(40):
+        G = G - step * tv.grad(tv.Div(G) - y / lambda_tv)
+        d = np.sqrt(np.sum(G ** 2, axis = 2))[:, :, np.newaxis]
+        G = G / np.maximum(d, 1.0)
+    return y - lambda_tv * tv.Div(G)
+
+def test():
+    rng = np.random.RandomState(0)
+    #adjointness
+    for ndim, weights, shape in ((2, None, (16, 12)), (2, (2.0, 1.0), (16, 12)), (3, None, (8, 10, 6)),\
+                                 (3, (1.0, 1.0, 3.0), (8, 10, 6)), (2, (1.0, 0.5), (16, 12, 4))):
+        tvopt = tv_class.TVnd(ndim, weights)
+        x     = rng.randn(*shape) + 1j * rng.randn(*shape)
+        g     = rng.randn(*(shape + (ndim,))) + 1j * rng.randn(*(shape + (ndim,)))
+        lhs   = np.vdot(tvopt.grad(x), g)
+        rhs   = np.vdot(x, tvopt.Div(g))
+        err   = abs(lhs - rhs) / abs(lhs)
+        err2  = abs(np.vdot(tvopt.forward(g), x) - np.vdot(g, tvopt.adjoint(x))) / abs(lhs)
+        print('tv %dd, weights %s, shape %s: adjointness error %g, %g' % (ndim, weights, shape, err, err2))
+        assert err < 1e-12 and err2 < 1e-12
+
+    #prox with weights, a piecewise constant image plus noise
+    y = np.zeros((32, 32))
+    y[8:24, 8:24] = 1.0
+    y[12:20, 4:28] += 0.5
+    y = y + 0.1 * rng.randn(32, 32)
+    lambda_tv = 0.1
+    for weights in ((1.0, 1.0), (2.0, 2.0), (3.0, 1.0)):
+        tvopt = tv_class.TV2d(weights)
+        step  = 1.0 / (4.0 * np.sum(np.asarray(weights) ** 2))
+        f     = pf.prox_tv(tvopt, y, lambda_tv, Nite = 2000)
+        f_ref = pf.prox_tv(tvopt, y, lambda_tv, step = step, Nite = 10000)
+        err   = relerr(f, f_ref)
+        obj, obj_ref = tv_obj(tvopt, f, y, lambda_tv), tv_obj(tvopt, f_ref, y, lambda_tv)
+        print('prox_tv weights %s: error %g to the reference, objective %g (%g for the reference)'\
+              % (weights, err, obj, obj_ref))
+        assert err < 5e-3 and obj < obj_ref * (1 + 1e-3)
+        if step < 1.0 / 8:
+            f8 = pf.prox_tv(tvopt, y, lambda_tv, step = 1.0 / 8, Nite = 2000)
+            obj8, obj_y = tv_obj(tvopt, f8, y, lambda_tv), tv_obj(tvopt, y, y, lambda_tv)
+            print('  unweighted step 1/8: objective %g (%g for y)' % (obj8, obj_y))
+            assert obj8 > obj_y
+
+    #former result for real data with step = 0.1
+    for lambda_tv in (0.05, 0.2):
+        err = relerr(pf.prox_tv2d(y, lambda_tv, step = 0.1), prox_tv2d_func(y, lambda_tv))
+        print('prox_tv2d vs the tvop_func prox_tv2d, lambda %g: error %g' % (lambda_tv, err))
+        assert err < 1e-12
+
+if __name__ == "__main__":
+    test()
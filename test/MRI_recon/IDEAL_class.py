@@ -1,5 +1,6 @@
 import numpy as np
 import utilities.utilities_func as ut
+from pics.linop_class import LinearOperator, to_out
 # this is for classic IDEAL recon, the three estimates are water, fat, b0/freq_offset
 # the b0/freq_offset is complex number, which contains freq in the real part and r2 in imag part
 class IDEAL_dataformat:
@@ -158,7 +159,7 @@ class IDEAL_opt:
 # which in combine with forward function apply to the minimization: min_d_beta ||Jacobian*d_beta-residual||_2^2 + ...
 # e.g. for min_d_beta ||J*d_beta-R||_2^2 the d_beta can be acqire as d_beta=(J^H*J)^-1*J^H*R
 # e.g. for min_d_beta ||J*d_beta-R||_2^2 + ||beta+d_beta||_1 the d_beta could be solved by CGD, ADMM, IST methods
-class IDEAL_opt2:
+class IDEAL_opt2( LinearOperator ):
     def __init__( self, TEs, freq_wf, rel_amp ):
         self.TEs        = TEs
         self.freq_wf    = freq_wf #vector freqs for several fat peaks
@@ -186,7 +187,7 @@ class IDEAL_opt2:
     # J*d_beta = (d_water + Allfpeak * d_fat) * exp(Cte*offres)
     #          + (water   + Allfpeak * fat  ) * Cte * exp(Cte*offres) * d_offres
     #          = [(d_water + Allfpeak * d_fat) + (water   + Allfpeak * fat) * Cte * d_offres] * exp(Cte*offres)
-    def forward( self, d_x ):
+    def forward( self, d_x, out = None ):
         if self.beta_shape is None:#if beta_shape is not defined copy the dimenstion from d_x, removing the last dim
             self.beta_shape = d_x.shape[0:len(d_x.shape)-1]
         #beta is estimate: water, fat and offres
@@ -201,7 +202,7 @@ class IDEAL_opt2:
             E1          = np.multiply(beta.water + beta.fat * Allfpeak, d_beta.offres) * Cte#(water + Allfpeak * fat) * Cte * d_offres
             E2          = d_beta.water + d_beta.fat * Allfpeak#(d_water + Allfpeak * d_fat)
             d_im[...,j] = np.multiply(E1 + E2 , np.exp(Cte * beta.offres)) #J*d_beta
-        return d_im
+        return to_out(d_im, out)
 
     # tanspose of Jacobian applies to d_image
     # d_im = (t,ifft(d_ksp))--->d_beta
@@ -213,7 +214,7 @@ class IDEAL_opt2:
     #im = water*exp(Cte*offres)+fat*Allfpeak*exp(Cte*offres)
     #     => d_im/d_offres = water*exp(Cte*offres)*Cte+Allfpeak*fat*Cte*exp(Cte*offres)
     #     => d_im*conj(d_im/d_offres) = d_im*conj[exp(Cte*offres)*Cte*(water+Allfpeak*fat)]
-    def backward( self, d_im ):
+    def backward( self, d_im, out = None ):
         if self.beta_shape is None: #beta_shape is not defined, copy d_im dims remove the last dim which is TE dim
             self.beta_shape = d_im.shape[0:len(self.x.shape)-1]
         beta   = IDEAL_dataformat(self.beta_shape) #class defines the beta/data_format
@@ -227,7 +228,7 @@ class IDEAL_opt2:
             d_beta.fat    += np.multiply(np.conj(Allfpeak * Eoffres), d_im[...,j])
             d_beta.offres += np.multiply(np.conj(np.multiply(Cte * Eoffres,\
             	             (beta.water+Allfpeak*beta.fat))),d_im[...,j])
-        return d_beta.beta2x()#convert to x format
+        return to_out(d_beta.beta2x(), out)#convert to x format
 
     # apply the model in image space, f(x)
     def model( self ):
@@ -277,7 +278,7 @@ class IDEAL_opt2:
 # which in combine with forward function apply to the minimization: min_d_beta ||Jacobian*d_beta-residual||_2^2 + ...
 # e.g. for min_d_beta ||J*d_beta-R||_2^2 the d_beta can be acqire as d_beta=(J^H*J)^-1*J^H*R
 # e.g. for min_d_beta ||J*d_beta-R||_2^2 + ||beta+d_beta||_1 the d_beta could be solved by CGD, ADMM, IST methods
-class IDEAL_fatmyelin_opt2:
+class IDEAL_fatmyelin_opt2( LinearOperator ):
     def __init__( self, TEs, freq_wf, rel_amp ):
         self.TEs        = TEs
         self.freq_wf    = freq_wf #vector freqs for several fat peaks
@@ -309,7 +310,7 @@ class IDEAL_fatmyelin_opt2:
     #          + d_offres_fat   * Allfpeak * fat * exp(Cte*offres_fat) * Cte
     #          = (d_water + d_offres_water * water * Cte) * exp(Cte * offres_water)
     #          + (d_fat   + d_offres_fat   * fat   * Cte) * Allfpeak * exp(Cte*offres_fat)
-    def forward( self, d_x ):
+    def forward( self, d_x, out = None ):
         if self.beta_shape is None:#if beta_shape is not defined copy the dimenstion from d_x, removing the last dim
             self.beta_shape = d_x.shape[0:len(d_x.shape)-1]
         #beta is estimate: water, fat and offres
@@ -325,7 +326,7 @@ class IDEAL_fatmyelin_opt2:
             E2          = d_beta.fat   + np.multiply(beta.fat,   d_beta.offres_fat  ) * Cte#(d_water + Allfpeak * d_fat)
             d_im[...,j] = np.multiply(E1, np.exp(Cte * beta.offres_water))\
                         + np.multiply(E2, np.exp(Cte * beta.offres_fat  )) * Allfpeak
-        return d_im
+        return to_out(d_im, out)
 
     # tanspose of Jacobian applies to d_image
     # d_im = (t,ifft(d_ksp))--->d_beta
@@ -340,7 +341,7 @@ class IDEAL_fatmyelin_opt2:
     # im = water*exp(Cte*offres_water)+fat*Allfpeak*exp(Cte*offres_fat)
     #     => d_im/d_offres_fat = fat*Allfpeak*exp(Cte*offres_fat)*Cte
     #     => d_im*conj(d_im/d_offres_fat) = d_im*conj[fat*Allfpeak*exp(Cte*offres_fat)*Cte]
-    def backward( self, d_im ):
+    def backward( self, d_im, out = None ):
         if self.beta_shape is None: #beta_shape is not defined, copy d_im dims
             self.beta_shape = d_im.shape
         beta   = IDEAL_fatmyelin_dataformat(self.beta_shape) #class defines the beta/data_format
@@ -357,7 +358,7 @@ class IDEAL_fatmyelin_opt2:
                                                             (beta.water))),d_im[...,j])
             d_beta.offres_fat   += np.multiply(np.conj(np.multiply(Cte * Eoffres_fat,\
                                                             (beta.fat * Allfpeak))),d_im[...,j])
-        return d_beta.beta2x()#convert to x format
+        return to_out(d_beta.beta2x(), out)#convert to x format
 
     # apply the model in image space, f(x)
     def model( self ):
@@ -407,7 +408,7 @@ class IDEAL_fatmyelin_opt2:
 # which in combine with forward function apply to the minimization: min_d_beta ||Jacobian*d_beta-residual||_2^2 + ...
 # e.g. for min_d_beta ||J*d_beta-R||_2^2 the d_beta can be acqire as d_beta=(J^H*J)^-1*J^H*R
 # e.g. for min_d_beta ||J*d_beta-R||_2^2 + ||beta+d_beta||_1 the d_beta could be solved by CGD, ADMM, IST methods
-class IDEAL_waterfat_myelin_opt2:
+class IDEAL_waterfat_myelin_opt2( LinearOperator ):
     def __init__( self, TEs, freq_wf, rel_amp ):
         self.TEs        = TEs
         self.freq_wf    = freq_wf #vector freqs for several fat peaks
@@ -440,7 +441,7 @@ class IDEAL_waterfat_myelin_opt2:
     #          + d_offres_myelin   * Allfpeak * myelin  * exp(Cte * offres_myelin) * Cte
     #          = [d_water + d_fat * Allfpeak + d_offres_waterfat * (water+Allfpeak * fat) * Cte] * exp(Cte * offres_waterfat)
     #          + d_offres_myelin   * Allfpeak * myelin  * exp(Cte * offres_myelin) * Cte
-    def forward( self, d_x ):
+    def forward( self, d_x, out = None ):
         if self.beta_shape is None:#if beta_shape is not defined copy the dimenstion from d_x, removing the last dim
             self.beta_shape = d_x.shape[0:len(d_x.shape)-1]
         #beta is estimate: water, fat and offres
@@ -457,7 +458,7 @@ class IDEAL_waterfat_myelin_opt2:
             E2          = np.multiply(beta.myelin, d_beta.offres_myelin) * Cte * Allfpeak#d_offres_myelin * Allfpeak * Cte
             d_im[...,j] = np.multiply(E1, np.exp(Cte * beta.offres_waterfat))\
                         + np.multiply(E2, np.exp(Cte * beta.offres_myelin))
-        return d_im
+        return to_out(d_im, out)
 
     # tanspose of Jacobian applies to d_image
     # d_im = (t,ifft(d_ksp))--->d_beta
@@ -474,7 +475,7 @@ class IDEAL_waterfat_myelin_opt2:
     #     => d_im*conj(d_im/d_offres_waterfat) = d_im*conj[(water + fat * Allfpeak) * exp(Cte*offres_waterfat) * Cte]
     # im = myelin * exp(Cte * offres_myelin)+..=> d_im/d_offres_myelin = Cte * myelin * exp(Cte * offres_myelin)
     # d_im * conj(d_im/d_offres_myelin) = d_im * conj(Cte * myelin * exp(Cte * offres_myelin))
-    def backward( self, d_im ):
+    def backward( self, d_im, out = None ):
         if self.beta_shape is None: #beta_shape is not defined, copy d_im dims
             self.beta_shape = d_im.shape
         beta   = IDEAL_waterfat_myelin_dataformat(self.beta_shape) #class defines the beta/data_format
@@ -492,7 +493,7 @@ class IDEAL_waterfat_myelin_opt2:
                                                             (beta.water + beta.fat * Allfpeak))),d_im[...,j])
             d_beta.offres_myelin   += np.multiply(np.conj(np.multiply(Cte * Eoffres_myelin,\
                                                             (beta.myelin * Allfpeak))),d_im[...,j])
-        return d_beta.beta2x()#convert to x format
+        return to_out(d_beta.beta2x(), out)#convert to x format
 
     # apply the model in image space, f(x)
     def model( self ):
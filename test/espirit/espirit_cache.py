@@ -0,0 +1,87 @@
+"""
+checks of the on disk espirit map cache espirit/espirit_cache_class.py, in a temporary directory,
+with a function of the calibration data that counts its calls in place of espirit_2d
+a miss calls the function, a hit does not and gives the same maps, read only on the hit and on the miss,
+a default given or not, and threads, are the same entry, other data or parameters are other entries,
+functools.partial, decorated functions and keyword only arguments are keyed on their bound arguments,
+a changed default is a new entry, the least recently used entries are evicted above max_bytes
+"""
+import os
+import numpy as np
+import shutil
+import tempfile
+import functools
+from espirit.espirit_cache_class import espirit_cache
+
+calls = []
+
+def fake_espirit( xcrop, x_shape, nsingularv = 150, hkwin_shape = (16,16), threads = None ):
+    calls.append(nsingularv)
+    Vim = np.zeros(tuple(x_shape), dtype = np.complex128) + np.sum(xcrop) * nsingularv
+    return Vim, np.abs(Vim[..., 0])
+
+def decorate( func ):
+    @functools.wraps(func)
+    def wrapper( *args, **kwargs ):
+        return func(*args, **kwargs)
+    return wrapper
+
+def fake_espirit_kwonly( xcrop, x_shape, *, nsingularv = 150, **kwargs ):
+    calls.append(nsingularv)
+    return fake_espirit(xcrop, x_shape, nsingularv, **kwargs)
+
+def test():
+    path = tempfile.mkdtemp()
+    try:
+        cache = espirit_cache(path)
+        rng   = np.random.RandomState(0)
+        xcrop = rng.randn(8, 8, 4) + 1j * rng.randn(8, 8, 4)
+        shape = (16, 16, 4)
+        del calls[:]
+        #miss and hit
+        Vim, sim = cache.maps(fake_espirit, 'fake', xcrop, shape)
+        Vim2, sim2 = cache.maps(fake_espirit, 'fake', xcrop, shape, nsingularv = 150, threads = 4)
+        ref = fake_espirit(xcrop, shape)[0]
+        print('calls %s, entries %d' % (calls, len(cache.entries())))
+        assert calls == [150, 150] and len(cache.entries()) == 1
+        assert np.array_equal(Vim, ref) and np.array_equal(Vim2, ref) and np.array_equal(sim2, np.abs(ref[..., 0]))
+        assert not (Vim.flags.writeable or sim.flags.writeable or Vim2.flags.writeable)
+        #other parameters, other data
+        cache.maps(fake_espirit, 'fake', xcrop, shape, nsingularv = 100)
+        cache.maps(fake_espirit, 'fake', xcrop + 1.0, shape)
+        assert len(cache.entries()) == 3 and calls[-2:] == [100, 150]
+        #partial and decorated functions with the same bound arguments hit the entry of nsingularv = 100
+        del calls[:]
+        cache.maps(functools.partial(fake_espirit, nsingularv = 100), 'fake', xcrop, shape)
+        cache.maps(decorate(fake_espirit), 'fake', xcrop, shape, nsingularv = 100)
+        assert calls == [] and len(cache.entries()) == 3
+        #keyword only arguments, and **kwargs keyed as the arguments they pass on
+        Vim = cache.maps(fake_espirit_kwonly, 'kwonly', xcrop, shape, nsingularv = 120, hkwin_shape = (6, 6))[0]
+        cache.maps(fake_espirit_kwonly, 'kwonly', xcrop, shape, nsingularv = 120, hkwin_shape = (6, 6))
+        cache.maps(fake_espirit_kwonly, 'kwonly', xcrop, shape, nsingularv = 120, hkwin_shape = (8, 8))
+        assert len(calls) == 4 and np.array_equal(Vim, fake_espirit(xcrop, shape, 120)[0])
+        #a changed default is a new entry
+        del calls[:]
+        defaults = fake_espirit.__defaults__
+        fake_espirit.__defaults__ = (50,) + defaults[1:]
+        try:
+            Vim = cache.maps(fake_espirit, 'fake', xcrop, shape)[0]
+        finally:
+            fake_espirit.__defaults__ = defaults
+        assert calls == [50] and np.array_equal(Vim, fake_espirit(xcrop, shape, 50)[0])
+        #lru eviction, the entry of the first call was used last
+        n = len(cache.entries())
+        cache.maps(fake_espirit, 'fake', xcrop, shape)
+        size = cache.entries()[0][1]
+        cache.evict(2 * size)
+        keys = [e[2] for e in cache.entries()]
+        print('entries %d, after evict to 2 entries %d' % (n, len(keys)))
+        assert len(keys) == 2 and cache.key(xcrop, func = 'fake', x_shape = list(shape), nsingularv = 150,\
+               hkwin_shape = (16, 16)) in [os.path.basename(k) for k in keys]
+        cache.clear()
+        assert cache.size() == 0
+    finally:
+        shutil.rmtree(path, ignore_errors = True)
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,46 @@
+"""
+checks of the batched eigen decomposition espirit_func.espirit_eig() against the per pixel loop it replaced,
+np.linalg.svd(vpix*vpix^H) of each pixel, the first singular value is the eigenvalue sim and
+conj(V[0,:]) the map Vim, the maps are equal up to the phase of each pixel, espirit_eig() sets
+the first coil real and negative, the chunked and threaded runs and the power iteration give the same map
+"""
+import numpy as np
+import espirit.espirit_func as espf
+
+# the per pixel loop, imvn is nx X ny X nsingularv X ncoil, returns sim, the vectors and the singular values
+def espirit_svd_loop( imvn ):
+    nx, ny, nsv, nc = imvn.shape
+    sim = np.zeros((nx, ny, nc))
+    Vim = np.zeros((nx, ny, nc, nc), dtype = np.complex128)
+    for ix in range(nx):
+        for iy in range(ny):
+            vpix = imvn[ix, iy, :, :].T
+            vvH  = vpix.dot(vpix.conj().T)
+            U, s, V = np.linalg.svd(vvH, full_matrices = False)
+            sim[ix, iy] = s
+            Vim[ix, iy] = np.conj(V).T #columns are the maps
+    return sim, Vim
+
+# largest 1 - |<v1, v2>| over the pixels, v is nx X ny X ncoil, normalized
+def phase_err( v1, v2 ):
+    return np.max(1.0 - np.abs(np.sum(np.conj(v1) * v2, axis = -1)))
+
+def test():
+    nx, ny, nsv, nc = 12, 10, 6, 8
+    rng  = np.random.RandomState(0)
+    imvn = rng.randn(nx, ny, nsv, nc) + 1j * rng.randn(nx, ny, nsv, nc)
+    #decaying singular values, as the espirit kernels
+    imvn = imvn * (0.5 ** np.arange(nsv))[:, np.newaxis]
+    s_ref, V_ref = espirit_svd_loop(imvn)
+
+    for method, chunk, threads in (('eigh', 4096, 1), ('eigh', 16, 4), ('power', 4096, 1)):
+        sim, Vim = espf.espirit_eig(imvn, method = method, chunk = chunk, threads = threads, Nite = 50)
+        err_s  = np.max(np.abs(np.real(sim) - s_ref[..., 0]) / s_ref[..., 0])
+        err_v  = phase_err(Vim, V_ref[..., 0])
+        err_ph = np.max(np.abs(np.imag(Vim[..., 0]))) + max(np.max(np.real(Vim[..., 0])), 0.0)
+        print('%s, chunk %d, threads %d: eigenvalue error %g, map error %g, first coil phase %g'\
+              % (method, chunk, threads, err_s, err_v, err_ph))
+        assert err_s < 1e-8 and err_v < 1e-8 and err_ph < 1e-12
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,81 @@
+"""
+checks of the multi map espirit of espirit_func.espirit_eig(nmaps) and operators_class.espirit_maps
+nmaps = 2 gives the two leading singular values and vectors of the per pixel svd loop, up to phase,
+nmaps above the number of coils, or nmaps > 1 with the power iteration, raise a ValueError,
+padnd puts the k-space center d//2 of each leading axis on n//2, as pad2d/pad3d, fourier_upsample is exact for a band limited image on even grids,
+espirit_maps upsamples the maps at the first use only, the maps have unit norm over the coils and are zero
+where the eigenvalue is below crop*max(sim), slice(i, axis) is the slice i of the full maps,
+backward is the adjoint of forward
+"""
+import numpy as np
+import espirit.espirit_func as espf
+import pics.operators_class as opts
+import utilities.utilities_func as ut
+from test.espirit.espirit_eig_svd import espirit_svd_loop, phase_err
+
+def test():
+    rng  = np.random.RandomState(0)
+    #two maps against the per pixel svd
+    nx, ny, nsv, nc = 12, 10, 6, 8
+    imvn = rng.randn(nx, ny, nsv, nc) + 1j * rng.randn(nx, ny, nsv, nc)
+    imvn = imvn * (0.5 ** np.arange(nsv))[:, np.newaxis]
+    s_ref, V_ref = espirit_svd_loop(imvn)
+    sim, Vim = espf.espirit_eig(imvn, nmaps = 2)
+    err_s = np.max(np.abs(np.real(sim) - s_ref[..., :2]) / s_ref[..., :2])
+    err_v = max(phase_err(Vim[..., 0], V_ref[..., 0]), phase_err(Vim[..., 1], V_ref[..., 1]))
+    print('nmaps = 2: eigenvalue error %g, map error %g' % (err_s, err_v))
+    assert sim.shape == (nx, ny, 2) and Vim.shape == (nx, ny, nc, 2)
+    assert err_s < 1e-8 and err_v < 1e-8
+    for nmaps, method in ((nc + 1, 'eigh'), (0, 'eigh'), (2, 'power')):
+        try:
+            espf.espirit_eig(imvn, method = method, nmaps = nmaps)
+        except ValueError as err:
+            print('nmaps = %d, %s: %s' % (nmaps, method, err))
+        else:
+            raise AssertionError('nmaps = %d with %s did not raise' % (nmaps, method))
+
+    #padnd, the centers d//2 on n//2 and zeros elsewhere
+    k = rng.randn(6, 5, 4, 3)
+    for shape in ((16, 12), (15, 12, 9)):
+        kpad = ut.padnd(k, shape)
+        idx  = tuple(slice(m//2 - d//2, m//2 - d//2 + d) for d, m in zip(k.shape, shape))
+        assert kpad.shape == shape + k.shape[len(shape):] and np.array_equal(kpad[idx], k)
+        assert np.sum(kpad != 0) == k.size
+
+    #fourier_upsample of a band limited image, exp(2i*pi*(kx*x + ky*y)) on centered even grids
+    n, N = (8, 6), (20, 16)
+    def band( shape ):
+        x, y = np.meshgrid(*[(np.arange(m) - m//2) / float(m) for m in shape], indexing = 'ij')
+        return np.exp(2j * np.pi * (3 * x - 2 * y)) + 0.5 * np.exp(2j * np.pi * (-2 * x + y))
+    err = np.max(np.abs(opts.fourier_upsample(band(n), N) - band(N)))
+    print('fourier_upsample of a band limited image: error %g' % err)
+    assert err < 1e-12
+
+    #espirit_maps on a coarse grid with a smooth eigenvalue, so the crop cuts a part of the fov
+    nc, nmaps, shape = 4, 2, (20, 16)
+    Vim = rng.randn(*(n + (nc, nmaps))) + 1j * rng.randn(*(n + (nc, nmaps)))
+    sim = np.abs(band(n))[..., np.newaxis] * np.array([1.0, 0.3])
+    esp = opts.espirit_maps(Vim, sim, shape, crop = 0.5)
+    assert esp._sens is None
+    sens = esp.sens
+    assert esp._sens is sens and esp.sens is sens and sens.shape == shape + (nc, nmaps)
+    sim_up = opts.fourier_upsample(sim, shape)
+    keep   = np.abs(sim_up) >= 0.5 * np.max(sim)
+    norms  = np.linalg.norm(sens, axis = -2)
+    print('crop keeps %d of %d map pixels' % (np.sum(keep), keep.size))
+    assert 0 < np.sum(keep) < keep.size
+    assert np.max(np.abs(norms[keep] - 1.0)) < 1e-5 and np.max(norms[~keep]) == 0
+    #slices are the slices of the full maps
+    for axis, i in ((0, 3), (1, 11)):
+        err = np.max(np.abs(esp.slice(i, axis).sens - np.take(sens, i, axis = axis)))
+        print('slice %d along axis %d: error %g' % (i, axis, err))
+        assert err < 1e-12
+    #adjoint
+    x = rng.randn(*(shape + (nmaps,))) + 1j * rng.randn(*(shape + (nmaps,)))
+    y = rng.randn(*(shape + (nc,))) + 1j * rng.randn(*(shape + (nc,)))
+    err = abs(np.vdot(esp.forward(x), y) - np.vdot(x, esp.backward(y))) / abs(np.vdot(x, esp.backward(y)))
+    print('<forward(x), y> - <x, backward(y)>: %g' % err)
+    assert err < 1e-12
+
+if __name__ == "__main__":
+    test()
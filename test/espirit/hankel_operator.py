@@ -0,0 +1,52 @@
+"""
+checks of the fft block Hankel operator pics/hankel_class.Hankelnd_r against hankel_func.hankelnd_r()
+todense() is hankelnd_r(a, win_shape) flattened to (prod(win_shape), prod(moves)),
+forward/adjoint are H*v and H^H*u of that dense matrix, for flattened, shaped and batched vectors,
+average(U, s, Vh) is the average over the anti diagonals (entries of the same p + q) of U*diag(s)*Vh
+"""
+import numpy as np
+import pics.hankel_func as hk
+import pics.hankel_class as hkc
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+# dense average of M over the entries of the same p + q, M is (prod(win_shape), prod(moves))
+def average_dense( M, a_shape, win_shape ):
+    move_shape = tuple(n - w + 1 for n, w in zip(a_shape, win_shape))
+    p   = np.array(np.unravel_index(np.arange(M.shape[0]), win_shape))
+    q   = np.array(np.unravel_index(np.arange(M.shape[1]), move_shape))
+    idx = np.ravel_multi_index(tuple(p[:, :, np.newaxis] + q[:, np.newaxis, :]), a_shape)
+    s   = np.zeros(int(np.prod(a_shape)), dtype = M.dtype)
+    n   = np.zeros(int(np.prod(a_shape)))
+    np.add.at(s, idx.ravel(), M.ravel())
+    np.add.at(n, idx.ravel(), 1.0)
+    return (s / n).reshape(a_shape)
+
+def test():
+    rng = np.random.RandomState(0)
+    for a_shape, win_shape in (((20,), (6,)), ((12, 10, 4), (5, 4, 1)), ((8, 7, 6, 3), (3, 4, 2, 1))):
+        a   = rng.randn(*a_shape) + 1j * rng.randn(*a_shape)
+        hop = hkc.Hankelnd_r(a, win_shape)
+        H   = hk.hankelnd_r(a, win_shape).reshape(hop.shape)
+        v   = rng.randn(hop.shape[1], 3) + 1j * rng.randn(hop.shape[1], 3)
+        u   = rng.randn(hop.shape[0], 3) + 1j * rng.randn(hop.shape[0], 3)
+        err_dense = relerr(hop.todense(), H)
+        err_fwd   = relerr(hop.forward(v), H.dot(v))
+        err_adj   = relerr(hop.adjoint(u), H.conj().T.dot(u))
+        #one flattened vector, and one shaped as moves
+        err_vec   = relerr(hop.forward(v[:, 0]), H.dot(v[:, 0]))
+        err_shape = relerr(hop.forward(v[:, 0].reshape(hop.move_shape)).ravel(), H.dot(v[:, 0]))
+        #low rank average
+        U, s, Vh  = np.linalg.svd(H, full_matrices = False)
+        k         = 2
+        err_avg   = relerr(hop.average(U[:, :k], s[:k], Vh[:k]),\
+                           average_dense(U[:, :k].dot(np.diag(s[:k])).dot(Vh[:k]), a_shape, win_shape))
+        #the full rank average gives a back
+        err_inv   = relerr(hop.average(U, s, Vh), a)
+        print('a %s, window %s: todense %g, forward %g, adjoint %g, vector %g, shaped %g, average %g, inverse %g' \
+              % (a_shape, win_shape, err_dense, err_fwd, err_adj, err_vec, err_shape, err_avg, err_inv))
+        assert max(err_dense, err_fwd, err_adj, err_vec, err_shape, err_avg, err_inv) < 1e-12
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,46 @@
+"""
+checks of the benchmark harness fft/benchmark_func.py
+bench() records the median and min time of a call that sleeps 20 ms, its throughput,
+and the peak memory of a call that allocates 8 MB,
+run_fft_benchmarks() gives the numpy and fftw cases, save_json()/load_json() keep the records,
+compare_json() flags a case that is slower than the baseline by more than tol and skips new cases
+"""
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+import fft.benchmark_func as bf
+
+def test():
+    rec = bf.bench('sleep', lambda: time.sleep(0.02), 1000, Reptime = 3, warmup = 0, tag = 'x')
+    assert 0.02 <= rec['min_s'] <= rec['median_s'] < 0.2 and rec['tag'] == 'x' and rec['Reptime'] == 3
+    assert abs(rec['samples_per_s'] - 1000 / rec['median_s']) < 1e-6 * rec['samples_per_s']
+    rec = bf.bench('alloc', lambda: np.ones(2 ** 20), 2 ** 20, Reptime = 1)
+    assert 7.9 < rec['peak_mem_MB'] < 9.0
+
+    res   = bf.run_fft_benchmarks('small', threads_list = [1], Reptime = 1)
+    names = [r['name'] for r in res]
+    assert names == ['numpy_fft2d.forward', 'numpy_fft2d.backward', 'fftw_fft2d_t1.forward', 'fftw_fft2d_t1.backward',\
+                     'numpy_fft3d.forward', 'numpy_fft3d.backward', 'fftw_fft3d_t1.forward', 'fftw_fft3d_t1.backward']
+
+    path = tempfile.mkdtemp()
+    try:
+        base_file, new_file = os.path.join(path, 'base.json'), os.path.join(path, 'new.json')
+        bf.save_json(res, base_file)
+        saved = bf.load_json(base_file)['results']
+        assert [(r['name'], r['median_s'], r['peak_mem_MB']) for r in saved] ==\
+               [(r['name'], r['median_s'], r['peak_mem_MB']) for r in res]
+        assert bf.compare_json(base_file, base_file, tol = 0.1) == []
+        slow = [dict(r) for r in res] + [dict(res[0], name = 'new_case')]
+        slow[2]['median_s'] = 1.5 * res[2]['median_s']
+        slow[3]['median_s'] = 1.05 * res[3]['median_s']
+        bf.save_json(slow, new_file)
+        regressions = bf.compare_json(new_file, base_file, tol = 0.1)
+        print('regressions %s' % regressions)
+        assert [name for name, ratio in regressions] == [res[2]['name']] and abs(regressions[0][1] - 1.5) < 1e-12
+    finally:
+        shutil.rmtree(path, ignore_errors = True)
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,73 @@
+"""
+checks of the single precision path, complex64 (or float32) in, complex64 (float32) out
+through the nufft plan (dtype = np.complex64, both backends and the toeplitz normal), fftw_func,
+the FFT/FFTW operators of pics/operators_class.py (forward, backward, adjoint, normal, solve_normal),
+the tv operators and the proximal functions, the results are the complex128 results within
+the accuracy envelope of single precision, 1e-5 relative l2 error (nufft at eps = 1e-6)
+"""
+import numpy as np
+import fft.fftw_func as fftw
+import fft.nufft_class as nfc
+import pics.operators_class as opts
+import pics.tvop_class as tvopts
+import pics.proximal_func as pf
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def check( name, res64, res128, dtype = np.complex64, tol = 1e-5 ):
+    err = relerr(res64, res128)
+    print('%s: %s, error %g' % (name, res64.dtype, err))
+    assert res64.dtype == dtype and err < tol
+
+def test():
+    rng = np.random.RandomState(0)
+    #nufft plan
+    ms, mt, nsamples = 32, 24, 2000
+    x   = rng.uniform(-np.pi, np.pi, nsamples)
+    y   = rng.uniform(-np.pi, np.pi, nsamples)
+    c   = rng.randn(nsamples, 2) + 1j * rng.randn(nsamples, 2)
+    im  = rng.randn(ms, mt, 2) + 1j * rng.randn(ms, mt, 2)
+    for backend in ('numba', 'sparse'):
+        p64  = nfc.NUFFT2d(x, y, ms, mt, eps = 1e-6, backend = backend, toeplitz = True, dtype = np.complex64)
+        p128 = nfc.NUFFT2d(x, y, ms, mt, eps = 1e-6, backend = backend, toeplitz = True)
+        check('nufft %s backward' % backend, p64.backward(c.astype(np.complex64)), p128.backward(c))
+        check('nufft %s forward' % backend, p64.forward(im.astype(np.complex64)), p128.forward(im))
+        check('nufft %s toeplitz normal' % backend, p64.normal(im.astype(np.complex64)), p128.normal(im))
+
+    #fftw_func
+    a   = rng.randn(16, 12, 8) + 1j * rng.randn(16, 12, 8)
+    a64 = a.astype(np.complex64)
+    check('fftw2d', fftw.fftw2d(a64), np.fft.fft2(a, axes = (0, 1)))
+    check('ifftw2d', fftw.ifftw2d(a64), np.fft.ifft2(a, axes = (0, 1)))
+    check('fftwnd', fftw.fftwnd(a64), np.fft.fftn(a, axes = (0, 1, 2)))
+    check('fftwnd of float32', fftw.fftwnd(a64.real), np.fft.fftn(a.real, axes = (0, 1, 2)))
+
+    #fft operators, float32 and complex64 images
+    mask = (rng.rand(16, 12) > 0.5).astype(np.float64)
+    mask3 = np.tile(mask[..., np.newaxis], (1, 1, 8))
+    for op in (opts.FFT2d(), opts.FFT2d_kmask(mask), opts.FFTnd(), opts.FFTnd_kmask(mask3),\
+               opts.FFTW2d(), opts.FFTW2d_kmask(mask), opts.FFTWnd(), opts.FFTWnd_kmask(mask3)):
+        name = type(op).__name__
+        check('%s forward' % name, op.forward(a64), op.forward(a))
+        check('%s forward of float32' % name, op.forward(a64.real), op.forward(a.real))
+        check('%s backward' % name, op.backward(a64), op.backward(a))
+        check('%s adjoint' % name, op.adjoint(a64), op.adjoint(a))
+        check('%s normal' % name, op.normal(a64), op.normal(a))
+        check('%s solve_normal' % name, op.solve_normal(0.5, a64), op.solve_normal(0.5, a))
+
+    #tv operators and proximal functions
+    tv = tvopts.TV2d()
+    check('tv grad', tv.grad(a64), tv.grad(a))
+    check('tv Div', tv.Div(tv.grad(a64)), tv.Div(tv.grad(a)))
+    check('prox_tv2d', pf.prox_tv2d(a64[..., 0], 0.5), pf.prox_tv2d(a[..., 0], 0.5))
+    check('prox_tv2d of float32', pf.prox_tv2d(a64[..., 0].real, 0.5), pf.prox_tv2d(a[..., 0].real, 0.5), np.float32)
+    check('prox_l1_soft_thresh', pf.prox_l1_soft_thresh(a64, 1.0), pf.prox_l1_soft_thresh(a, 1.0))
+    check('prox_l1_soft_thresh of float32', pf.prox_l1_soft_thresh(a64.real, 0.5), pf.prox_l1_soft_thresh(a.real, 0.5))
+    check('prox_l1_soft_thresh2', pf.prox_l1_soft_thresh2(a64.real, 0.5), pf.prox_l1_soft_thresh2(a.real, 0.5),\
+          np.float32)
+    check('prox_l0_hard_thresh', pf.prox_l0_hard_thresh(a64, 1.0), pf.prox_l0_hard_thresh(a, 1.0))
+    check('prox_l1_group_soft_thresh', pf.prox_l1_group_soft_thresh(a64, 2.0), pf.prox_l1_group_soft_thresh(a, 2.0))
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,39 @@
+"""
+checks of the centered fft operators of pics/operators_class.py, where the fftshift/ifftshift are
+folded into phases (fftw_func.centered_phase), against the shifted ffts they replaced,
+forward = ifftshift(fft(fftshift(im))) * mask, backward = ifftshift(ifft(fftshift(ksp))),
+for odd and even sizes, extra (coil) axes, a mask of the image axes only and fft axes that are not leading,
+adjoint is n*backward(conj(mask)*ksp) and normal is adjoint(forward(im))
+"""
+import numpy as np
+import pics.operators_class as opts
+
+def shifted( func, x, axes ):
+    return np.fft.ifftshift(func(np.fft.fftshift(x, axes), axes = axes), axes)
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def test():
+    rng = np.random.RandomState(0)
+    for shape in ((8, 6, 4, 3), (7, 5, 3, 2), (9, 8, 5, 2)):
+        a    = rng.randn(*shape) + 1j * rng.randn(*shape)
+        mask = (rng.rand(*shape[:3]) > 0.4).astype(np.float64)
+        ops  = ((opts.FFT2d(), None, (0, 1)), (opts.FFT2d((1, 2)), None, (1, 2)),\
+                (opts.FFT2d_kmask(mask[..., 0]), mask[..., 0], (0, 1)),\
+                (opts.FFTnd(), None, (0, 1, 2)), (opts.FFTnd_kmask(mask), mask, (0, 1, 2)),\
+                (opts.FFTW2d(), None, (0, 1)), (opts.FFTW2d_kmask(mask[..., 0]), mask[..., 0], (0, 1)),\
+                (opts.FFTWnd(), None, (0, 1, 2)), (opts.FFTWnd_kmask(mask), mask, (0, 1, 2)))
+        for op, m, axes in ops:
+            n = np.prod([shape[k] for k in axes])
+            m = np.ones(()) if m is None else m.reshape(m.shape + (1,) * (a.ndim - m.ndim))
+            fwd = shifted(np.fft.fftn, a, axes) * m
+            bwd = shifted(np.fft.ifftn, a, axes)
+            adj = n * shifted(np.fft.ifftn, np.conj(m) * a, axes)
+            err = max(relerr(op.forward(a), fwd), relerr(op.backward(a), bwd), relerr(op.adjoint(a), adj),\
+                      relerr(op.normal(a), n * shifted(np.fft.ifftn, np.conj(m) * fwd, axes)))
+            print('%s, axes %s, shape %s: error %g' % (type(op).__name__, axes, shape, err))
+            assert err < 1e-13
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,66 @@
+"""
+checks of the pyfftw plan cache in fft/fftw_func.py
+the transforms are the numpy ffts, a second call reuses the cached plan, another planner effort is another plan,
+the wisdom is saved and loaded,
+8 threads running fftw_centered/fftw_centered_normal on the same shape at once get the results of numpy,
+each thread has its own plan and buffers
+"""
+import numpy as np
+import os
+import tempfile
+import threading
+import fft.fftw_func as fftw
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def test():
+    rng  = np.random.RandomState(0)
+    data = rng.randn(64, 48) + 1j * rng.randn(64, 48)
+    fftw.clear_plan_cache()
+    err = max(relerr(fftw.fftw2d(data), np.fft.fft2(data)), relerr(fftw.ifftw2d(data), np.fft.ifft2(data)),\
+              relerr(fftw.fftwnd(data[..., np.newaxis], axes = (0, 1)), np.fft.fft2(data)[..., np.newaxis]))
+    print('fftw vs numpy %g' % err)
+    assert err < 1e-12
+
+    #plan reuse, planner effort in the key
+    p1 = fftw.get_plan(data.shape, data.dtype, (0, 1))
+    assert fftw.get_plan(data.shape, data.dtype, (0, 1)) is p1
+    fftw.set_planner_effort('FFTW_MEASURE')
+    try:
+        p2 = fftw.get_plan(data.shape, data.dtype, (0, 1))
+        assert p2 is not p1 and 'FFTW_MEASURE' in p2.flags
+        assert relerr(fftw.fftw2d(data), np.fft.fft2(data)) < 1e-12
+    finally:
+        fftw.set_planner_effort('FFTW_ESTIMATE')
+    assert fftw.get_plan(data.shape, data.dtype, (0, 1)) is p1
+
+    #wisdom round trip
+    fd, filename = tempfile.mkstemp(suffix = '.pkl')
+    os.close(fd)
+    try:
+        fftw.save_wisdom(filename)
+        assert all(fftw.load_wisdom(filename))
+    finally:
+        os.remove(filename)
+
+    #concurrent transforms of the same shape
+    pre, post = fftw.centered_phase(data.shape, (0, 1))
+    errs = []
+    def run( seed ):
+        x   = np.random.RandomState(seed).randn(*data.shape) + 0j
+        ref = np.fft.ifftshift(np.fft.fft2(np.fft.fftshift(x)))
+        for _ in range(200):
+            y  = fftw.fftw_centered(x, pre, post, (0, 1))
+            xn = fftw.fftw_centered_normal(x, pre, 1.0, post, (0, 1)) #ifft(fft(x*pre))*post
+            errs.append(max(relerr(y, ref), relerr(xn, x * pre * post)))
+    threads = [threading.Thread(target = run, args = (seed,)) for seed in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print('8 threads, %d transforms, largest error %g' % (len(errs), max(errs)))
+    assert len(errs) == 1600 and max(errs) < 1e-12
+
+if __name__ == "__main__":
+    test()
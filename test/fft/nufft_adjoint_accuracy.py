@@ -0,0 +1,58 @@
+"""
+checks of the nufft plan in fft/nufft_class.py (gaussian kernel, numba backend) on random trajectories
+backward is the type 1 nufft, compared with the direct nudft2d1()/nudft3d1() and with nufft2d1/3d1_gaussker(),
+forward is the type 2 nufft, compared with the direct sum and with nufft2d2_gaussker(),
+<forward(im), c> = nsamples * <im, backward(c)>, backward has the 1/nsamples scaling of nudft2d1(),
+the plan gives the same result when it is reused,
+the tolerances are the l2 errors of the gaussian kernel at this size (~5e-8 in 2d, ~2e-6 in 3d at eps = 1e-12)
+"""
+import numpy as np
+import fft.nufft_func as nft
+import fft.nufft_class as nfc
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def test():
+    ms, mt, nsamples = 32, 24, 2000
+    rng = np.random.RandomState(0)
+    x   = rng.uniform(-np.pi, np.pi, nsamples)
+    y   = rng.uniform(-np.pi, np.pi, nsamples)
+    c   = rng.randn(nsamples) + 1j * rng.randn(nsamples)
+    im  = rng.randn(ms, mt) + 1j * rng.randn(ms, mt)
+    #direct type 1 and type 2
+    Fk_ref = nft.nudft2d1(x, y, c, ms, mt)
+    k1, k2 = nft.nufftfreqs2d(ms, mt)
+    E      = np.exp(-1j * (np.outer(x, k1.ravel()) + np.outer(y, k2.ravel())))
+    c_ref  = E.dot(im.ravel())
+
+    nft_opt = nfc.NUFFT2d(x, y, ms, mt, eps = 1e-12)
+    Fk      = nft_opt.backward(c)
+    err1 = relerr(Fk, Fk_ref)
+    err2 = relerr(nft_opt.forward(im), c_ref)
+    err3 = abs(np.vdot(nft_opt.forward(im), c) - nsamples * np.vdot(im, Fk)) / abs(np.vdot(nft_opt.forward(im), c))
+    print('2d: type 1 error %g, type 2 error %g, adjointness error %g' % (err1, err2, err3))
+    assert err1 < 1e-6 and err2 < 1e-6 and err3 < 1e-12
+
+    #the same as the functions it replaces in the recon
+    err4 = relerr(Fk, nft.nufft2d1_gaussker(x, y, c, ms, mt, eps = 1e-12))
+    err5 = relerr(nft_opt.forward(im), nft.nufft2d2_gaussker(x, y, im, ms, mt, eps = 1e-12))
+    print('plan vs nufft2d1_gaussker %g, vs nufft2d2_gaussker %g' % (err4, err5))
+    assert err4 < 1e-12 and err5 < 1e-12
+
+    #reused plan
+    assert np.array_equal(nft_opt.backward(c), Fk)
+
+    #3d
+    ms, mt, mu, nsamples = 12, 10, 8, 1500
+    x, y, z = rng.uniform(-np.pi, np.pi, (3, nsamples))
+    c       = rng.randn(nsamples) + 1j * rng.randn(nsamples)
+    nft_opt = nfc.NUFFT3d(x, y, z, ms, mt, mu, eps = 1e-12)
+    Fk      = nft_opt.backward(c)
+    err6    = relerr(Fk, nft.nudft3d1(x, y, z, c, ms, mt, mu))
+    err7    = relerr(Fk, nft.nufft3d1_gaussker(x, y, z, c, ms, mt, mu, eps = 1e-12))
+    print('3d: type 1 error %g, vs nufft3d1_gaussker %g' % (err6, err7))
+    assert err6 < 1e-5 and err7 < 1e-12
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,53 @@
+"""
+checks of the batched nufft plan in fft/nufft_class.py, c is nsamples X (coils, echoes) and im is
+im_shape X (coils, echoes), one call is the same as the loop over the channels of the single channel plan,
+and as the single channel functions nufft2d1_gaussker()/nufft2d2_gaussker()/nufft3d1_gaussker(),
+non contiguous inputs (a transposed view) are handled, the grid buffers and pyfftw plans are made once
+for each number of channels, nufft3d21_gaussker() (A^H A gridding) is the backward(forward()) of the plan
+"""
+import numpy as np
+import fft.nufft_func as nft
+import fft.nufft_class as nfc
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def test():
+    rng = np.random.RandomState(0)
+    nsamples, bshape = 2000, (4, 3)
+    for im_shape in ((32, 24), (12, 10, 8)):
+        traj = [rng.uniform(-np.pi, np.pi, nsamples) for _ in im_shape]
+        c    = rng.randn(*((nsamples,) + bshape)) + 1j * rng.randn(*((nsamples,) + bshape))
+        im   = rng.randn(*(im_shape + bshape)) + 1j * rng.randn(*(im_shape + bshape))
+        opt  = nfc.NUFFTnd(traj, im_shape, eps = 1e-12)
+        Fk, cs = opt.backward(c), opt.forward(im)
+        assert Fk.shape == im_shape + bshape and cs.shape == (nsamples,) + bshape
+        err1 = err2 = err3 = 0.0
+        for i in range(bshape[0]):
+            for j in range(bshape[1]):
+                err1 = max(err1, relerr(Fk[..., i, j], opt.backward(c[:, i, j])))
+                err2 = max(err2, relerr(cs[:, i, j], opt.forward(im[..., i, j])))
+                if len(im_shape) == 2:
+                    F0 = nft.nufft2d1_gaussker(traj[0], traj[1], c[:, i, j], *im_shape, eps = 1e-12)
+                    c0 = nft.nufft2d2_gaussker(traj[0], traj[1], im[..., i, j], *im_shape, eps = 1e-12)
+                    err3 = max(err3, relerr(Fk[..., i, j], F0), relerr(cs[:, i, j], c0))
+                elif i == 0 and j == 0:
+                    F0 = nft.nufft3d1_gaussker(traj[0], traj[1], traj[2], c[:, i, j], *im_shape, eps = 1e-12)
+                    err3 = max(err3, relerr(Fk[..., i, j], F0))
+        print('%dd, channels %s: type 1 against the loop %g, type 2 against the loop %g, against nufft_func %g'\
+              % (len(im_shape), bshape, err1, err2, err3))
+        assert err1 < 1e-13 and err2 < 1e-13 and err3 < 1e-12
+        #non contiguous
+        ct = np.transpose(c, (0, 2, 1))
+        assert relerr(opt.backward(ct), np.transpose(Fk, tuple(range(len(im_shape))) + (-1, -2))) < 1e-13
+        assert sorted(opt.buffers) == [1, 12]
+
+    #A^H A of nufft3d21_gaussker
+    opt = nfc.NUFFTnd(traj, im_shape, eps = 1e-12)
+    Fk  = im[..., 0, 0]
+    err = relerr(nft.nufft3d21_gaussker(traj[0], traj[1], traj[2], Fk, *im_shape, eps = 1e-12), opt.normal(Fk))
+    print('nufft3d21_gaussker against the plan: %g' % err)
+    assert err < 1e-12
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,54 @@
+"""
+checks of the kaiser-bessel kernel of the nufft plan, kernel = 'kb' in fft/nufft_class.py
+for each oversampling upsampfac and eps, type 1 and type 2 are compared with the direct nudft2d1() and sum,
+the errors are within 2*eps (the width table of nufft_func was measured on the same error),
+the kernel has no more neighbors than the gaussian at the same eps, and a smaller grid for upsampfac < 2,
+upsampfac or eps outside the width table raise a ValueError,
+and nufft_test_func.benchmark_nufft2d1_kernels() runs on a small problem
+"""
+import numpy as np
+import fft.nufft_func as nft
+import fft.nufft_class as nfc
+import fft.nufft_test_func as nftt
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def test():
+    ms, mt, nsamples = 32, 24, 2000
+    rng = np.random.RandomState(0)
+    x   = rng.uniform(-np.pi, np.pi, nsamples)
+    y   = rng.uniform(-np.pi, np.pi, nsamples)
+    c   = rng.randn(nsamples) + 1j * rng.randn(nsamples)
+    im  = rng.randn(ms, mt) + 1j * rng.randn(ms, mt)
+    Fk_ref = nft.nudft2d1(x, y, c, ms, mt)
+    k1, k2 = nft.nufftfreqs2d(ms, mt)
+    E      = np.exp(-1j * (np.outer(x, k1.ravel()) + np.outer(y, k2.ravel())))
+    c_ref  = E.dot(im.ravel())
+
+    for eps in (1e-3, 1e-4, 1e-6):
+        gauss = nfc.NUFFT2d(x, y, ms, mt, eps = eps)
+        for upsampfac in (1.25, 1.5, 2.0):
+            kb   = nfc.NUFFT2d(x, y, ms, mt, eps = eps, kernel = 'kb', upsampfac = upsampfac)
+            err1 = relerr(kb.backward(c), Fk_ref)
+            err2 = relerr(kb.forward(im), c_ref)
+            print('eps %g, upsampfac %g: grid %s, nspread %d (gauss %s, %d), type 1 error %g, type 2 error %g'\
+                  % (eps, upsampfac, kb.grid_shape, kb.nspread, gauss.grid_shape, gauss.nspread, err1, err2))
+            assert err1 < 2 * eps and err2 < 2 * eps
+            assert kb.nspread <= gauss.nspread
+            assert all(n <= ng for n, ng in zip(kb.grid_shape, gauss.grid_shape))
+            if upsampfac < 2.0:
+                assert np.prod(kb.grid_shape) < np.prod(gauss.grid_shape)
+
+    for eps, upsampfac in ((1e-4, 3.0), (1e-14, 2.0), (0.5, 1.5)):
+        try:
+            nfc.NUFFT2d(x, y, ms, mt, eps = eps, kernel = 'kb', upsampfac = upsampfac)
+        except ValueError as err:
+            print('eps %g, upsampfac %g: %s' % (eps, upsampfac, err))
+        else:
+            raise AssertionError('eps %g, upsampfac %g did not raise' % (eps, upsampfac))
+
+    nftt.benchmark_nufft2d1_kernels(nft.nudft2d1, ms, mt, nsamples, Reptime = 1, eps_list = (1e-4,))
+
+if __name__ == "__main__":
+    test()
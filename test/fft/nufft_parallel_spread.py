@@ -0,0 +1,52 @@
+"""
+checks of the parallel tiled spreading of the nufft plan, backend = 'numba' in fft/nufft_class.py
+the tiles of nufft_func._compute_tiles() are a sorted permutation of the samples, each sample is in the tile
+of its home grid point, type 1 (tiled spreading) and type 2 (parallel interpolation) of the numba backend
+are the same as the sparse matrix backend for any number of tiles and threads, in 2d and 3d,
+for uniform samples, samples clustered in one tile and samples on the edges of the periodic grid
+"""
+import numpy as np
+import numba
+import fft.nufft_class as nfc
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def test():
+    rng = np.random.RandomState(0)
+    nsamples = 3000
+    trajs = {'uniform':   lambda: rng.uniform(-np.pi, np.pi, nsamples),\
+             'clustered': lambda: rng.uniform(0.1, 0.3, nsamples),\
+             'edges':     lambda: np.pi * rng.choice([-1.0, 1.0], nsamples) - rng.uniform(-1e-3, 1e-3, nsamples)}
+    for im_shape in ((128, 96), (64, 48, 8)):
+        for name, traj_func in sorted(trajs.items()):
+            traj = [traj_func() for _ in im_shape]
+            c    = rng.randn(nsamples, 2) + 1j * rng.randn(nsamples, 2)
+            im   = rng.randn(*(im_shape + (2,))) + 1j * rng.randn(*(im_shape + (2,)))
+            ref  = nfc.NUFFTnd(traj, im_shape, eps = 1e-6, backend = 'sparse')
+            Fk_ref, c_ref = ref.backward(c), ref.forward(im)
+            for ntiles, threads in ((1, None), (7, None), (64, None), (64, 1)):
+                if threads is not None:
+                    nthreads = numba.get_num_threads()
+                    numba.set_num_threads(threads)
+                try:
+                    opt = nfc.NUFFTnd(traj, im_shape, eps = 1e-6, backend = 'numba', ntiles = ntiles)
+                    err1 = relerr(opt.backward(c), Fk_ref)
+                    err2 = relerr(opt.forward(im), c_ref)
+                finally:
+                    if threads is not None:
+                        numba.set_num_threads(nthreads)
+                ntile = opt.tile_ptr.shape[0] - 1
+                #the tiles, home grid point of each sorted sample in its tile
+                assert np.array_equal(np.sort(opt.order), np.arange(nsamples)) and opt.tile_ptr[-1] == nsamples
+                t    = np.repeat(np.arange(ntile), np.diff(opt.tile_ptr))
+                nt2  = opt.start2.shape[0] - 1
+                home = [opt.idx[0][:, opt.nspread], opt.idx[1][:, opt.nspread]]
+                assert np.all((opt.start1[t // nt2] <= home[0]) & (home[0] < opt.start1[t // nt2 + 1]))
+                assert np.all((opt.start2[t % nt2] <= home[1]) & (home[1] < opt.start2[t % nt2 + 1]))
+                print('%dd %s, ntiles %d (%d tiles), threads %s: type 1 error %g, type 2 error %g'\
+                      % (len(im_shape), name, ntiles, ntile, threads, err1, err2))
+                assert err1 < 1e-12 and err2 < 1e-12
+
+if __name__ == "__main__":
+    test()
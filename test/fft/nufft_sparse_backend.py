@@ -0,0 +1,65 @@
+"""
+checks of the sparse interpolation matrix backend of the nufft plan, backend = 'sparse' in fft/nufft_class.py
+build_interp_matrix() G times a grid is the sum over the (2*nspread)^2 neighbors of each sample
+with the product of the 1d gaussian weights, as in the numba gridding loops,
+type 1 (G^T c) and type 2 (G ftau) of the sparse plan are compared with the direct nudft2d1() and sum,
+and with the numba backend, all the coils in one sparse matrix-matrix product are the coils one by one,
+an unknown backend raises a ValueError
+"""
+import numpy as np
+import fft.nufft_func as nft
+import fft.nufft_class as nfc
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def test():
+    ms, mt, nsamples, ncoils = 32, 24, 2000, 3
+    rng = np.random.RandomState(0)
+    x   = rng.uniform(-np.pi, np.pi, nsamples)
+    y   = rng.uniform(-np.pi, np.pi, nsamples)
+    c   = rng.randn(nsamples, ncoils) + 1j * rng.randn(nsamples, ncoils)
+    im  = rng.randn(ms, mt, ncoils) + 1j * rng.randn(ms, mt, ncoils)
+
+    #interpolation matrix against the neighbor sum
+    nspread, nf1, nf2, tau = nft._compute_2d_grid_params(ms, mt, 1e-12)
+    idx1, w1 = nft._compute_1d_gaussker_weights(x, nf1, tau, nspread)
+    idx2, w2 = nft._compute_1d_gaussker_weights(y, nf2, tau, nspread)
+    G    = nft.build_interp_matrix([idx1, idx2], [w1, w2], (nf1, nf2))
+    grid = rng.randn(nf1, nf2) + 1j * rng.randn(nf1, nf2)
+    ref  = np.einsum('ja,jb,jab->j', w1, w2, grid[idx1[:, :, np.newaxis], idx2[:, np.newaxis, :]])
+    err  = relerr(G.dot(grid.ravel()), ref)
+    print('interpolation matrix %d X %d, %d nonzeros: error %g' % (G.shape[0], G.shape[1], G.nnz, err))
+    assert G.shape == (nsamples, nf1 * nf2) and G.nnz == nsamples * (2 * nspread) ** 2
+    assert err < 1e-13
+
+    #direct type 1 and type 2
+    Fk_ref = np.stack([nft.nudft2d1(x, y, c[:, i], ms, mt) for i in range(ncoils)], axis = -1)
+    k1, k2 = nft.nufftfreqs2d(ms, mt)
+    E      = np.exp(-1j * (np.outer(x, k1.ravel()) + np.outer(y, k2.ravel())))
+    c_ref  = E.dot(im.reshape((-1, ncoils)))
+
+    sp_opt = nfc.NUFFT2d(x, y, ms, mt, eps = 1e-12, backend = 'sparse')
+    nb_opt = nfc.NUFFT2d(x, y, ms, mt, eps = 1e-12, backend = 'numba')
+    Fk, cs = sp_opt.backward(c), sp_opt.forward(im)
+    err1   = relerr(Fk, Fk_ref)
+    err2   = relerr(cs, c_ref)
+    err3   = max(relerr(Fk, nb_opt.backward(c)), relerr(cs, nb_opt.forward(im)))
+    err4   = abs(np.vdot(cs, c) - nsamples * np.vdot(im, Fk)) / abs(np.vdot(cs, c))
+    print('sparse: type 1 error %g, type 2 error %g, against numba %g, adjointness %g' % (err1, err2, err3, err4))
+    assert err1 < 1e-6 and err2 < 1e-6 and err3 < 1e-12 and err4 < 1e-12
+
+    #coils one by one
+    for i in range(ncoils):
+        assert relerr(sp_opt.backward(c[:, i]), Fk[..., i]) < 1e-13
+        assert relerr(sp_opt.forward(im[..., i]), cs[:, i]) < 1e-13
+
+    try:
+        nfc.NUFFT2d(x, y, ms, mt, backend = 'dense')
+    except ValueError as err:
+        print('backend = dense: %s' % err)
+    else:
+        raise AssertionError('unknown backend did not raise')
+
+if __name__ == "__main__":
+    test()
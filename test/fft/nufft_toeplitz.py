@@ -0,0 +1,39 @@
+"""
+checks of the toeplitz normal operator of the nufft plan, toeplitz = True in fft/nufft_class.py
+normal() is 1/nsamples * E^H W E im of the direct matrix E, W the density weights (or identity),
+up to the kernel error of the type 1 nufft that gives the point spread function,
+the same as backward(W * forward(im)) of the plan without toeplitz, for 2d, 3d and the coils together
+"""
+import numpy as np
+import fft.nufft_func as nft
+import fft.nufft_class as nfc
+
+def relerr( a, b ):
+    return np.linalg.norm(a - b) / np.linalg.norm(b)
+
+def test():
+    rng = np.random.RandomState(0)
+    for im_shape, nsamples, tol in (((32, 24), 2000, 1e-6), ((12, 10, 8), 1500, 1e-5)):
+        traj = [rng.uniform(-np.pi, np.pi, nsamples) for _ in im_shape]
+        im   = rng.randn(*(im_shape + (2,))) + 1j * rng.randn(*(im_shape + (2,)))
+        w    = rng.uniform(0.5, 1.5, nsamples)
+        if len(im_shape) == 2:
+            k = nft.nufftfreqs2d(*im_shape)
+        else:
+            k = nft.nufftfreqs3d(*im_shape)
+        E    = np.exp(-1j * sum(np.outer(t, kd.ravel()) for t, kd in zip(traj, k)))
+        imf  = im.reshape((-1, 2))
+        for weights in (None, w):
+            W    = np.ones(nsamples) if weights is None else weights
+            ref  = E.conj().T.dot(W[:, np.newaxis] * E.dot(imf)).reshape(im.shape) / nsamples
+            top  = nfc.NUFFTnd(traj, im_shape, eps = 1e-12, toeplitz = True, weights = weights)
+            grd  = nfc.NUFFTnd(traj, im_shape, eps = 1e-12, weights = weights)
+            err1 = relerr(top.normal(im), ref)
+            err2 = relerr(top.normal(im), grd.normal(im))
+            err3 = relerr(top.normal(im[..., 1]), ref[..., 1])
+            print('%dd, %s: toeplitz against E^H W E %g, against the gridding %g, one coil %g'\
+                  % (len(im_shape), 'weights' if weights is not None else 'no weights', err1, err2, err3))
+            assert err1 < tol and err2 < tol and err3 < tol
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,62 @@
+"""
+checks of the truncated svd low_rank/svd_func.py against np.linalg.svd
+a complex 400 x 120 matrix with singular values decaying from 1 to 1e-9,
+full, gram (for the leading part), arpack (array and scipy LinearOperator) and randomized (decaying spectrum)
+give the leading singular values and subspaces, randomized to ~1e-5,
+'auto' is gram for k <= n/2 and full above, and full when s[k-1] < gram_min_ratio*s[0]:
+the singular values below ~1e-7*s[0] from A^H A are wrong, the ones from 'auto' are exact,
+prox_nuclear_soft_thresh is the soft threshold of the singular values of the full svd
+"""
+import numpy as np
+import scipy.sparse.linalg
+import low_rank.svd_func as lr
+
+# relative error of s, and the largest sin of the angles between the leading k right subspaces
+def svd_err( s, Vh, s_ref, Vh_ref ):
+    k   = len(s)
+    err_s = np.max(np.abs(s - s_ref[:k]) / s_ref[:k])
+    cos = np.linalg.svd(Vh.dot(Vh_ref[:k].conj().T), compute_uv = False)
+    return err_s, np.sqrt(max(1.0 - np.min(cos) ** 2, 0.0))
+
+def test():
+    m, n = 400, 120
+    rng  = np.random.RandomState(0)
+    Q1   = np.linalg.qr(rng.randn(m, n) + 1j * rng.randn(m, n))[0]
+    Q2   = np.linalg.qr(rng.randn(n, n) + 1j * rng.randn(n, n))[0]
+    s0   = np.logspace(0, -9, n)
+    A    = (Q1 * s0).dot(Q2.conj().T)
+    U_ref, s_ref, Vh_ref = np.linalg.svd(A, full_matrices = False)
+
+    k = 10
+    for method, B, tol in (('full', A, 1e-6), ('gram', A, 1e-6), ('arpack', A, 1e-6), ('randomized', A, 1e-4),\
+                           ('arpack', scipy.sparse.linalg.aslinearoperator(A), 1e-6), ('auto', A, 1e-6)):
+        U, s, Vh = lr.low_rank_svd(B, k, method, n_iter = 4)
+        err_s, err_v = svd_err(s, Vh, s_ref, Vh_ref)
+        err_a = np.linalg.norm((U * s).dot(Vh) - (U_ref[:, :k] * s_ref[:k]).dot(Vh_ref[:k])) / np.linalg.norm(s_ref[:k])
+        print('%s %s, k = %d: singular value error %g, subspace error %g, rank k approximation error %g'\
+              % (method, type(B).__name__, k, err_s, err_v, err_a))
+        assert err_s < tol and err_v < tol and err_a < tol
+
+    #'auto' selection on k/n and on the conditioning
+    assert lr.select_method(A.shape, n // 2) == 'gram' and lr.select_method(A.shape, n // 2 + 1) == 'full'
+    k = 100 #s[k-1] ~ 3e-8 < gram_min_ratio
+    s_gram = lr.low_rank_svd(A, k, 'gram')[1]
+    s_auto = lr.low_rank_svd(A, k, 'auto')[1]
+    err_gram = np.max(np.abs(s_gram - s_ref[:k]) / s_ref[:k])
+    err_auto = np.max(np.abs(s_auto - s_ref[:k]) / s_ref[:k])
+    print('k = %d, s[k-1] = %g: gram singular value error %g, auto %g' % (k, s_ref[k-1], err_gram, err_auto))
+    assert err_gram > 1e-3 and err_auto < 1e-8
+    k = 110 #k > n/2, full
+    s_auto = lr.low_rank_svd(A, k, 'auto')[1]
+    assert np.max(np.abs(s_auto - s_ref[:k]) / s_ref[:k]) < 1e-8
+
+    #nuclear norm prox
+    th  = 1e-2
+    X   = lr.prox_nuclear_soft_thresh(A, th)
+    X_ref = (U_ref * np.maximum(s_ref - th, 0.0)).dot(Vh_ref)
+    err = np.linalg.norm(X - X_ref) / np.linalg.norm(X_ref)
+    print('prox_nuclear_soft_thresh error %g' % err)
+    assert err < 1e-10
+
+if __name__ == "__main__":
+    test()
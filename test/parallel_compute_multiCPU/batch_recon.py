@@ -0,0 +1,89 @@
+"""
+checks of utilities/parallel_func.batch_recon
+the pool gives the images of the serial loop over slices the recon scripts used (IST_2 of FFT2d_kmask
+on each slice), for slices along the last and the first axis, with args and kwargs, in processes = 1 too,
+out_shape/out_axis stack an output of another shape (a coil combination) where asked,
+the input k-space is not changed,
+inside the workers worker_threads(), the BLAS env variables and numba.get_num_threads() are the threads
+asked for, outside batch_recon worker_threads() is cpu_count(),
+a child process runs a numba kernel, then batch_recon with a lambda (fork) and with a module level function
+after the kernel, and exits (a fork after the tbb threads started hangs the exit, batch_recon uses forkserver then)
+"""
+import numpy as np
+import os
+import sys
+import subprocess
+import multiprocessing
+import numba
+import pics.operators_class as opts
+import pics.CS_MRI_solvers_func as solvers
+import pics.proximal_func as pf
+from utilities.parallel_func import batch_recon, worker_threads
+
+def recon_slice( ksp, mask, Nite = 10, th = 0.01 ):
+    Aopt = opts.FFT2d_kmask(mask)
+    return solvers.IST_2(Aopt.forward, Aopt.backward, ksp, Nite, 1.0, th)
+
+def sum_of_squares( ksp ):
+    return np.sqrt(np.sum(np.abs(ksp) ** 2, axis = 2))
+
+def identity( ksp ):
+    return ksp
+
+def thread_state( ksp ):
+    return np.array([worker_threads(), int(os.environ['OMP_NUM_THREADS']), numba.get_num_threads()])
+
+def test_exit():
+    ksp = np.ones((4, 4, 3), np.complex128)
+    assert np.array_equal(batch_recon(lambda k: 2 * k, ksp, processes = 2), 2 * ksp)
+    opts.FFT2d_kmask(np.ones((4, 4))).forward(ksp[:, :, 0])
+    pf.prox_l1_soft_thresh2(ksp, 0.1)
+    assert np.array_equal(batch_recon(identity, ksp, processes = 2), ksp)
+    print('%s threading layer' % numba.threading_layer())
+
+def test():
+    rng   = np.random.RandomState(0)
+    mask  = (rng.rand(32, 24) > 0.5).astype(np.float64)
+    Aopt  = opts.FFT2d_kmask(mask)
+    nsl   = 5
+    ksp   = np.stack([Aopt.forward(rng.randn(32, 24) + 1j * rng.randn(32, 24)) for i in range(nsl)], axis = 2)
+    ksp0  = ksp.copy()
+    ref   = np.stack([recon_slice(ksp[:, :, i], mask, Nite = 12) for i in range(nsl)], axis = 2)
+    for processes in (1, 3):
+        im = batch_recon(recon_slice, ksp, axis = 2, args = (mask,), kwargs = dict(Nite = 12), processes = processes)
+        print('processes %d: error %g to the serial loop' % (processes, np.max(np.abs(im - ref))))
+        assert im.shape == ref.shape and im.dtype == np.complex128 and np.array_equal(im, ref)
+    assert np.array_equal(ksp, ksp0)
+
+    #slices along the first axis, default out_axis
+    kspt = np.ascontiguousarray(np.moveaxis(ksp, 2, 0))
+    im   = batch_recon(recon_slice, kspt, axis = 0, args = (mask,), kwargs = dict(Nite = 12), processes = 2)
+    assert np.array_equal(im, np.moveaxis(ref, 2, 0))
+
+    #coils on axis 2, slices on axis 3, sum of squares in 2d stacked on the last axis
+    kspc = rng.randn(16, 12, 4, nsl) + 1j * rng.randn(16, 12, 4, nsl)
+    im   = batch_recon(sum_of_squares, kspc, axis = 3, out_shape = (16, 12), out_dtype = np.float64, out_axis = 2, processes = 2)
+    assert im.shape == (16, 12, nsl) and im.dtype == np.float64
+    assert np.allclose(im, np.sqrt(np.sum(np.abs(kspc) ** 2, axis = 2)), rtol = 1e-14)
+
+    #threads pinned in the workers, complex64 k-space keeps its precision
+    for threads in (1, 2):
+        st = batch_recon(thread_state, ksp.astype(np.complex64), axis = 2, out_shape = (3,), out_dtype = np.int64,\
+                         out_axis = 1, processes = 2, threads = threads)
+        print('threads %d: worker_threads, OMP_NUM_THREADS, numba threads %s' % (threads, st[:, 0]))
+        assert np.all(st[0] == threads) and np.all(st[1] == threads)
+        assert np.all(st[2] == min(threads, numba.config.NUMBA_NUM_THREADS))
+    assert batch_recon(identity, ksp.astype(np.complex64), processes = 2).dtype == np.complex64
+    assert worker_threads() == multiprocessing.cpu_count()
+
+    child = subprocess.Popen([sys.executable, '-c', 'import test.parallel_compute_multiCPU.batch_recon as t; t.test_exit()'])
+    try:
+        res = child.wait(timeout = 300)
+    except subprocess.TimeoutExpired:
+        child.kill()
+        res = -1
+    print('child process exit code %d' % res)
+    assert res == 0
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,168 @@
+import numpy as np
+import os
+import sys
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+"""
+batch driver for independent recons, e.g. the slices of a multi-slice 2D exam, time frames or contrasts,
+func(ksp_i, *args, **kwargs) reconstructs one slice of the k-space ksp taken along axis,
+the slices are distributed over a process pool
+
+the input k-space and the output images are in shared memory (multiprocessing RawArray),
+the workers read their slice and write the image in place, so only the slice index is pickled,
+not the arrays, the pool uses fork where it is available so func can also be a local function or lambda,
+except after a numba parallel kernel ran on the tbb threading layer in this process, a fork then leaves
+this process hanging at exit, and the pool uses forkserver, func must be importable (a module level function)
+
+each worker pins the BLAS/OpenMP threads (OMP/MKL/OPENBLAS env variables, and threadpoolctl if installed)
+and the numba prange kernels (numba.set_num_threads, numba is imported before the fork so its env variable
+is already read) to threads, to prevent processes*threads oversubscribing the cpus,
+the fftw operators (fftw_func) take threads explicitly, worker_threads() returns this number inside func,
+e.g. FFTW2d_kmask(mask, threads = worker_threads())
+
+usage:
+def recon_slice( ksp, mask ):
+    Aopt = opts.FFTW2d_kmask(mask, threads = worker_threads())
+    return solvers.ADMM_l2Afxnb_tvx(Aopt.forward, Aopt.adjoint, ksp, 20, 1.0, 0.01, 1.0)
+im = batch_recon(recon_slice, ksp, axis = 2, args = (mask,), processes = 8)  #ksp is nx, ny, nslice
+"""
+_thread_envs   = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',\
+                  'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS')
+_worker        = {} #shared arrays, func and its arguments of this worker process
+_num_threads   = None
+_thread_limits = None
+
+# limit the BLAS/OpenMP/numba threads of this process to n
+# the env variables only apply to libraries loaded after this call, threadpoolctl also limits loaded ones,
+# a loaded numba is limited by numba.set_num_threads (up to the NUMBA_NUM_THREADS it was loaded with),
+# NUMBA_NUM_THREADS is only set before numba is imported, numba raises on a change after its threads started
+def set_num_threads( n ):
+    global _num_threads, _thread_limits
+    _num_threads = n
+    for env in _thread_envs:
+        os.environ[env] = str(n)
+    try:
+        from threadpoolctl import threadpool_limits
+        _thread_limits = threadpool_limits(limits = n)
+    except ImportError:
+        pass
+    if 'numba' not in sys.modules:
+        os.environ['NUMBA_NUM_THREADS'] = str(n)
+        return
+    import numba
+    numba.set_num_threads(min(n, numba.config.NUMBA_NUM_THREADS))
+
+# True if the numba parallel kernels can be launched from several python threads at once (tbb, omp),
+# the workqueue layer, used when neither tbb nor OpenMP is installed, aborts the process on a concurrent launch,
+# numba chooses the layer on the first parallel launch, so a small kernel is launched if none has run yet
+_numba_probe = []
+def numba_threadsafe():
+    import numba
+    try:
+        layer = numba.threading_layer()
+    except ValueError:
+        if not _numba_probe:
+            @numba.jit(nopython=True, parallel=True)
+            def probe( x ):
+                for i in numba.prange(x.shape[0]):
+                    x[i] = i
+                return x
+            _numba_probe.append(probe)
+        _numba_probe[0](np.zeros(2))
+        layer = numba.threading_layer()
+    return layer != 'workqueue'
+
+# True if numba started its tbb threads in this process, forking it afterwards hangs its exit
+def _tbb_started():
+    if 'numba' not in sys.modules:
+        return False
+    import numba
+    try:
+        return numba.threading_layer() == 'tbb'
+    except ValueError:
+        return False
+
+# threads available to func in this worker, all cpus outside batch_recon
+def worker_threads():
+    if _num_threads is None:
+        return multiprocessing.cpu_count()
+    return _num_threads
+
+# shared memory array and its numpy view
+def shared_array( shape, dtype ):
+    dtype = np.dtype(dtype)
+    raw   = RawArray('b', int(np.prod(shape)) * dtype.itemsize)
+    return raw, as_array(raw, shape, dtype)
+
+def as_array( raw, shape, dtype ):
+    return np.frombuffer(raw, dtype = dtype).reshape(shape)
+
+# index of slice i along axis
+def _slice( ndim, axis, i ):
+    idx = [slice(None)] * ndim
+    idx[axis] = i
+    return tuple(idx)
+
+def _init_worker( ksp_raw, ksp_shape, ksp_dtype, out_raw, out_shape, out_dtype, axis, out_axis,\
+                  func, args, kwargs, threads ):
+    set_num_threads(threads)
+    _worker['ksp']  = as_array(ksp_raw, ksp_shape, ksp_dtype)
+    _worker['out']  = as_array(out_raw, out_shape, out_dtype)
+    _worker['axis'], _worker['out_axis'] = axis, out_axis
+    _worker['func'], _worker['args'], _worker['kwargs'] = func, args, kwargs
+
+def _run_worker( i ):
+    w   = _worker
+    ksp = w['ksp']
+    out = w['out']
+    out[_slice(out.ndim, w['out_axis'], i)] = w['func'](ksp[_slice(ksp.ndim, w['axis'], i)], *w['args'], **w['kwargs'])
+    return i
+
+"""
+reconstruct the slices of ksp along axis with func, in a pool of processes, each using threads threads
+out_shape is the image shape of one slice, the k-space slice shape if None (Cartesian recon),
+out_dtype is complex in the precision of ksp if None,
+the images are stacked along out_axis, axis (counted in the output dimensions) if None,
+processes = None uses cpu_count()//threads, processes = 1 runs the slices in this process
+"""
+def batch_recon( func, ksp, axis = -1, args = (), kwargs = None, out_shape = None, out_dtype = None,\
+                 out_axis = None, processes = None, threads = 1 ):
+    if kwargs is None:
+        kwargs = {}
+    axis   = axis % ksp.ndim
+    nslice = ksp.shape[axis]
+    if out_shape is None:
+        out_shape = ksp.shape[:axis] + ksp.shape[axis+1:]
+    if out_dtype is None:
+        out_dtype = np.result_type(ksp.dtype, np.complex64)
+    if out_axis is None:
+        out_axis = min(axis, len(out_shape))
+    shape = tuple(out_shape[:out_axis]) + (nslice,) + tuple(out_shape[out_axis:])
+    if processes is None:
+        processes = max(1, multiprocessing.cpu_count() // threads)
+    processes = min(processes, nslice)
+    if processes <= 1:
+        out = np.empty(shape, dtype = out_dtype)
+        for i in range(nslice):
+            out[_slice(out.ndim, out_axis, i)] = func(ksp[_slice(ksp.ndim, axis, i)], *args, **kwargs)
+        return out
+    ksp_raw, ksp_shared = shared_array(ksp.shape, ksp.dtype)
+    ksp_shared[...] = ksp
+    out_raw, out = shared_array(shape, out_dtype)
+    methods = multiprocessing.get_all_start_methods()
+    if 'fork' in methods and not _tbb_started():
+        ctx = multiprocessing.get_context('fork')
+    elif 'forkserver' in methods:
+        ctx = multiprocessing.get_context('forkserver')
+    else:
+        ctx = multiprocessing.get_context()
+    initargs = (ksp_raw, ksp.shape, ksp.dtype, out_raw, shape, np.dtype(out_dtype), axis, out_axis,\
+                func, args, kwargs, threads)
+    pool = ctx.Pool(processes, initializer = _init_worker, initargs = initargs)
+    try:
+        #one slice per task, the recon time of a slice is much longer than the dispatch
+        pool.map(_run_worker, range(nslice), chunksize = 1)
+    finally:
+        pool.close()
+        pool.join()
+    return out
@@ -24,4 +24,66 @@ class timing():
 
     def display( self, str='' ):
         print( str + 'Executime time: %g sec' % self.time) 
-        return self
\ No newline at end of file
+        return self
+
+"""
+per-iteration telemetry of the iterative solvers, pass an instance as telemetry = tel, None disables it
+and the solvers then do no extra work (no norms, no timers)
+the solver wraps its forward/backward operators and proximal functions with timed(), the wall time of each
+phase is accumulated and saved by record(), which the solver calls once per iteration with values such as
+residual and step, objective is given as a function and only evaluated if objective = True
+(it usually costs an extra transform), callback is called with each record, e.g. for logging
+
+usage:
+tel = telemetry()
+x = solvers.IST_3(Afunc, invAfunc, Tfunc, invTfunc, b, Nite, step, th, telemetry = tel)
+tel.summary()
+tel.get('residual')
+"""
+class telemetry():
+    def __init__( self, callback = None, objective = False ):
+        self.records    = [] #one dict per iteration
+        self.callback   = callback
+        self.objective  = objective
+        self.phase_time = {}
+        self.t0         = time()
+
+    # func with its wall time added to phase
+    def timed( self, phase, func ):
+        def timed_func( *args, **kwargs ):
+            t = time()
+            res = func(*args, **kwargs)
+            self.phase_time[phase] = self.phase_time.get(phase, 0.0) + time() - t
+            return res
+        timed_func.__wrapped__ = func
+        return timed_func
+
+    # save iteration, wall time since start, phase times since the last record, and values
+    def record( self, iteration, objective = None, **values ):
+        rec = {'iteration': iteration, 'time': time() - self.t0}
+        for phase in self.phase_time:
+            rec[phase + '_time'] = self.phase_time[phase]
+        self.phase_time = {}
+        if objective is not None and self.objective:
+            rec['objective'] = objective()
+        rec.update(values)
+        self.records.append(rec)
+        if self.callback is not None:
+            self.callback(rec)
+        return rec
+
+    def get( self, key ):
+        return [rec.get(key) for rec in self.records]
+
+    # total time in each phase
+    def summary( self, display = True ):
+        total = {}
+        for rec in self.records:
+            for key in rec:
+                if key.endswith('_time'):
+                    total[key] = total.get(key, 0.0) + rec[key]
+        if display:
+            print('%d iterations in %g sec' % (len(self.records), self.records[-1]['time'] if self.records else 0.0))
+            for key in sorted(total):
+                print('    %s %g sec' % (key[:-5], total[key]))
+        return total
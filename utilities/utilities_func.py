@@ -335,6 +335,14 @@ def pad2d( data, nx, ny ):
     ndata[np.ix_(map(int,cxr),map(int,cyr))] = data
     return ndata
 
+"""
+zero pad the k-space in the leading len(shape) dimentions to shape, centered as pad2d and pad3d
+"""
+def padnd( data, shape ):
+    ndata = np.zeros(tuple(shape) + data.shape[len(shape):], dtype = data.dtype)
+    ndata[tuple(slice(n//2 - d//2, n//2 - d//2 + d) for d, n in zip(data.shape, shape))] = data
+    return ndata
+
 """
 return the scaling of data (ksp), computed as the max in image space
 """
@@ -362,3 +370,13 @@ def dim_match( A_shape ,B_shape ):
         for _ in range(len(B_shape),len(A_shape)):
             B_out_shape += (1,)
     return  A_out_shape, B_out_shape
+
+"""
+complex dtype with the same precision as the input dtype,
+complex64 for float32/complex64 data, complex128 otherwise,
+this is used to keep the single precision path single precision through the operators
+"""
+def complex_dtype( dtype ):
+    if np.dtype(dtype) in (np.dtype(np.float32), np.dtype(np.complex64)):
+        return np.dtype(np.complex64)
+    return np.dtype(np.complex128)